@@ -13,6 +13,7 @@ from time import sleep
 from bs4 import BeautifulSoup
 import requests
 
+import fetch_cache
 from download_tracker import is_downloaded, mark_downloaded
 
 # Fix Unicode print on Windows console
@@ -95,6 +96,11 @@ Do NOT type < > or [ ] - they are placeholders. Use real values:
     print(h.strip())
 
 
+def story_date():
+    """Date folder to download into: SNAPSCRAP_DATE (set by daily_automation.py for its run) or today."""
+    return os.environ.get("SNAPSCRAP_DATE") or date.today().strftime("%Y-%m-%d")
+
+
 def user_input():
     """Get username from argument or user input."""
     args = [a for a in sys.argv[1:] if a not in ("--merge", "--en")]
@@ -113,7 +119,7 @@ def user_input():
     else:
         path = os.path.join("stories", username)
         
-    date_str = date.today().strftime("%Y-%m-%d")
+    date_str = story_date()
     date_folder = os.path.join(path, date_str)
 
     if os.path.exists(path):
@@ -139,7 +145,13 @@ print(mix)
 
 
 def get_json():
-	"""Get json from the website"""
+	"""Get json from the website (shared with other users' runs for the same account)"""
+
+	return fetch_cache.profile_json(username, fetch_json)
+
+
+def fetch_json():
+	"""Fetch and parse the profile page"""
 
 	r = requests.get(mix, headers=headers)
 
@@ -153,7 +165,7 @@ def get_json():
 	return data
 
 
-def profile_metadata(json_dict=get_json()):
+def profile_metadata(json_dict):
 	"""Detect public profile, then print bio and bitmoji"""
 	# if public
 	try:
@@ -177,10 +189,10 @@ def profile_metadata(json_dict=get_json()):
 	print(f"Getting posts of: {username}\n")
 
 
-def download_media(json_dict=get_json()):
+def download_media(json_dict):
 	"""Print media URLs and download media."""
 
-	date_str = date.today().strftime("%Y-%m-%d")
+	date_str = story_date()
 	skipped = 0
 	downloaded = 0
 
@@ -199,17 +211,27 @@ def download_media(json_dict=get_json()):
 				skipped += 1
 				continue
 
-			# Download media
-			r = requests.get(file_url, stream=True, headers=headers)
-
-			if "image" in r.headers['Content-Type']:
-				ext = ".jpeg"
-			elif "video" in r.headers['Content-Type']:
-				ext = ".mp4"
-			else:
-				ext = ".bin"
+			# Download media once for all users tracking this account, then link it here
+			snap_id = i.get("snapId")
+			story_key = f"{username}|{snap_id.get('value') if isinstance(snap_id, dict) else file_url}"
+
+			def download():
+				r = requests.get(file_url, stream=True, headers=headers)
+				content_type = r.headers.get('Content-Type', '')
+				if "image" in content_type:
+					ext = ".jpeg"
+				elif "video" in content_type:
+					ext = ".mp4"
+				else:
+					ext = ".bin"
+				return r, ext
+
+			shared_path, fetched = fetch_cache.media_file(story_key, download)
+			if not shared_path:
+				print("Cannot make connection to download media!")
+				continue
 
-			file_name = f"{num}{ext}"
+			file_name = f"{num}{os.path.splitext(shared_path)[1]}"
 			
 			#  Check if this file / file_name exists locally
 			if os.path.isfile(file_name):
@@ -220,16 +242,12 @@ def download_media(json_dict=get_json()):
 			print(file_name)
 
 			#  Sleep a bit
-			sleep(0.3)
+			if fetched:
+				sleep(0.3)
 
-			if r.status_code == 200:
-				with open(file_name, 'wb') as f:
-					for chunk in r:
-						f.write(chunk)
-				mark_downloaded(username, date_str, file_url, file_name)
-				downloaded += 1
-			else:
-				print("Cannot make connection to download media!")
+			fetch_cache.link_into(shared_path, file_name)
+			mark_downloaded(username, date_str, file_url, file_name)
+			downloaded += 1
 
 	except KeyError:
 		print(f"{RED}No user stories found for the last 24h.")
@@ -248,13 +266,15 @@ def main():
 	start = time.perf_counter()
 	do_merge = "--merge" in sys.argv
 
-	profile_metadata()
-	download_media()
+	fetch_cache.prune()
+	json_dict = get_json()  # one profile fetch for both steps
+	profile_metadata(json_dict)
+	download_media(json_dict)
 
 	if do_merge:
 		script_dir = os.path.dirname(os.path.abspath(__file__))
 		merge_script = os.path.join(script_dir, "merge_videos.py")
-		date_str = date.today().strftime("%Y-%m-%d")
+		date_str = story_date()
 		merge_msg = f"\n{YELLOW}Merging videos (date: {date_str})..." if USE_EN else f"\n{YELLOW}دمج كل 6 فيديوهات (تاريخ اليوم: {date_str})..."
 		print(merge_msg)
 		env = os.environ.copy()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the YouTube upload path against the local fake API (webapp/fake_youtube.py).
+Measures upload throughput, retries and client-secret fallback under configurable failure rates.
+
+Runs in a throwaway folder: no real Google credentials, no files touched in the project.
+Example: python bench_upload.py --videos 20 --size-mb 8 --secrets 3 --quota-per-client 8000 --error-rate 0.02
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USER_ID = "bench"
+BENCH_CHANNEL_ID = "UCbenchmark000000000000"
+BENCH_USERNAME = "bench_account"
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def prepare_sandbox(root, api_url, videos, size_mb, secrets):
+    """Create client secrets, expired tokens (forcing a refresh) and merged videos."""
+    from webapp import youtube_service
+
+    expired = (datetime.utcnow() - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    secret_paths = []
+    for n in range(1, secrets + 1):
+        path = root / f"client_secret_{n}.json"
+        _write_json(path, {"installed": {
+            "client_id": f"bench-client-{n}", "client_secret": "x",
+            "auth_uri": f"{api_url}/auth", "token_uri": f"{api_url}/token",
+        }})
+        secret_paths.append(path)
+
+    def token(client_id):
+        return {"token": "expired", "refresh_token": f"refresh-{client_id}", "token_uri": f"{api_url}/token",
+                "client_id": client_id, "client_secret": "x", "scopes": youtube_service.SCOPES, "expiry": expired}
+
+    for path in secret_paths:
+        client_id = f"bench-client-{path.stem.rsplit('_', 1)[-1]}"
+        _write_json(youtube_service._get_token_for_secret(BENCH_CHANNEL_ID, BENCH_USER_ID, path), token(client_id))
+    _write_json(youtube_service._token_path(BENCH_CHANNEL_ID, BENCH_USER_ID), token("bench-client-1"))
+
+    date_str = date.today().strftime("%Y-%m-%d")
+    merged = youtube_service.get_user_dir(BENCH_USER_ID) / BENCH_USERNAME / date_str / youtube_service.MERGED_DIR
+    merged.mkdir(parents=True, exist_ok=True)
+    for n in range(1, videos + 1):
+        with open(merged / f"merged_{n}.mp4", "wb") as f:
+            f.write(os.urandom(int(size_mb * 1024 * 1024)))
+    return date_str
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YouTube uploads against the fake API")
+    parser.add_argument("--videos", type=int, default=10)
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--secrets", type=int, default=2, help="number of client_secret*.json files (fallback chain)")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="probability of 403 quotaExceeded per insert")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of 503 per API request")
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--quota-per-client", type=int, default=0, help="quota units per client secret (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3, help="SNAPSCRAP_UPLOAD_RETRIES")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["SNAPSCRAP_USER_ID"] = BENCH_USER_ID
+    os.environ["SNAPSCRAP_UPLOAD_RETRIES"] = str(args.retries)
+
+    from webapp import youtube_service
+    from webapp.fake_youtube import start_server
+
+    server, api_url = start_server(
+        quota_error_rate=args.quota_rate, server_error_rate=args.error_rate, latency_ms=args.latency_ms,
+        quota_per_client=args.quota_per_client, seed=args.seed,
+    )
+    os.environ["SNAPSCRAP_YOUTUBE_API_URL"] = api_url
+    youtube_service.UPLOAD_NUM_RETRIES = args.retries
+
+    with tempfile.TemporaryDirectory(prefix="snapscrap_bench_") as tmp:
+        # Every path in youtube_service derives from BASE_DIR, so this keeps the run out of the project.
+        youtube_service.BASE_DIR = Path(tmp)
+        date_str = prepare_sandbox(Path(tmp), api_url, args.videos, args.size_mb, args.secrets)
+
+        print(f"Fake API: {api_url}")
+        print(f"Uploading {args.videos} x {args.size_mb} MB with {args.secrets} client secret(s)...")
+        start = time.perf_counter()
+        with youtube_service.user_context(BENCH_USER_ID):
+            result = youtube_service.upload_from_folder(BENCH_USERNAME, date_str, "private", upload_type="shorts", channel_id=BENCH_CHANNEL_ID)
+        elapsed = time.perf_counter() - start
+
+    stats = server.state.snapshot()
+    server.shutdown()
+
+    uploaded = result.get("count", 0)
+    mb = uploaded * args.size_mb
+    print("\nResult:", json.dumps(result, ensure_ascii=False))
+    print(f"Elapsed:            {elapsed:.2f}s")
+    print(f"Videos uploaded:    {uploaded}/{args.videos}")
+    print(f"Throughput:         {mb / elapsed if elapsed else 0:.2f} MB/s, {uploaded / elapsed if elapsed else 0:.2f} videos/s")
+    print(f"Upload sessions:    {stats['upload_sessions']} (chunks: {stats['upload_chunks']})")
+    print(f"Injected 5xx:       {stats['injected_server_errors']} (resumed uploads: {stats['resume_queries']})")
+    print(f"Injected 403 quota: {stats['injected_quota_errors']}")
+    print(f"Token refreshes:    {stats['token_refreshes']}")
+    print(f"Uploads by secret:  {json.dumps(stats['uploads_by_client'])}")
+    print(f"Quota used:         {json.dumps(stats['quota_used'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+مخزن الوسائط المشترك: كل ملف يُحفظ مرة واحدة باسم بصمته (SHA-256) وتُربط به مجلدات المستخدمين.
+Content-addressed media store shared by all tenants.
+
+Story media lives once in stories/_shared/blobs/<ab>/<sha256><ext>; tenant folders get
+hard links to it. The link count of a blob is its reference count: 1 means only the
+store itself still has it, and gc() deletes it. When hard links are not possible
+(different filesystem, FAT), tenants get a plain copy instead.
+
+    python blob_store.py gc       # delete blobs no tenant references
+    python blob_store.py adopt    # move existing tenant files into the store
+    python blob_store.py stats
+"""
+import hashlib
+import os
+import shutil
+import sys
+import time
+
+from webapp.file_lock import claim_turn
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORIES_DIR = os.path.join(BASE_DIR, "stories")
+BLOB_DIR = os.path.join(STORIES_DIR, "_shared", "blobs")
+# Blobs younger than this are never collected: the writer may not have linked them yet
+GC_GRACE_SECONDS = int(os.environ.get("SNAPSCRAP_BLOB_GC_GRACE", "3600"))
+GC_EVERY_SECONDS = int(os.environ.get("SNAPSCRAP_BLOB_GC_EVERY", "3600"))
+GC_STAMP = os.path.join(BLOB_DIR, ".last_gc")
+ADOPT_EXTENSIONS = (".mp4", ".jpeg", ".jpg", ".png", ".bin")
+CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(digest, ext):
+    return os.path.join(BLOB_DIR, digest[:2], digest + ext)
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _commit(tmp_path, digest, ext):
+    """Give a fully written temp file its content name (or drop it if the blob exists)."""
+    path = blob_path(digest, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+        os.utime(path)  # about to be linked again: keep gc() off it for the grace period
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+
+def put_stream(chunks, ext):
+    """Store the bytes of an iterable, hashing while writing. Returns the blob path."""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = os.path.join(BLOB_DIR, f".incoming.{os.getpid()}.{time.time_ns()}.tmp")
+    h = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    h.update(chunk)
+                    f.write(chunk)
+        return _commit(tmp_path, h.hexdigest(), ext)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def link(blob, dest):
+    """Make dest refer to blob: a hard link, or a copy when linking isn't possible."""
+    try:
+        os.link(blob, dest)
+    except OSError:
+        shutil.copy2(blob, dest)
+
+
+def adopt(path):
+    """Replace an existing tenant file by a hard link into the store. Returns bytes saved."""
+    try:
+        if os.stat(path).st_nlink > 1:
+            return 0  # already linked
+    except OSError:
+        return 0
+    digest = _hash_file(path)
+    ext = os.path.splitext(path)[1].lower()
+    blob = blob_path(digest, ext)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    if not os.path.exists(blob):
+        try:
+            os.link(path, blob)
+        except OSError:
+            return 0  # store on another filesystem; leave the file alone
+        return 0
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.link(blob, tmp_path)
+    except OSError:
+        return 0
+    size = os.path.getsize(path)
+    os.replace(tmp_path, path)
+    return size
+
+
+def adopt_all():
+    """Adopt every story file under stories/<uid>/<account>/<date>/. Returns (files, bytes saved)."""
+    files = saved = 0
+    for root, dirs, names in os.walk(STORIES_DIR):
+        if os.path.abspath(root) == os.path.abspath(STORIES_DIR):
+            dirs[:] = [d for d in dirs if d not in ("_shared", "tokens")]
+        dirs[:] = [d for d in dirs if d != "merged"]  # merge outputs are per tenant
+        for name in names:
+            if name.lower().endswith(ADOPT_EXTENSIONS):
+                files += 1
+                saved += adopt(os.path.join(root, name))
+    return files, saved
+
+
+def _blobs():
+    if not os.path.isdir(BLOB_DIR):
+        return
+    for prefix in os.scandir(BLOB_DIR):
+        if prefix.is_dir():
+            for entry in os.scandir(prefix.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    yield entry
+
+
+def gc(grace=None):
+    """Delete blobs that only the store links to. Returns (blobs deleted, bytes freed)."""
+    grace = GC_GRACE_SECONDS if grace is None else grace
+    now = time.time()
+    deleted = freed = 0
+    for entry in _blobs():
+        try:
+            st = entry.stat()
+            if st.st_nlink == 1 and now - st.st_mtime > grace:
+                os.unlink(entry.path)
+                deleted += 1
+                freed += st.st_size
+        except OSError:
+            pass
+    # Leftovers of writers that crashed mid-download
+    if os.path.isdir(BLOB_DIR):
+        for entry in os.scandir(BLOB_DIR):
+            try:
+                if entry.name.endswith(".tmp") and now - entry.stat().st_mtime > grace:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+    return deleted, freed
+
+
+def maybe_gc():
+    """gc() at most once per GC_EVERY_SECONDS across all processes."""
+    if claim_turn(GC_STAMP, GC_EVERY_SECONDS):
+        gc()
+
+
+def stats():
+    """(blobs, bytes stored, tenant references)."""
+    count = size = refs = 0
+    for entry in _blobs():
+        st = entry.stat()
+        count += 1
+        size += st.st_size
+        refs += st.st_nlink - 1
+    return count, size, refs
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "gc":
+        deleted, freed = gc()
+        print(f"Deleted {deleted} unreferenced blob(s), freed {freed / 1024 / 1024:.1f} MB")
+    elif command == "adopt":
+        files, saved = adopt_all()
+        print(f"Checked {files} file(s), saved {saved / 1024 / 1024:.1f} MB")
+    elif command == "stats":
+        count, size, refs = stats()
+        print(f"{count} blob(s), {size / 1024 / 1024:.1f} MB, {refs} tenant link(s)")
+    else:
+        sys.exit("Usage: python blob_store.py [gc|adopt|stats]")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,396 @@
 #!/usr/bin/env python3
 """
 أتمتة يومية: تحميل، دمج، ونشر على يوتيوب.
+Runs every user whose schedule is due (python daily_automation.py), or every enabled user with --all.
+
+Accounts flow through three stages connected by queues, each with its own worker limit,
+so one account downloads while another is encoded and a third is uploaded.
+
+Every run gets an ID and a checkpoint per (user, account, stage). If the process dies,
+the next start resumes the run, skipping finished stages:
+    python daily_automation.py --list              recent runs
+    python daily_automation.py --inspect RUN_ID    checkpoints of a run
+    python daily_automation.py --resume RUN_ID     redo unfinished / failed stages of a run
+A run still heartbeating in another process is not resumed. Stories of a past day are
+no longer on Snapchat, so a run resumed on a later day skips its unfinished downloads.
 """
+import argparse
 import os
-import sys
+import queue
+import shutil
 import subprocess
-from datetime import date, datetime
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+STAGES = ("download", "merge", "upload")
+DEFAULT_WORKERS = {
+    "download": int(os.environ.get("SNAPSCRAP_DOWNLOAD_WORKERS", "4")),
+    "merge": int(os.environ.get("SNAPSCRAP_MERGE_WORKERS", str(max(1, (os.cpu_count() or 2) // 4)))),
+    "upload": int(os.environ.get("SNAPSCRAP_UPLOAD_WORKERS", "2")),
+}
+
+DONE_STATUSES = ("done", "skipped")
+RUN_HEARTBEAT_SECONDS = 30
+RUN_STALE_SECONDS = 120  # a running run without heartbeat for this long was interrupted
+
+_print_lock = threading.Lock()
+
+
+def log(msg):
+    with _print_lock:
+        print(msg, flush=True)
+
+
+def run_script(script_dir, args, user_id, date_str=None):
+    """Run a project script for a user. Returns (ok, last output lines)."""
+    env = os.environ.copy()
+    env["SNAPSCRAP_USER_ID"] = str(user_id)
+    env["SNAPSCRAP_LANG"] = "en"
+    if date_str:
+        env["SNAPSCRAP_DATE"] = date_str  # SnapScrap.py downloads into the run's date folder
+    proc = subprocess.run([sys.executable, os.path.join(script_dir, args[0])] + args[1:], env=env, cwd=script_dir,
+                          capture_output=True, text=True, encoding="utf-8", errors="replace")
+    tail = "\n".join((proc.stdout + proc.stderr).strip().splitlines()[-3:])
+    return proc.returncode == 0, tail
+
+
+def create_run(items, date_str):
+    """Record a new run with a pending checkpoint for every stage of every account."""
+    from webapp.models import db, AutomationRun, RunCheckpoint
+    run_id = f"run_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{os.urandom(2).hex()}"
+    db.session.add(AutomationRun(id=run_id, date_str=date_str))
+    for item in items:
+        item["run_id"] = run_id
+        for stage in STAGES:
+            status = "skipped" if stage == "merge" and not item["merge"] else "pending"
+            db.session.add(RunCheckpoint(run_id=run_id, user_id=item["user_id"], username=item["username"],
+                                         stage=stage, status=status))
+    db.session.commit()
+    return run_id
+
+
+def load_run_items(run_id):
+    """Accounts of a run that still have work, each with the stage to start from."""
+    from webapp.models import db, AutomationRun, RunCheckpoint
+    run = db.session.get(AutomationRun, run_id)
+    if not run:
+        return None
+    stages = {}
+    for cp in RunCheckpoint.query.filter_by(run_id=run_id).order_by(RunCheckpoint.id):
+        stages.setdefault((cp.user_id, cp.username), {})[cp.stage] = cp.status
+    past_day = run.date_str < date.today().strftime("%Y-%m-%d")
+    items = []
+    for (user_id, username), status in stages.items():
+        # running = in flight when the process died; it is redone like pending and failed stages
+        start = next((stage for stage in STAGES if status.get(stage) not in DONE_STATUSES), None)
+        if not start:
+            continue
+        item = {"user_id": user_id, "username": username, "date": run.date_str, "run_id": run_id,
+                "merge": status.get("merge") != "skipped", "start": start}
+        if start == "download" and past_day:
+            # the stories of that day have expired; work with what was downloaded then
+            record_checkpoint(item, "download", "skipped", f"stories of {run.date_str} are no longer online")
+            item["start"] = "merge" if item["merge"] else "upload"
+        items.append(item)
+    return items
+
+
+def claim_for_resume(run_id):
+    """Take a run over for --resume, unless another process is still heartbeating it."""
+    from sqlalchemy import or_
+    from webapp.models import db, AutomationRun
+    now = datetime.utcnow()
+    claimed = AutomationRun.query.filter(
+        AutomationRun.id == run_id,
+        or_(AutomationRun.status != "running", AutomationRun.heartbeat_at.is_(None),
+            AutomationRun.heartbeat_at < now - timedelta(seconds=RUN_STALE_SECONDS)),
+    ).update({AutomationRun.status: "running", AutomationRun.heartbeat_at: now}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def take_over_stale_runs():
+    """IDs of interrupted runs this process now owns (claimed by moving their heartbeat)."""
+    from webapp.models import db, AutomationRun
+    now = datetime.utcnow()
+    stale = AutomationRun.query.filter(AutomationRun.status == "running",
+                                       AutomationRun.heartbeat_at < now - timedelta(seconds=RUN_STALE_SECONDS)).all()
+    owned = []
+    for run in stale:
+        claimed = AutomationRun.query.filter(AutomationRun.id == run.id, AutomationRun.heartbeat_at == run.heartbeat_at).update(
+            {AutomationRun.heartbeat_at: now}, synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            owned.append(run.id)
+    return owned
+
+
+def record_checkpoint(item, stage, status, detail=None, seconds=None):
+    from webapp.models import db, RunCheckpoint
+    RunCheckpoint.query.filter_by(run_id=item["run_id"], user_id=item["user_id"], username=item["username"],
+                                  stage=stage).update({"status": status, "detail": detail, "seconds": seconds})
+    db.session.commit()
+
+
+def set_runs_status(run_ids, status):
+    from webapp.models import db, AutomationRun
+    fields = {AutomationRun.status: status, AutomationRun.heartbeat_at: datetime.utcnow()}
+    if status == "done":
+        fields[AutomationRun.finished_at] = datetime.utcnow()
+    AutomationRun.query.filter(AutomationRun.id.in_(list(run_ids))).update(fields, synchronize_session=False)
+    db.session.commit()
+
+
+def list_runs(limit=20):
+    from webapp.models import AutomationRun
+    for run in AutomationRun.query.order_by(AutomationRun.started_at.desc()).limit(limit):
+        print(f"{run.id}  {run.status:<8} date {run.date_str}  started {run.started_at:%Y-%m-%d %H:%M}"
+              + (f"  finished {run.finished_at:%H:%M}" if run.finished_at else ""))
+
+
+def inspect_run(run_id):
+    from webapp.models import db, AutomationRun, RunCheckpoint
+    run = db.session.get(AutomationRun, run_id)
+    if not run:
+        print(f"Run not found: {run_id}")
+        return
+    print(f"{run.id}: {run.status}, date {run.date_str}, started {run.started_at}, last heartbeat {run.heartbeat_at}")
+    print(f"{'user':>6}  {'account':<24}{'stage':<10}{'status':<9}{'secs':>7}  detail")
+    for cp in RunCheckpoint.query.filter_by(run_id=run_id).order_by(RunCheckpoint.id):
+        detail = (cp.detail or "").replace("\n", " | ")[:80]
+        secs = f"{cp.seconds:.1f}" if cp.seconds is not None else "-"
+        print(f"{cp.user_id:>6}  {cp.username:<24}{cp.stage:<10}{cp.status:<9}{secs:>7}  {detail}")
+
+
+class Pipeline:
+    """download -> merge -> upload, each stage a pool of threads reading its own queue."""
+
+    def __init__(self, app, script_dir, workers=None):
+        self.app = app
+        self.script_dir = script_dir
+        self.workers = dict(DEFAULT_WORKERS, **(workers or {}))
+        self.queues = {stage: queue.Queue() for stage in STAGES}
+        self.timings = {stage: [] for stage in STAGES}
+        self.failures = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+
+    # Stage work: each returns (ok, detail)
+    def download(self, item):
+        return run_script(self.script_dir, ["SnapScrap.py", item["username"]], item["user_id"], item["date"])
+
+    def merge(self, item):
+        args = [item["username"], item["date"]]
+        ok, tail = run_script(self.script_dir, ["merge_videos.py"] + args, item["user_id"])
+        if ok:
+            ok, tail = run_script(self.script_dir, ["merge_videos.py"] + args + ["--all"], item["user_id"])
+        return ok, tail
+
+    def upload(self, item):
+        from webapp.youtube_service import upload_from_folder, user_context
+        # Assume auto upload if they had schedule enabled (could add a config for this)
+        with user_context(item["user_id"]):
+            result = upload_from_folder(item["username"], item["date"], "private")
+        if result.get("count"):
+            from webapp import user_stats
+            from webapp.models import db
+            user_stats.add(item["user_id"], uploads=result["count"])
+            db.session.commit()
+        if not result.get("success"):
+            return False, result.get("error", "Upload failed")
+        # Cleanup storage to prevent server from filling up
+        folder_path = os.path.join(self.script_dir, "stories", str(item["user_id"]), item["username"], item["date"])
+        if os.path.exists(folder_path):
+            shutil.rmtree(folder_path)
+        return True, f"{result.get('count', 0)} uploaded, {result.get('skipped', 0)} skipped; cleaned up {folder_path}"
+
+    def reindex(self, stage, item):
+        """Keep the library index in step with what the stage changed on disk."""
+        from webapp import library
+        if stage == "download":
+            library.refresh_account(item["user_id"], item["username"])
+        else:
+            library.refresh(item["user_id"], item["username"], item["date"])  # drops the entry once cleaned up
+
+    def next_stage(self, stage, item):
+        if stage == "download":
+            return "merge" if item["merge"] else "upload"
+        if stage == "merge":
+            return "upload"
+        return None
+
+    def _worker(self, stage):
+        with self.app.app_context():
+            while True:
+                item = self.queues[stage].get()
+                if item is None:
+                    return
+                label = f"user {item['user_id']} / {item['username']}"
+                if item.get("run_id"):
+                    record_checkpoint(item, stage, "running")
+                start = time.perf_counter()
+                try:
+                    ok, detail = getattr(self, stage)(item)
+                except Exception as e:
+                    ok, detail = False, str(e)
+                elapsed = time.perf_counter() - start
+                try:
+                    self.reindex(stage, item)
+                except Exception as e:
+                    log(f" [{stage}] {label}: library index not updated: {e}")
+                if item.get("run_id"):
+                    record_checkpoint(item, stage, "done" if ok else "failed", detail, elapsed)
+                with self._lock:
+                    self.timings[stage].append(elapsed)
+                    if not ok:
+                        self.failures[stage] += 1
+                log(f" [{stage}] {label}: {'OK' if ok else 'FAILED'} in {elapsed:.1f}s" + (f"\n    {detail}" if detail else ""))
+                following = self.next_stage(stage, item) if ok else None
+                if following:
+                    self.queues[following].put(item)
+
+    def run(self, items):
+        """Process all items; returns wall-clock seconds."""
+        start = time.perf_counter()
+        threads = {stage: [threading.Thread(target=self._worker, args=(stage,), daemon=True)
+                           for _ in range(max(1, self.workers[stage]))] for stage in STAGES}
+        for stage_threads in threads.values():
+            for t in stage_threads:
+                t.start()
+        run_ids = {item["run_id"] for item in items if item.get("run_id")}
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(run_ids, stop), daemon=True).start()
+        for item in items:
+            self.queues[item.get("start", "download")].put(item)
+        # Stop stages in order: a stage only gets its stop markers once everything upstream finished
+        for stage in STAGES:
+            for _ in threads[stage]:
+                self.queues[stage].put(None)
+            for t in threads[stage]:
+                t.join()
+        stop.set()
+        return time.perf_counter() - start
+
+    def _heartbeat(self, run_ids, stop):
+        while run_ids and not stop.wait(RUN_HEARTBEAT_SECONDS):
+            try:
+                with self.app.app_context():
+                    set_runs_status(run_ids, "running")
+            except Exception:
+                pass
+
+    def summary(self, wall):
+        lines = [f"{'stage':<10}{'workers':>8}{'items':>7}{'failed':>8}{'total s':>10}{'avg s':>8}{'max s':>8}"]
+        busy = 0.0
+        for stage in STAGES:
+            t = self.timings[stage]
+            busy += sum(t)
+            lines.append(f"{stage:<10}{self.workers[stage]:>8}{len(t):>7}{self.failures[stage]:>8}"
+                         f"{sum(t):>10.1f}{(sum(t) / len(t) if t else 0):>8.1f}{(max(t) if t else 0):>8.1f}")
+        lines.append(f"Wall time {wall:.1f}s for {busy:.1f}s of stage work ({busy / wall if wall else 0:.1f}x overlap)")
+        return "\n".join(lines)
+
+
+def due_items(run_all):
+    """Claim the due schedules and record them as a new run. Returns the run's items."""
+    from webapp.models import db, User, TrackedAccount, Schedule
+    from webapp.scheduler import claim_run
+    now = datetime.utcnow()
+    # All checked accounts of enabled schedules that are due, in one indexed query
+    query = (
+        db.session.query(User, Schedule, TrackedAccount.username)
+        .join(Schedule, Schedule.user_id == User.id)
+        .join(TrackedAccount, TrackedAccount.user_id == User.id)
+        .filter(Schedule.enabled.is_(True), TrackedAccount.checked.is_(True))
+    )
+    if not run_all:
+        query = query.filter(Schedule.next_run_at <= now)
+    rows = query.order_by(User.id, TrackedAccount.id).all()
+    if not rows:
+        print("No enabled schedules are due." if not run_all else "No enabled schedules found.")
+        return []
+
+    due = {}
+    for user, schedule, username in rows:
+        due.setdefault(user.id, (user, schedule, []))[2].append(username)
+
+    date_str = date.today().strftime("%Y-%m-%d")
+    items = []
+    for user, schedule, active in due.values():
+        # Same claim as the web scheduler, so a run is never done by both
+        if not run_all and not claim_run(schedule, now):
+            continue
+        print(f"User ID {user.id} ({user.username}) - {len(active)} accounts")
+        items.extend({"user_id": user.id, "username": username, "date": date_str, "merge": bool(schedule.merge)}
+                     for username in active)
+    if items:
+        run_id = create_run(items, date_str)
+        print(f"Run {run_id}: {len(items)} account(s)")
+    return items
+
 
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     sys.path.insert(0, script_dir)
 
+    parser = argparse.ArgumentParser(description="SnapScrap daily automation")
+    parser.add_argument("--all", action="store_true", help="run every enabled schedule, due or not")
+    parser.add_argument("--list", action="store_true", help="list recent runs")
+    parser.add_argument("--inspect", metavar="RUN_ID", help="show the checkpoints of a run")
+    parser.add_argument("--resume", metavar="RUN_ID", help="redo the unfinished and failed stages of a run")
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}-workers", type=int, default=DEFAULT_WORKERS[stage])
+    args = parser.parse_args()
+
     try:
-        from webapp.app import app, User, get_accounts, get_schedule
+        from webapp.app import app
+        from webapp.models import db, AutomationRun
     except ImportError as e:
         print("Failed to import Flask app:", e)
         sys.exit(1)
 
-    print(f"[{datetime.now()}] Starting SnapScrap SaaS Global Automation")
-
     with app.app_context():
-        users = User.query.all()
-        if not users:
-            print("No users found in database.")
+        if args.list:
+            list_runs()
+            return
+        if args.inspect:
+            inspect_run(args.inspect)
+            return
+        if args.resume:
+            if not claim_for_resume(args.resume):
+                run = db.session.get(AutomationRun, args.resume)
+                print(f"Run not found: {args.resume}" if not run else
+                      f"Run {args.resume} is still running in another process (last heartbeat {run.heartbeat_at:%H:%M:%S} UTC); "
+                      f"it can be resumed once that is {RUN_STALE_SECONDS}s old.")
+                return
+            items = load_run_items(args.resume)
+            run_ids = {args.resume}
+            print(f"Resuming {args.resume}: {len(items)} account(s) with unfinished stages")
+        else:
+            items = []
+            run_ids = set(take_over_stale_runs())
+            for run_id in run_ids:
+                resumed = load_run_items(run_id) or []
+                print(f"Resuming interrupted run {run_id}: {len(resumed)} account(s) with unfinished stages")
+                items.extend(resumed)
+            new_items = due_items(args.all)
+            run_ids.update(item["run_id"] for item in new_items)
+            items.extend(new_items)
+        if not items:
+            set_runs_status(run_ids, "done")
             return
 
-        for user in users:
-            schedule = get_schedule(user.id)
-            if not schedule or not schedule.get("enabled"):
-                continue
-
-            # In a real SaaS, we would check schedule['hour'] against current time.
-            # Simplified for cron trigger.
-            accounts = get_accounts(user.id)
-            active = [a["username"] for a in accounts if a.get("checked")]
-            if not active:
-                continue
-
-            print(f"\nProcessing User ID {user.id} ({user.username}) - {len(active)} accounts")
-            
-            env = os.environ.copy()
-            env["SNAPSCRAP_USER_ID"] = str(user.id)
-            env["SNAPSCRAP_LANG"] = "en"
-            
-            date_str = date.today().strftime("%Y-%m-%d")
-
-            for username in active:
-                print(f" -> Downloading: {username}")
-                subprocess.run([sys.executable, str(os.path.join(script_dir, "SnapScrap.py")), username], env=env, cwd=script_dir)
-                
-                if schedule.get("merge"):
-                    print(f" -> Merging: {username}")
-                    subprocess.run([sys.executable, str(os.path.join(script_dir, "merge_videos.py")), username, date_str], env=env, cwd=script_dir)
-                    subprocess.run([sys.executable, str(os.path.join(script_dir, "merge_videos.py")), username, date_str, "--all"], env=env, cwd=script_dir)
-                
-                # Assume auto upload if they had schedule enabled (could add a config for this)
-                print(f" -> Uploading: {username}")
-                try:
-                    from webapp.youtube_service import upload_from_folder
-                    os.environ["SNAPSCRAP_USER_ID"] = str(user.id)
-                    upload_from_folder(username, date_str, "private")
-                    
-                    # Cleanup storage to prevent server from filling up
-                    import shutil
-                    folder_path = os.path.join(script_dir, "stories", str(user.id), username, date_str)
-                    if os.path.exists(folder_path):
-                        shutil.rmtree(folder_path)
-                        print(f"    [OK] Cleaned up storage: {folder_path}")
-                except Exception as e:
-                    print(f"    Upload err: {e}")
-
+    print(f"[{datetime.now()}] Starting SnapScrap SaaS Global Automation")
+    workers = {stage: getattr(args, f"{stage}_workers") for stage in STAGES}
+    pipeline = Pipeline(app, script_dir, workers)
+    wall = pipeline.run(items)
+    with app.app_context():
+        set_runs_status(run_ids, "done")
+    print("\n" + pipeline.summary(wall))
+    print(f"Run(s): {', '.join(sorted(run_ids))}  (details: --inspect RUN_ID)")
     print(f"\n[{datetime.now()}] Global Automation Complete.")
 
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+"""
+ذاكرة مشتركة لطلبات سناب شات بين كل المستخدمين: جلب واحد للحساب وتنزيل واحد لكل ستوري.
+Shared fetch cache for SnapScrap runs of all tenants.
+
+Each SnapScrap.py process takes a file lock per profile / per story before fetching it,
+so concurrent runs for the same Snapchat account wait for the first one and then reuse
+its result. Results stay in stories/_shared for a while, so runs shortly after also skip
+the network. Media goes into the content-addressed blob store (blob_store.py); the
+per-story entry in stories/_shared/media and each tenant's file are links to the blob.
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import blob_store
+from webapp.file_lock import locked
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(BASE_DIR, "stories", "_shared")
+# A profile page fetched by one tenant is reused by the others for this long
+PROFILE_TTL = int(os.environ.get("SNAPSCRAP_SHARED_PROFILE_TTL", "600"))
+# Story media expires on Snapchat after 24h; the per-story entries are dropped a bit later
+MEDIA_TTL = int(os.environ.get("SNAPSCRAP_SHARED_MEDIA_TTL", str(36 * 3600)))
+CHUNK_SIZE = 1024 * 1024
+MEDIA_EXTENSIONS = (".mp4", ".jpeg", ".bin")  # what SnapScrap.py names story files
+
+
+def _path(kind, name):
+    folder = os.path.join(SHARED_DIR, kind)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
+def _key(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+
+
+@contextmanager
+def _locked(name):
+    """Exclusive cross-process lock on stories/_shared/locks/<name>.lock."""
+    path = _path("locks", name)
+    with locked(path):
+        os.utime(path + ".lock")  # prune() only removes locks nobody used for a while
+        yield
+
+
+def _fresh(path, ttl):
+    try:
+        return time.time() - os.path.getmtime(path) < ttl
+    except OSError:
+        return False
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def profile_json(username, fetch):
+    """Profile page data of username; fetch() -> dict is called by only one process per TTL."""
+    name = _key(username.lower())
+    path = _path("profiles", name + ".json")
+    if not _fresh(path, PROFILE_TTL):
+        with _locked("profile_" + name):
+            if not _fresh(path, PROFILE_TTL):  # somebody else may have fetched it while we waited
+                data = fetch()
+                _write_atomic(path, lambda f: f.write(json.dumps(data).encode("utf-8")))
+                return data
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _find_media(name):
+    for ext in MEDIA_EXTENSIONS:
+        path = _path("media", name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def media_file(story_key, download):
+    """Blob of one story's media. Returns (path, fetched) or (None, False).
+
+    download() -> (response, ext) is called by only one process per story; response is
+    a streamed requests response (status 200 expected)."""
+    name = _key(story_key)
+    path = _find_media(name)
+    if path:
+        return path, False
+    with _locked("media_" + name):
+        path = _find_media(name)
+        if path:
+            return path, False
+        r, ext = download()
+        if r.status_code != 200:
+            return None, False
+        blob = blob_store.put_stream(r.iter_content(CHUNK_SIZE), ext)
+        blob_store.link(blob, _path("media", name + ext))
+        return blob, True
+
+
+def link_into(shared_path, dest):
+    """Give a tenant its own entry for a shared file (a reference to the blob)."""
+    blob_store.link(shared_path, dest)
+
+
+def prune():
+    """Drop shared profiles, media entries and locks past their TTL, then collect blobs
+    no tenant links to any more."""
+    now = time.time()
+    for kind, ttl in (("profiles", PROFILE_TTL), ("media", MEDIA_TTL), ("locks", MEDIA_TTL)):
+        folder = os.path.join(SHARED_DIR, kind)
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            try:
+                if now - entry.stat().st_mtime > ttl:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+    blob_store.maybe_gc()
@@ -37,6 +37,13 @@ def load_config():
 config = load_config()
 CHUNK_SIZE = config.get("chunk_size", 7)
 VIDEO_QUALITY = config.get("video_quality", 23)  # CRF value
+# "crf": quality only (output size unbounded). "target": CRF capped by a bitrate per output type,
+# lowered further to fit size_budget_mb, so upload size (and time) is predictable.
+ENCODE_MODE = config.get("encode_mode", "crf")
+TARGET_BITRATE = {"short": "6M", "full": "4M", **config.get("target_bitrate", {})}
+SIZE_BUDGET_MB = config.get("size_budget_mb", {})  # e.g. {"short": 60, "full": 500}
+AUDIO_BITRATE = 128000
+MIN_VIDEO_BITRATE = 500000
 MERGED_DIR = "merged"
 # تنسيق Shorts عمودي
 OUTPUT_WIDTH = 1080
@@ -81,11 +88,61 @@ def get_video_files(folder):
     return [t[1:] for t in files]  # (filename, fullpath)
 
 
-def merge_chunk(ffmpeg_exe, file_paths, output_path):
+def parse_bitrate(value):
+    """"6M" / "4500k" / 6000000 -> bits per second."""
+    if not value:
+        return 0
+    value = str(value).strip().lower()
+    factor = {"k": 1000, "m": 1000000}.get(value[-1], 1)
+    return int(float(value.rstrip("km")) * factor)
+
+
+def _seconds(pattern, text):
+    """Last HH:MM:SS.xx captured by pattern in ffmpeg output, in seconds (0.0 if none)."""
+    matches = re.findall(pattern + r"\s*(\d+):(\d+):(\d+(?:\.\d+)?)", text or "")
+    if not matches:
+        return 0.0
+    h, m, sec = matches[-1]
+    return int(h) * 3600 + int(m) * 60 + float(sec)
+
+
+def probe_duration(ffmpeg_exe, path):
+    """Duration in seconds from the ffmpeg header (ffprobe is not always available)."""
+    proc = subprocess.run([ffmpeg_exe, "-i", path], capture_output=True, text=True, encoding="utf-8", errors="replace")
+    return _seconds("Duration:", proc.stderr)
+
+
+def needs_duration(output_type):
+    """Only a size budget ("target" mode) needs the input duration before encoding."""
+    return ENCODE_MODE == "target" and bool(SIZE_BUDGET_MB.get(output_type))
+
+
+def rate_control_args(output_type, duration):
+    """ffmpeg rate control: plain CRF, or CRF capped with -maxrate/-bufsize in "target" mode."""
+    args = ["-crf", str(VIDEO_QUALITY)]
+    if ENCODE_MODE != "target":
+        return args
+    maxrate = parse_bitrate(TARGET_BITRATE.get(output_type))
+    budget_mb = SIZE_BUDGET_MB.get(output_type)
+    if budget_mb and duration:
+        budget_rate = int(budget_mb * 1024 * 1024 * 8 / duration) - AUDIO_BITRATE
+        budget_rate = max(budget_rate, MIN_VIDEO_BITRATE)
+        maxrate = min(maxrate, budget_rate) if maxrate else budget_rate
+    if maxrate:
+        args += ["-maxrate", str(maxrate), "-bufsize", str(maxrate * 2)]
+    return args
+
+
+def merge_chunk(ffmpeg_exe, file_paths, output_path, output_type="short"):
     """Merge multiple video files into one with scale to Shorts size.
-    Uses concat filter (re-encodes) to avoid freezing issues."""
+    Uses concat filter (re-encodes) to avoid freezing issues.
+    output_type ("short" / "full") selects the bitrate target. Returns content duration in seconds."""
     if not file_paths:
-        return
+        return 0.0
+
+    # One extra ffmpeg run per input, so only when the bitrate depends on it
+    duration = sum(probe_duration(ffmpeg_exe, p) for p in file_paths) if needs_duration(output_type) else 0.0
+    rate_args = rate_control_args(output_type, duration)
     
     # Build filter_complex for concat with scaling
     inputs = []
@@ -115,7 +172,7 @@ def merge_chunk(ffmpeg_exe, file_paths, output_path):
         "-map", "[outa]",
         "-c:v", "libx264",
         "-preset", "medium",  # Better quality than fast
-        "-crf", str(VIDEO_QUALITY),  # Quality setting from config
+    ] + rate_args + [  # Quality (and optional bitrate cap) from config
         "-c:a", "aac",
         "-b:a", "128k",
         "-movflags", "+faststart",  # Web optimization
@@ -124,6 +181,7 @@ def merge_chunk(ffmpeg_exe, file_paths, output_path):
     
     try:
         result = subprocess.run(cmd, check=True, capture_output=True, text=True, encoding="utf-8", errors="replace")
+        log = result.stderr
     except subprocess.CalledProcessError as e:
         # Fallback: try concat demuxer if filter fails
         list_fd, list_path = tempfile.mkstemp(suffix=".txt", text=True)
@@ -146,17 +204,29 @@ def merge_chunk(ffmpeg_exe, file_paths, output_path):
                 "-vf", vf,
                 "-c:v", "libx264",
                 "-preset", "medium",
-                "-crf", str(VIDEO_QUALITY),
+            ] + rate_args + [
                 "-c:a", "aac",
                 "-b:a", "128k",
                 output_path,
             ]
-            subprocess.run(cmd_fallback, check=True, capture_output=True)
+            log = subprocess.run(cmd_fallback, check=True, capture_output=True, text=True, encoding="utf-8",
+                                 errors="replace").stderr
         finally:
             try:
                 os.unlink(list_path)
             except Exception:
                 pass
+    return duration or _seconds("time=", log)  # the encoder's last progress line
+
+
+def report_output(output_path, duration):
+    """Print achieved size and bytes per second of content."""
+    try:
+        size = os.path.getsize(output_path)
+    except OSError:
+        return
+    per_sec = size / duration if duration else 0
+    print(f"    {size / 1024 / 1024:.1f} MB, {duration:.0f}s of content, {per_sec / 1024:.0f} KB/s ({per_sec * 8 / 1000:.0f} kbit/s)")
 
 
 def main():
@@ -216,8 +286,9 @@ def main():
         out_path = os.path.join(merged_path, "merged_all.mp4")
         print(f"Merging {len(videos)} videos into one: merged_all.mp4 ..." if USE_EN else f"دمج كل {len(videos)} فيديو في ملف واحد: merged_all.mp4 ...")
         try:
-            merge_chunk(ffmpeg_exe, paths, out_path)
+            duration = merge_chunk(ffmpeg_exe, paths, out_path, output_type="full")
             print(f"Done: {out_path}" if USE_EN else f"تم: {out_path}")
+            report_output(out_path, duration)
         except subprocess.CalledProcessError as e:
             print(f"ffmpeg error: {e}" if USE_EN else f"خطأ في ffmpeg: {e}")
             if e.stderr:
@@ -237,8 +308,9 @@ def main():
             out_path = os.path.join(merged_path, out_name)
             print(f"  Merge {idx}/{len(chunks)}: {out_name} ..." if USE_EN else f"  دمج {idx}/{len(chunks)}: {out_name} ...")
             try:
-                merge_chunk(ffmpeg_exe, paths, out_path)
+                duration = merge_chunk(ffmpeg_exe, paths, out_path, output_type="short")
                 print(f"    Done: {out_path}" if USE_EN else f"    تم: {out_path}")
+                report_output(out_path, duration)
             except subprocess.CalledProcessError as e:
                 print(f"    ffmpeg error: {e}" if USE_EN else f"    خطأ في ffmpeg: {e}")
                 if e.stderr:
@@ -0,0 +1,27 @@
+"""Index user.stripe_customer_id (Stripe webhook) and connected_channel.user_id
+
+Revision ID: 0002_lookup_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19 19:34:18.350345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_lookup_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases adopted from db.create_all() may have got a table with its indexes already
+    op.create_index('ix_connected_channel_user_id', 'connected_channel', ['user_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_user_stripe_customer_id', 'user', ['stripe_customer_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_user_stripe_customer_id', table_name='user')
+    op.drop_index('ix_connected_channel_user_id', table_name='connected_channel')
@@ -0,0 +1,35 @@
+"""Per-user counters for the admin page (filled by user_stats.recount() on first start)
+
+Revision ID: 0003_user_stats
+Revises: 0002_lookup_indexes
+Create Date: 2026-10-19 19:38:33.902966
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_user_stats'
+down_revision = '0002_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases adopted from db.create_all() may have the table already
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('accounts', sa.Integer(), nullable=False),
+    sa.Column('jobs_run', sa.Integer(), nullable=False),
+    sa.Column('uploads', sa.Integer(), nullable=False),
+    sa.Column('last_job_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('user_stats')
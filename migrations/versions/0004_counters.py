@@ -0,0 +1,31 @@
+"""Shared counters (jobs evicted from the queue)
+
+Revision ID: 0004_counters
+Revises: 0003_user_stats
+Create Date: 2026-10-19 19:53:26.829512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_counters'
+down_revision = '0003_user_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases adopted from db.create_all() may have the table already
+    op.create_table('counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('counter')
@@ -0,0 +1,31 @@
+"""user.stripe_customer_id as VARCHAR(150) everywhere (the hand-run ALTER used VARCHAR(255))
+
+Revision ID: 0005_stripe_customer_id_length
+Revises: 0004_counters
+Create Date: 2026-10-19 20:10:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_stripe_customer_id_length'
+down_revision = '0004_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only databases that got the column from the pre-migrations ALTER differ from the model
+    columns = {c['name']: c for c in sa.inspect(op.get_bind()).get_columns('user')}
+    column = columns.get('stripe_customer_id')
+    if column is None or getattr(column['type'], 'length', None) == 150:
+        return
+    with op.batch_alter_table('user') as batch_op:  # SQLite rebuilds the table
+        batch_op.alter_column('stripe_customer_id', existing_type=column['type'], type_=sa.String(length=150),
+                              existing_nullable=True)
+
+
+def downgrade():
+    pass  # VARCHAR(150) is also what 0001_baseline creates
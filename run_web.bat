@@ -5,4 +5,4 @@ echo.
 echo   SnapScrap Web App
 echo   http://127.0.0.1:5000
 echo.
-python -m flask --app webapp.app run --host 0.0.0.0 --port 5000
+python -m flask --app webapp.wsgi run --host 0.0.0.0 --port 5000
@@ -0,0 +1,67 @@
+"""Fixtures: the models on a throwaway SQLite database, without importing webapp.app
+(which would run migrations against snapscrap.db)."""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webapp.models import db as _db, User  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    _db.init_app(app)
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(username, tier="free"):
+        user = User(username=username, password_hash="x", subscription_tier=tier)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    return make_user
+
+
+@pytest.fixture(scope="session")
+def web_app(tmp_path_factory):
+    """webapp.app on its own SQLite file (imported once: the import runs the migrations)."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path_factory.mktemp('web') / 'web.db'}"
+    from webapp.app import app as web_app
+    web_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False)
+    return web_app
+
+
+@pytest.fixture
+def login(web_app, tmp_path, monkeypatch):
+    """login(username) -> (test client signed in as a new user, user id); stories/ lives in tmp_path."""
+    from werkzeug.security import generate_password_hash
+    from webapp import app as app_module, library, youtube_service
+    for module in (app_module, library, youtube_service):
+        monkeypatch.setattr(module, "BASE_DIR", tmp_path)
+
+    def login(username):
+        with web_app.app_context():
+            user = User(username=username, password_hash=generate_password_hash("pw"))
+            _db.session.add(user)
+            _db.session.commit()
+            user_id = user.id
+        client = web_app.test_client()
+        client.post("/login", data={"username": username, "password": "pw"}, base_url="https://localhost")
+        return client, user_id
+    return login
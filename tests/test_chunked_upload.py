@@ -0,0 +1,56 @@
+import io
+import threading
+import time
+
+import pytest
+
+from webapp import chunked_upload
+
+
+class SlowStream(io.BytesIO):
+    """Request body that arrives in pieces, so two writers overlap."""
+
+    def read(self, size=-1):
+        time.sleep(0.05)
+        return super().read(min(size, 4))
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_upload, "UPLOADS_DIR", tmp_path / "chunked")
+
+
+def test_same_offset_twice_writes_the_chunk_once(uploads):
+    upload_id = chunked_upload.create(1, "clip.mp4", 16)["upload_id"]
+    results = []
+
+    def put():
+        try:
+            results.append(chunked_upload.write_chunk(1, upload_id, 0, SlowStream(b"a" * 16), 16))
+        except chunked_upload.UploadError as e:
+            results.append((e.status, e.extra["offset"]))
+
+    threads = [threading.Thread(target=put) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results, key=str) == [(409, 16), 16]
+    assert chunked_upload.status(1, upload_id)["offset"] == 16
+
+
+def test_finalize_then_chunk_is_rejected(uploads):
+    upload_id = chunked_upload.create(1, "clip.mp4", 4)["upload_id"]
+    chunked_upload.write_chunk(1, upload_id, 0, io.BytesIO(b"abcd"), 4)
+    with chunked_upload.upload_lock(upload_id):
+        path, meta = chunked_upload.finalize(1, upload_id)
+    assert path.read_bytes() == b"abcd"
+    with pytest.raises(chunked_upload.UploadError) as e:
+        chunked_upload.write_chunk(1, upload_id, 0, io.BytesIO(b"abcd"), 4)
+    assert e.value.status == 409
+
+
+def test_lock_of_unknown_upload_is_not_found(uploads):
+    with pytest.raises(chunked_upload.UploadError) as e:
+        chunked_upload.upload_lock("0" * 32)
+    assert e.value.status == 404
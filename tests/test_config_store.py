@@ -0,0 +1,31 @@
+import json
+
+from webapp.config_store import ConfigStore
+
+
+def test_flush_keeps_keys_written_by_another_process(tmp_path):
+    path = tmp_path / "webapp_config.json"
+    first, second = ConfigStore(delay=60), ConfigStore(delay=60)  # two processes' caches
+    first.write(path, {"a": 1})
+    first.flush()
+    assert second.read(path) == {"a": 1}
+
+    with first.modify(path) as cfg:
+        cfg["b"] = 2
+    with second.modify(path) as cfg:
+        cfg["c"] = 3
+        del cfg["a"]
+    first.flush()
+    second.flush()
+    assert json.loads(path.read_text()) == {"b": 2, "c": 3}
+    assert first.read(path) == {"b": 2, "c": 3}
+
+
+def test_pending_changes_survive_a_refresh(tmp_path):
+    path = tmp_path / "webapp_config.json"
+    first, second = ConfigStore(delay=60), ConfigStore(delay=0)
+    first.write(path, {"a": 1})
+    second.write(path, {"x": 9})
+    assert first.read(path) == {"a": 1, "x": 9}
+    first.flush()
+    assert json.loads(path.read_text()) == {"a": 1, "x": 9}
@@ -0,0 +1,38 @@
+import io
+import uuid
+import zipfile
+
+from webapp import library
+
+BASE_URL = "https://localhost"
+
+
+def _export(client, *specs):
+    return client.get("/api/export.zip", query_string=[("f", spec) for spec in specs], base_url=BASE_URL)
+
+
+def test_export_streams_indexed_folders(web_app, login, tmp_path):
+    client, uid = login(f"u_{uuid.uuid4().hex[:8]}")
+    folder = tmp_path / "stories" / str(uid) / "snap" / "2026-10-01"
+    folder.mkdir(parents=True)
+    (folder / "1.mp4").write_bytes(b"video")
+    with web_app.app_context():
+        library.refresh(uid, "snap", "2026-10-01")
+
+    response = _export(client, "snap")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as zf:
+        assert zf.read("snap/2026-10-01/1.mp4") == b"video"
+
+
+def test_export_refuses_tokens_and_folders_outside_the_library(web_app, login, tmp_path):
+    client, uid = login(f"u_{uuid.uuid4().hex[:8]}")
+    tokens = tmp_path / "stories" / str(uid) / "tokens"
+    tokens.mkdir(parents=True)
+    (tokens / "token_UCabc.json").write_text('{"refresh_token": "r", "client_secret": "APP-SECRET"}')
+    unindexed = tmp_path / "stories" / str(uid) / "other" / "2026-10-01"
+    unindexed.mkdir(parents=True)
+
+    assert _export(client, "tokens").status_code == 400
+    assert _export(client, "other").status_code == 404
+    assert _export(client, "other/2026-10-01").status_code == 404
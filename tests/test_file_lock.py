@@ -0,0 +1,36 @@
+import os
+import threading
+import time
+
+from webapp import upload_ledger, youtube_service
+from webapp.file_lock import claim_turn
+
+
+def test_concurrent_ledger_writers_keep_every_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(youtube_service, "BASE_DIR", tmp_path)
+
+    def write(n):
+        for i in range(10):
+            upload_ledger.record_upload(f"h{n}_{i}", "chan", f"v{n}_{i}", user_id=7)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(upload_ledger.list_uploads(7)) == 40
+
+
+def test_claim_turn_has_one_winner_per_interval(tmp_path):
+    stamp = tmp_path / "shared" / ".last_run"
+    wins = []
+    threads = [threading.Thread(target=lambda: wins.append(claim_turn(stamp, 60))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert wins.count(True) == 1
+    assert claim_turn(stamp, 60) is False
+    old = time.time() - 120
+    os.utime(stamp, (old, old))
+    assert claim_turn(stamp, 60) is True
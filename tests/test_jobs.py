@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from webapp import jobs
+from webapp.models import Job
+
+
+def test_enqueue_is_idempotent_per_id(db, make_user):
+    uid = make_user("alice")
+    assert jobs.enqueue("t1", "download", user_id=uid, username="x") is True
+    assert jobs.enqueue("t1", "download", user_id=uid, username="y") is False
+    job = db.session.get(Job, "t1")
+    assert job.status == "pending" and '"x"' in job.params
+
+
+def test_claim_leases_a_job_once(db, make_user):
+    uid = make_user("alice")
+    jobs.enqueue("t1", "download", user_id=uid)
+    job = jobs.claim("w1")
+    assert job.id == "t1" and job.status == "running" and job.attempts == 1 and job.lease_owner == "w1"
+    assert jobs.claim("w2") is None
+
+
+def test_run_after_delays_the_claim(db, make_user):
+    uid = make_user("alice")
+    jobs.enqueue("t1", "download", user_id=uid, run_after=datetime.utcnow() + timedelta(minutes=5))
+    assert jobs.claim("w1") is None
+
+
+def test_expired_lease_is_reclaimed_then_given_up(db, make_user):
+    uid = make_user("alice")
+    jobs.enqueue("t1", "download", user_id=uid, max_attempts=2)
+    for attempt in (1, 2):
+        job = jobs.claim(f"w{attempt}")
+        assert job.attempts == attempt
+        Job.query.filter_by(id="t1").update({Job.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    assert job.message == "Resuming after interruption..."
+    assert jobs.claim("w3") is None
+    db.session.expire_all()
+    assert db.session.get(Job, "t1").status == "error"
+
+
+def test_heartbeat_keeps_the_lease(db, make_user):
+    uid = make_user("alice")
+    jobs.enqueue("t1", "download", user_id=uid)
+    jobs.claim("w1")
+    Job.query.filter_by(id="t1").update({Job.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    jobs.heartbeat("w1", ["t1"])
+    assert jobs.claim("w2") is None
+
+
+def test_queue_full_per_pool(db, make_user, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_QUEUED", 2)
+    uid = make_user("alice", tier="enterprise")
+    jobs.enqueue("t1", "download", user_id=uid)
+    jobs.enqueue("t2", "upload", user_id=uid)
+    with pytest.raises(jobs.QueueFull):
+        jobs.enqueue("t3", "download", user_id=uid)
+    assert jobs.enqueue("m1", "merge", user_id=uid)  # other pool
+
+
+def test_queue_full_per_tier(db, make_user):
+    uid = make_user("alice", tier="free")
+    for n in range(jobs.TIER_POLICIES["free"]["max_queued"]):
+        jobs.enqueue(f"t{n}", "download", user_id=uid)
+    with pytest.raises(jobs.QueueFull):
+        jobs.enqueue("one_more", "download", user_id=uid)
+
+
+def test_fair_share_prefers_idle_tenant_then_weight(db, make_user):
+    free, pro = make_user("free_user", "free"), make_user("pro_user", "pro")
+    for n in range(3):
+        jobs.enqueue(f"free{n}", "download", user_id=free)
+        jobs.enqueue(f"pro{n}", "download", user_id=pro)
+    # Nobody running: the heavier weight goes first
+    assert jobs.claim("w").user_id == pro
+    # pro runs 1/4, free 0/1: free is furthest below its share
+    assert jobs.claim("w").user_id == free
+    # free is at its max_running (1); pro keeps getting jobs until its own cap
+    assert [jobs.claim("w").user_id for _ in range(2)] == [pro, pro]
+    assert jobs.claim("w") is None
+
+
+def test_system_jobs_visible_to_admins_only(db, make_user):
+    uid = make_user("alice")
+    jobs.enqueue("sys", "download")
+    jobs.enqueue("mine", "download", user_id=uid)
+    assert jobs.get_task("sys", uid)["status"] == "unknown"
+    assert jobs.get_task("sys", uid, is_admin=True)["status"] == "pending"
+    assert jobs.get_task("mine", uid + 1)["status"] == "unknown"
+    assert jobs.get_tasks(["sys", "mine"], uid)["mine"]["status"] == "pending"
+
+
+def test_evicted_count_is_stored_in_the_database(db, make_user):
+    uid = make_user("alice")
+    for n in range(3):
+        jobs.enqueue(f"t{n}", "download", user_id=uid)
+    Job.query.update({Job.status: "done", Job.updated_at: datetime.utcnow() - timedelta(days=2)})
+    db.session.commit()
+    assert jobs.evict_finished(ttl=3600) == 3
+    assert jobs.evict_finished(ttl=3600) == 0
+    assert jobs.stats() == {"live": 0, "finished": 0, "evicted": 3}
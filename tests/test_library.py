@@ -0,0 +1,32 @@
+from webapp import library
+from webapp.models import LibraryEntry, StorageUsage
+
+
+def test_refresh_without_commit_leaves_nothing_behind_on_rollback(db, make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(library, "BASE_DIR", tmp_path)
+    uid = make_user("alice")
+    folder = library.folder_path(uid, "snap", "2026-10-01")
+    folder.mkdir(parents=True)
+    (folder / "1.mp4").write_bytes(b"x" * 100)
+
+    library.refresh(uid, "snap", "2026-10-01", commit=False)
+    db.session.rollback()
+    assert StorageUsage.query.count() == 0 and LibraryEntry.query.count() == 0
+
+    library.refresh(uid, "snap", "2026-10-01")
+    assert db.session.get(StorageUsage, uid).bytes == 100
+    assert library.folder_bytes(uid, "snap", "2026-10-01") == 100
+
+
+def test_reconcile_skips_folders_of_deleted_users(db, make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(library, "BASE_DIR", tmp_path)
+    uid = make_user("alice")
+    for owner in (uid, 999):
+        folder = library.folder_path(owner, "snap", "2026-10-01")
+        folder.mkdir(parents=True)
+        (folder / "1.mp4").write_bytes(b"x" * 100)
+
+    assert library.reconcile() == (1, 0)
+    assert library.reconcile(999) == (0, 0)
+    assert {e.user_id for e in LibraryEntry.query} == {uid}
+    assert [u.user_id for u in StorageUsage.query] == [uid]
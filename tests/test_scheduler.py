@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from webapp import jobs, scheduler
+from webapp.models import Job, Schedule, TrackedAccount
+
+
+def _due_schedule(db, uid, minutes_ago=1):
+    db.session.add(TrackedAccount(user_id=uid, username="snap"))
+    schedule = Schedule(user_id=uid, enabled=True, next_run_at=datetime.utcnow() - timedelta(minutes=minutes_ago))
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule.id, schedule.next_run_at
+
+
+def test_fire_claims_then_queues_once(db, make_user):
+    uid = make_user("alice")
+    schedule_id, run_at = _due_schedule(db, uid)
+    next_at = scheduler.fire(schedule_id)
+    assert next_at > datetime.utcnow()
+    assert [j.id for j in Job.query.all()] == [f"sched_{uid}_{run_at:%Y%m%d_%H%M}"]
+    assert scheduler.fire(schedule_id) == next_at  # not due any more
+    assert Job.query.count() == 1
+
+
+def test_fire_that_loses_the_claim_queues_nothing(db, make_user, monkeypatch):
+    uid = make_user("alice")
+    schedule_id, _ = _due_schedule(db, uid)
+    monkeypatch.setattr(scheduler, "claim_run", lambda schedule, now=None: False)  # another process won
+    scheduler.fire(schedule_id)
+    assert Job.query.count() == 0
+
+
+def test_queue_full_gives_the_run_back(db, make_user, monkeypatch):
+    uid = make_user("alice")
+    schedule_id, run_at = _due_schedule(db, uid)
+
+    def full(*args, **kwargs):
+        raise jobs.QueueFull("full")
+
+    monkeypatch.setattr(jobs, "enqueue", full)
+    now = datetime.utcnow()
+    assert scheduler.fire(schedule_id, now) == now + timedelta(seconds=scheduler.RETRY_SECONDS)
+    db.session.expire_all()
+    assert db.session.get(Schedule, schedule_id).next_run_at == run_at
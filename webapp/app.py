@@ -13,20 +13,26 @@ import requests
 from bs4 import BeautifulSoup
 import functools
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for, flash
+from flask import Flask, Response, jsonify, redirect, render_template, request, session, url_for, flash, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from webapp.models import db, User, ConnectedChannel
+from webapp.models import db, User, ConnectedChannel, TrackedAccount, Schedule, LibraryEntry, StorageUsage, UserStats
 from webapp.billing import billing_bp
+from webapp import database, identity, jobs, library, profiles, user_stats
+from webapp.config_store import store as config_store
+from flask_migrate import Migrate
+from sqlalchemy import not_
+from sqlalchemy.exc import IntegrityError
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 500 * 1024 * 1024  # 500MB
 app.config["UPLOAD_FOLDER"] = BASE_DIR / "uploads"
+app.jinja_env.globals["getattr"] = getattr  # templates check optional User attributes (is_admin)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'super-secret-default-key-123')
 # Prevent XSS & Session Hijacking
 app.config['SESSION_COOKIE_SECURE'] = True
@@ -44,6 +50,7 @@ if db_url.startswith("postgres://"):
     db_url = db_url.replace("postgres://", "postgresql://", 1)
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database.engine_options(db_url)
 app.config["UPLOAD_FOLDER"].mkdir(exist_ok=True)
 
 app.register_blueprint(billing_bp)
@@ -70,6 +77,7 @@ def add_security_headers(response):
     return response
 
 db.init_app(app)
+Migrate(app, db, directory=database.MIGRATIONS_DIR)
 
 login_manager = LoginManager()
 login_manager.login_view = "login"
@@ -77,7 +85,7 @@ login_manager.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    user = User.query.get(int(user_id))
+    user = identity.load(int(user_id))
     if user and getattr(request, 'host', ''):
         if request.host.startswith("127.0.0.1") or request.host.startswith("localhost"):
             user.subscription_tier = "enterprise"
@@ -115,30 +123,15 @@ def set_lang(lang):
         session['lang'] = lang
     return redirect(request.referrer or url_for('landing'))
 
-# Auto-Migration for V2 SQLite (Add new columns without dropping data)
+# Create or upgrade the schema (migrations/); databases from before migrations are adopted once
 with app.app_context():
-    db.create_all()
-    try:
-        from sqlalchemy import text
-        # Attempt to query the newly added V2 columns
-        db.session.execute(text("SELECT is_admin FROM user LIMIT 1"))
-    except Exception:
-        db.session.rollback()
-        print("Migrating local database: Checking missing columns in User table...")
-        columns_to_add = [
-            ("subscription_tier", "VARCHAR(50) DEFAULT 'free'"),
-            ("stripe_customer_id", "VARCHAR(255)"),
-            ("created_at", "DATETIME"),
-            ("is_admin", "BOOLEAN DEFAULT 0")
-        ]
-        for col_name, col_def in columns_to_add:
-            try:
-                db.session.execute(text(f"ALTER TABLE user ADD COLUMN {col_name} {col_def}"))
-                db.session.commit()
-                print(f"Added column {col_name}.")
-            except Exception:
-                db.session.rollback()
-                pass
+    database.upgrade_schema(db)
+
+@app.errorhandler(jobs.QueueFull)
+def handle_queue_full(e):
+    """Backpressure: too much queued work, ask the client to retry later."""
+    return jsonify({"ok": False, "error": str(e)}), 429
+
 
 @app.before_request
 def require_login():
@@ -151,7 +144,6 @@ def require_login():
 
 ACCOUNTS_KEY = "accounts"
 SCHEDULE_KEY = "schedule"
-tasks = {}
 
 def get_user_config_file(user_id=None):
     if user_id is None:
@@ -165,15 +157,13 @@ def get_user_config_file(user_id=None):
 
 
 def load_config(user_id=None):
-    """Load webapp config."""
+    """Load webapp config (cached in memory, see webapp/config_store.py)."""
     config_file = get_user_config_file(user_id)
-    if config_file and config_file.exists():
-        try:
-            with open(config_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError):
-            pass
-            
+    if config_file:
+        data = config_store.read(config_file)
+        if data is not None:
+            return data
+
     # Fallback to legacy global config to prevent data loss locally
     legacy_file = BASE_DIR / "webapp_config.json"
     if legacy_file.exists():
@@ -189,105 +179,177 @@ def load_config(user_id=None):
 
 
 def save_config(config, user_id=None):
-    """Save webapp config."""
+    """Save webapp config (written to disk after a short write-behind delay)."""
     config_file = get_user_config_file(user_id)
     if not config_file:
         return
-    with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
-        f.flush()
-        os.fsync(f.fileno())
+    config_store.write(config_file, config)
+
+
+def _config_user_id(user_id=None):
+    if user_id is None and current_user and current_user.is_authenticated:
+        return current_user.id
+    return user_id or None
 
 
 def get_accounts(user_id=None):
-    """Get accounts list: [{username, checked}, ...]."""
-    cfg = load_config(user_id)
-    return cfg.get(ACCOUNTS_KEY, [])
+    """Get accounts list: [{username, checked, avatar}, ...]."""
+    uid = _config_user_id(user_id)
+    if not uid:
+        return []
+    rows = TrackedAccount.query.filter_by(user_id=uid).order_by(TrackedAccount.id).all()
+    return [a.to_dict() for a in rows]
 
 
 def save_accounts(accounts, user_id=None):
-    """Save accounts."""
-    cfg = load_config(user_id)
-    cfg[ACCOUNTS_KEY] = accounts
-    save_config(cfg, user_id)
+    """Replace the user's accounts with the given list."""
+    uid = _config_user_id(user_id)
+    if not uid:
+        return
+    existing = {a.username: a for a in TrackedAccount.query.filter_by(user_id=uid).all()}
+    wanted = {a.get("username"): a for a in accounts if a.get("username")}
+    for username, row in existing.items():
+        if username not in wanted:
+            db.session.delete(row)
+    for username, a in wanted.items():
+        row = existing.get(username)
+        if row is None:
+            row = TrackedAccount(user_id=uid, username=username)
+            db.session.add(row)
+        row.checked = bool(a.get("checked", True))
+        row.avatar = a.get("avatar")
+    db.session.commit()
+    user_stats.set_accounts(uid)
 
 
 def get_schedule(user_id=None):
     """Get schedule: {enabled, hour, minute, merge}."""
-    cfg = load_config(user_id)
-    return cfg.get(SCHEDULE_KEY, {"enabled": False, "hour": 9, "minute": 0, "merge": False})
+    uid = _config_user_id(user_id)
+    row = Schedule.query.filter_by(user_id=uid).first() if uid else None
+    return row.to_dict() if row else {"enabled": False, "hour": 9, "minute": 0, "merge": False}
 
 
 def save_schedule(schedule, user_id=None):
-    """Save schedule."""
-    cfg = load_config(user_id)
-    cfg[SCHEDULE_KEY] = schedule
-    save_config(cfg, user_id)
-
-
-def get_merged_folders():
-    """List username/date folders that have merged videos."""
-    result = []
-    stories_dir = BASE_DIR / "stories"
-    try:
-        items = os.listdir(stories_dir)
-    except OSError:
-        return []
-    for username in items:
-        user_path = stories_dir / username
-        if not user_path.is_dir() or username.startswith(".") or username in ("webapp", "build", "dist", "uploads"):
+    """Save schedule and compute its next run time."""
+    uid = _config_user_id(user_id)
+    if not uid:
+        return
+    row = Schedule.query.filter_by(user_id=uid).first()
+    if row is None:
+        row = Schedule(user_id=uid)
+        db.session.add(row)
+    row.enabled = bool(schedule.get("enabled"))
+    row.hour = int(schedule.get("hour", 9)) % 24
+    row.minute = int(schedule.get("minute", 0)) % 60
+    row.merge = bool(schedule.get("merge"))
+    row.next_run_at = row.next_run_after() if row.enabled else None
+    db.session.commit()
+    from webapp.scheduler import notify_changed
+    notify_changed()
+
+
+DB_MIGRATED_KEY = "accounts_in_db"
+
+
+def migrate_config_to_db():
+    """Import accounts/schedule from each user's webapp_config.json into the database (once)."""
+    for user in User.query.all():
+        cfg = load_config(user.id)
+        if cfg.get(DB_MIGRATED_KEY) or not (cfg.get(ACCOUNTS_KEY) or cfg.get(SCHEDULE_KEY)):
             continue
         try:
-            subdirs = os.listdir(user_path)
-        except OSError:
-            continue
-        for d in subdirs:
-            merged_path = user_path / d / "merged"
-            if merged_path.is_dir() and list(merged_path.glob("merged_*.mp4")):
-                result.append({"username": username, "date": d})
-    return sorted(result, key=lambda x: (x["username"], x["date"]), reverse=True)
+            if not TrackedAccount.query.filter_by(user_id=user.id).first():
+                save_accounts(cfg.get(ACCOUNTS_KEY, []), user.id)
+            if cfg.get(SCHEDULE_KEY) and not Schedule.query.filter_by(user_id=user.id).first():
+                save_schedule(cfg[SCHEDULE_KEY], user.id)
+        except IntegrityError:
+            db.session.rollback()  # another web worker imported it at the same time
+        with config_store.modify(get_user_config_file(user.id)) as stored:
+            stored[DB_MIGRATED_KEY] = True
 
 
-def run_task(task_id, task_type, **kwargs):
-    """Run task in background."""
-    user_id = current_user.id if current_user and current_user.is_authenticated else ""
-    
-    def _run():
-        try:
-            if task_type == "download":
-                _run_download(task_id, kwargs.get("username"), kwargs.get("merge", False), user_id)
-            elif task_type == "download_batch":
-                _run_download_batch(task_id, kwargs.get("usernames", []), kwargs.get("merge", False), user_id)
-            elif task_type == "merge":
-                _run_merge(task_id, kwargs.get("username"), kwargs.get("date_str"), kwargs.get("merge_mode", "shorts"), user_id)
-            elif task_type == "upload":
-                _run_upload(task_id, kwargs.get("username"), kwargs.get("date_str"), kwargs.get("privacy", "private"), kwargs.get("upload_type", "shorts"), kwargs.get("channel_id"), user_id)
-            elif task_type == "upload_file":
-                _run_upload_file(task_id, kwargs.get("file_path"), kwargs.get("title"), kwargs.get("privacy", "private"), kwargs.get("channel_id"), user_id)
-        except Exception as e:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = str(e)
+with app.app_context():
+    migrate_config_to_db()
+    if not db.session.query(LibraryEntry.id).first():
+        library.reconcile()  # first start with the library index: build it from what's on disk
+    elif not db.session.query(StorageUsage.user_id).first():
+        library.recount_usage()  # storage counters are newer than the index
+    if not db.session.query(UserStats.user_id).first() and db.session.query(User.id).first():
+        user_stats.recount()  # per-user counters are newer than the data they count
 
-    threading.Thread(target=_run, daemon=True).start()
 
+def get_merged_folders(user_id=None, page=1, per_page=None):
+    """username/date folders of a user that have merged videos, from the library index.
 
-def _run_download(task_id, username, do_merge, user_id=""):
-    tasks[task_id]["status"] = "running"
-    tasks[task_id]["message"] = f"Downloading {username}..."
+    Returns (folders, total) when per_page is given, else the full list."""
+    if user_id is None:
+        user_id = current_user.id if current_user and current_user.is_authenticated else ""
+    if not user_id:
+        return ([], 0) if per_page else []
+    items, total = library.list_merged(user_id, page=page, per_page=per_page)
+    return (items, total) if per_page else items
+
+
+def run_task(task_id, task_type, user_id=None, **kwargs):
+    """Queue a task for the job workers. Returns False if task_id already exists."""
+    if user_id is None:
+        user_id = current_user.id if current_user and current_user.is_authenticated else ""
+    return jobs.enqueue(task_id, task_type, user_id=user_id, **kwargs)
+
+
+def run_job(task_id, task_type, user_id, params):
+    """Execute a queued task (called by job workers with an app context)."""
+    user_id = user_id or ""
+    if task_type == "download":
+        _run_download(task_id, params.get("username"), params.get("merge", False), user_id)
+    elif task_type == "download_batch":
+        _run_download_batch(task_id, params.get("usernames", []), params.get("merge", False), user_id)
+    elif task_type == "merge":
+        _run_merge(task_id, params.get("username"), params.get("date_str"), params.get("merge_mode", "shorts"), user_id)
+    elif task_type == "upload":
+        _run_upload(task_id, params.get("username"), params.get("date_str"), params.get("privacy", "private"), params.get("upload_type", "shorts"), params.get("channel_id"), user_id)
+    elif task_type == "upload_file":
+        _run_upload_file(task_id, params.get("file_path"), params.get("title"), params.get("privacy", "private"), params.get("channel_id"), user_id)
+    elif task_type == "enrich":
+        _run_enrich(task_id, params.get("usernames", []), user_id)
+    elif task_type == "upload_all":
+        _run_upload_all(task_id, params.get("folders", []), params.get("privacy", "private"), params.get("upload_type", "shorts"), params.get("channel_id"), user_id)
+    else:
+        jobs.update(task_id, status="error", message=f"Unknown task type: {task_type}")
+
+
+RESERVED_FOLDERS = ("webapp", "build", "dist", "uploads", "tokens")  # never a Snapchat account's folder
+
+
+def _account_dir(username, user_id=""):
+    return BASE_DIR / "stories" / str(user_id) / username if user_id else BASE_DIR / "stories" / username
+
+
+def _download_account(username, do_merge, user_id=""):
+    """Run SnapScrap.py for one account and count the bytes it added to the day's folder."""
+    date_str = date.today().strftime("%Y-%m-%d")
+    size_before = library.folder_bytes(user_id, username, date_str)
     cmd = [sys.executable, str(BASE_DIR / "SnapScrap.py"), username]
     if do_merge:
         cmd.append("--merge")
     env = os.environ.copy()
     env["SNAPSCRAP_LANG"] = "en"
+    env["SNAPSCRAP_DATE"] = date_str  # the folder measured here, even if the download runs past midnight
     if user_id:
         env["SNAPSCRAP_USER_ID"] = str(user_id)
     proc = subprocess.run(cmd, cwd=str(BASE_DIR), capture_output=True, text=True, encoding="utf-8", errors="replace", env=env)
+    entry = library.refresh(user_id, username, date_str)
+    jobs.record_usage(user_id, bytes_transferred=max(0, (entry.total_bytes if entry else 0) - size_before))
+    return proc
+
+
+def _run_download(task_id, username, do_merge, user_id=""):
+    jobs.update(task_id, status="running", message=f"Downloading {username}...")
+    proc = _download_account(username, do_merge, user_id)
     if proc.returncode != 0:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = proc.stderr or proc.stdout or "Download failed"
+        jobs.update(task_id, status="error", message=proc.stderr or proc.stdout or "Download failed")
         return
-    tasks[task_id]["status"] = "done"
-    tasks[task_id]["message"] = f"Downloaded {username}!"
+    jobs.update(task_id, status="done", message=f"Downloaded {username}!")
 
 
 def _run_download_batch(task_id, usernames, do_merge, user_id=""):
@@ -295,27 +357,42 @@ def _run_download_batch(task_id, usernames, do_merge, user_id=""):
     done = 0
     failed = []
     for username in usernames:
-        tasks[task_id]["status"] = "running"
-        tasks[task_id]["message"] = f"Downloading {username} ({done + 1}/{total})..."
-        cmd = [sys.executable, str(BASE_DIR / "SnapScrap.py"), username]
-        if do_merge:
-            cmd.append("--merge")
-        env = os.environ.copy()
-        env["SNAPSCRAP_LANG"] = "en"
-        if user_id:
-            env["SNAPSCRAP_USER_ID"] = str(user_id)
-        proc = subprocess.run(cmd, cwd=str(BASE_DIR), capture_output=True, text=True, encoding="utf-8", errors="replace", env=env)
+        jobs.update(task_id, status="running", message=f"Downloading {username} ({done + 1}/{total})...")
+        proc = _download_account(username, do_merge, user_id)
         if proc.returncode != 0:
             failed.append(username)
         else:
             done += 1
-    tasks[task_id]["status"] = "done" if not failed else ("error" if done == 0 else "done")
-    tasks[task_id]["message"] = f"Downloaded {done}/{total}" + (f" — failed: {', '.join(failed)}" if failed else "")
+    jobs.update(
+        task_id,
+        status="done" if not failed else ("error" if done == 0 else "done"),
+        message=f"Downloaded {done}/{total}" + (f" — failed: {', '.join(failed)}" if failed else ""),
+    )
+
+
+def _run_enrich(task_id, usernames, user_id=""):
+    """Fetch avatars of newly added accounts (bulk add)."""
+    total = len(usernames)
+    jobs.update(task_id, status="running", message=f"Fetching profiles (0/{total})...")
+    try:
+        fetched = profiles.enrich(user_id, usernames,
+                                  progress=lambda done, n: jobs.update(task_id, message=f"Fetching profiles ({done}/{n})..."))
+    except Exception as e:
+        jobs.update(task_id, status="error", message=str(e))
+        return
+    jobs.update(task_id, status="done", message=f"Profiles updated ({fetched} fetched, {total - fetched} from cache)")
 
 
 def _run_merge(task_id, username, date_str, merge_mode="shorts", user_id=""):
     """merge_mode: shorts | full | both (run both shorts and full)"""
-    tasks[task_id]["status"] = "running"
+    try:
+        _merge_folder(task_id, username, date_str, merge_mode, user_id)
+    finally:
+        library.refresh(user_id, username, date_str)
+
+
+def _merge_folder(task_id, username, date_str, merge_mode, user_id):
+    jobs.update(task_id, status="running")
     env = os.environ.copy()
     env["SNAPSCRAP_LANG"] = "en"
     if user_id:
@@ -323,136 +400,93 @@ def _run_merge(task_id, username, date_str, merge_mode="shorts", user_id=""):
         
     if merge_mode == "both":
         # First: Shorts (merged_1, merged_2, ...)
-        tasks[task_id]["message"] = "Merging Shorts..."
+        jobs.update(task_id, message="Merging Shorts...")
         cmd1 = [sys.executable, str(BASE_DIR / "merge_videos.py"), username, date_str]
         proc1 = subprocess.run(cmd1, cwd=str(BASE_DIR), capture_output=True, text=True, env=env, encoding="utf-8", errors="replace")
         if proc1.returncode != 0:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = proc1.stderr or proc1.stdout or "Merge Shorts failed"
+            jobs.update(task_id, status="error", message=proc1.stderr or proc1.stdout or "Merge Shorts failed")
             return
         # Second: Full (merged_all.mp4)
-        tasks[task_id]["message"] = "Merging full video..."
+        jobs.update(task_id, message="Merging full video...")
         cmd2 = [sys.executable, str(BASE_DIR / "merge_videos.py"), username, date_str, "--all"]
         proc2 = subprocess.run(cmd2, cwd=str(BASE_DIR), capture_output=True, text=True, env=env, encoding="utf-8", errors="replace")
         if proc2.returncode != 0:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = proc2.stderr or proc2.stdout or "Merge full failed"
+            jobs.update(task_id, status="error", message=proc2.stderr or proc2.stdout or "Merge full failed")
             return
     else:
-        tasks[task_id]["status"] = "running"
-        tasks[task_id]["message"] = "Merging videos..."
+        jobs.update(task_id, status="running", message="Merging videos...")
         cmd = [sys.executable, str(BASE_DIR / "merge_videos.py"), username, date_str]
         if merge_mode == "full":
             cmd.append("--all")
         proc = subprocess.run(cmd, cwd=str(BASE_DIR), capture_output=True, text=True, env=env, encoding="utf-8", errors="replace")
         if proc.returncode != 0:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = proc.stderr or proc.stdout or "Merge failed"
+            jobs.update(task_id, status="error", message=proc.stderr or proc.stdout or "Merge failed")
             return
-    tasks[task_id]["status"] = "done"
-    tasks[task_id]["message"] = "Merge complete!"
+    jobs.update(task_id, status="done", message="Merge complete!")
 
 
 def _run_upload(task_id, username, date_str, privacy, upload_type="shorts", channel_id=None, user_id=""):
-    tasks[task_id]["status"] = "running"
-    tasks[task_id]["message"] = "Connecting to YouTube..."
+    jobs.update(task_id, status="running", message="Connecting to YouTube...")
     try:
-        from webapp.youtube_service import upload_from_folder
-        if user_id:
-            os.environ["SNAPSCRAP_USER_ID"] = str(user_id)
-        result = upload_from_folder(username, date_str, privacy, upload_type=upload_type, channel_id=channel_id)
+        from webapp.youtube_service import upload_from_folder, user_context
+        with user_context(user_id):
+            result = upload_from_folder(username, date_str, privacy, upload_type=upload_type, channel_id=channel_id)
+        jobs.record_usage(user_id, bytes_transferred=result.get("bytes", 0), uploads=result.get("count", 0))
+        library.refresh(user_id, username, date_str)
         if result.get("success"):
-            tasks[task_id]["status"] = "done"
-            tasks[task_id]["message"] = f"Uploaded {result.get('count', 0)} videos!"
+            message = f"Uploaded {result.get('count', 0)} videos!"
+            if result.get("skipped"):
+                message += f" ({result['skipped']} already on YouTube, skipped)"
+            jobs.update(task_id, status="done", message=message, result=result)
         else:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = result.get("error", "Upload failed")
+            jobs.update(task_id, status="error", message=result.get("error", "Upload failed"), result=result)
     except ImportError:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = "Install: pip install google-api-python-client google-auth-oauthlib google-auth-httplib2"
+        jobs.update(task_id, status="error", message="Install: pip install google-api-python-client google-auth-oauthlib google-auth-httplib2")
     except Exception as e:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = str(e)
+        jobs.update(task_id, status="error", message=str(e))
 
 
-def _run_upload_file(task_id, file_path, title, privacy, channel_id=None):
-    tasks[task_id]["status"] = "running"
-    tasks[task_id]["message"] = "Uploading to YouTube..."
+def _run_upload_file(task_id, file_path, title, privacy, channel_id=None, user_id=""):
+    jobs.update(task_id, status="running", message="Uploading to YouTube...")
     try:
-        from webapp.youtube_service import upload_single_file
-        result = upload_single_file(file_path, title or "Snapchat Short", privacy, channel_id=channel_id)
+        from webapp.youtube_service import upload_single_file, user_context
+        with user_context(user_id):
+            result = upload_single_file(file_path, title or "Snapchat Short", privacy, channel_id=channel_id)
+        published = 1 if result.get("success") and not result.get("skipped") else 0
+        jobs.record_usage(user_id, bytes_transferred=result.get("bytes", 0), uploads=published)
         if result.get("success"):
-            tasks[task_id]["status"] = "done"
-            tasks[task_id]["message"] = f"Uploaded! {result.get('url', '')}"
+            jobs.update(task_id, status="done", message=f"Uploaded! {result.get('url', '')}", result=result)
         else:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = result.get("error", "Upload failed")
+            jobs.update(task_id, status="error", message=result.get("error", "Upload failed"), result=result)
     except Exception as e:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = str(e)
+        jobs.update(task_id, status="error", message=str(e))
     finally:
         if file_path and os.path.exists(file_path):
             try:
                 os.remove(file_path)
             except OSError:
                 pass
-
-
-def scheduler_loop():
-    """Background scheduler - run at scheduled time daily."""
-    last_date = None
-    while True:
-        time.sleep(30)
-        sched = get_schedule()
-        if not sched.get("enabled"):
-            continue
-        now = datetime.now()
-        h, m = sched.get("hour", 9), sched.get("minute", 0)
-        if now.hour == h and now.minute == m and last_date != now.date():
-            accounts = [a["username"] for a in get_accounts() if a.get("checked")]
-            if accounts:
-                last_date = now.date()
-                task_id = f"batch_{now.strftime('%Y%m%d_%H%M')}"
-                tasks[task_id] = {"status": "running", "message": "Scheduled run..."}
-                run_task(task_id, "download_batch", usernames=accounts, merge=sched.get("merge", False))
-
-
-def start_scheduler():
-    threading.Thread(target=scheduler_loop, daemon=True).start()
-
-
-start_scheduler()
-
-def fetch_snapchat_info(username):
-    """Fetch public profile info (Bitmoji, Bio) from Snapchat."""
-    url = f"https://story.snapchat.com/@{username}"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    try:
-        r = requests.get(url, headers=headers, timeout=5)
-        if not r.ok:
-            return {}
-        soup = BeautifulSoup(r.content, "html.parser")
-        next_data = soup.find(id="__NEXT_DATA__")
-        if not next_data:
-            return {}
-        data = json.loads(next_data.string)
-        props = data.get("props", {}).get("pageProps", {})
-        user_profile = props.get("userProfile", {})
-        public_info = user_profile.get("publicProfileInfo", {})
-        user_info = user_profile.get("userInfo", {})
-        
-        # Try finding snapcode/bitmoji in publicProfileInfo first, then userInfo
-        avatar = public_info.get("snapcodeImageUrl") or user_info.get("snapcodeImageUrl") or user_info.get("bitmoji3dAvatarId") 
-        # Note: bitmoji3dAvatarId needs constructing url, snapcodeImageUrl is direct. 
-        # Typically snapcodeImageUrl is what we want or 'squareImageURL'
-        
-        if not avatar:
-             # Fallback to older keys if structure changed
-             avatar = public_info.get("squareHeroImageUrl")
-        
-        return {"avatar": avatar}
-    except Exception:
-        return {}
+        if file_path:
+            from webapp.chunked_upload import remove_for_file
+            remove_for_file(file_path)
+
+
+def start_background(app):
+    """Start the scheduler, inline job workers, upload status poller and janitor threads.
+
+    Only web server entry points call this (webapp/wsgi.py, `python webapp/app.py`);
+    importing the app (worker.py, daily_automation.py, set_admin.py, CLIs) starts nothing.
+    """
+    from webapp.janitor import start_janitor
+    from webapp.scheduler import start_scheduler
+    from webapp.upload_status import start_poller
+    start_scheduler(app)
+    # Job workers: threads in this process by default. Set SNAPSCRAP_INLINE_WORKER=0 and run
+    # `python worker.py` separately to scale web and job workers independently.
+    if os.environ.get("SNAPSCRAP_INLINE_WORKER", "1") == "1":
+        jobs.start_worker(app, run_job)
+    start_poller(app)
+    start_janitor(app)
 
 @app.route("/register", methods=["GET", "POST"])
 @limiter.limit("5 per minute")
@@ -519,13 +553,34 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+ADMIN_NAV_ARGS = ("page", "per_page", "sort", "dir", "q")
+ADMIN_STORAGE_ROWS = 20
+
+
+def _admin_nav():
+    """Page / sort / search of the admin user list, kept across the tier and delete forms."""
+    return {key: request.args[key] for key in ADMIN_NAV_ARGS if request.args.get(key)}
+
+
 @app.route("/admin")
 @admin_required
 def admin_dashboard():
-    from webapp.models import User, ConnectedChannel
-    users = User.query.all()
-    channel_count = ConnectedChannel.query.count()
-    return render_template("admin.html", users=users, total_channels=channel_count)
+    from webapp.models import ConnectedChannel
+    from webapp import janitor
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = max(1, min(request.args.get("per_page", user_stats.DEFAULT_PAGE_SIZE, type=int), user_stats.MAX_PAGE_SIZE))
+    sort = request.args.get("sort", "id")
+    direction = "desc" if request.args.get("dir") == "desc" else "asc"
+    search = (request.args.get("q") or "").strip()
+    users, total = user_stats.page(page, per_page, sort, direction, search)
+    pages = max(1, -(-total // per_page))
+    tiers, overall = user_stats.tier_summary()
+    return render_template("admin.html", users=users, total_users=total, page=page, pages=pages,
+                           sort=sort if sort in user_stats.SORT_COLUMNS else "id", direction=direction, search=search,
+                           nav=_admin_nav(), tiers=tiers, overall=overall,
+                           total_channels=ConnectedChannel.query.count(), job_stats=jobs.stats(),
+                           tenant_shares=jobs.tenant_shares(), storage=janitor.usage_report(limit=ADMIN_STORAGE_ROWS),
+                           disk=janitor.disk_status())
 
 @app.route("/admin/change_tier/<int:user_id>", methods=["POST"])
 @admin_required
@@ -537,21 +592,28 @@ def admin_change_tier(user_id):
         user.subscription_tier = new_tier
         db.session.commit()
         flash(f"تم تغيير باقة حساب {user.username} إلى {new_tier}.", "success")
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('admin_dashboard', **_admin_nav()))
+
+def _delete_user_rows(user_id):
+    """Delete every row that references the user (in the caller's transaction)."""
+    from webapp.models import Job, RunCheckpoint, TenantUsage
+    for model in (ConnectedChannel, TrackedAccount, Schedule, Job, LibraryEntry, StorageUsage,
+                  TenantUsage, UserStats, RunCheckpoint):
+        model.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
 
 @app.route("/admin/delete_user/<int:user_id>", methods=["POST"])
 @admin_required
 def admin_delete_user(user_id):
-    from webapp.models import User, ConnectedChannel
     user = User.query.get_or_404(user_id)
     if not getattr(user, 'is_admin', False):
-        ConnectedChannel.query.filter_by(user_id=user.id).delete()
+        _delete_user_rows(user.id)
         db.session.delete(user)
         db.session.commit()
         flash(f"تم حذف حساب {user.username} بنجاح.", "success")
     else:
         flash("خطأ: لا يمكنك حذف حساب مدير آخر أو حسابك الشخصي.", "danger")
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('admin_dashboard', **_admin_nav()))
 
 @app.route("/dashboard")
 @login_required
@@ -602,30 +664,67 @@ def api_download_single_story():
         if match:
             media_url = match.group(1)
         
-        if not media_url:
+        if not media_url or not media_url.startswith("https://"):
             return jsonify({"error": "الرابط لا يحتوي على ميديا متاحة"})
             
-        # Download temp file
-        import tempfile
-        r = requests.get(media_url, stream=True, headers=headers)
-        ext = ".mp4" if "video" in r.headers.get('Content-Type', '') else ".jpeg"
-        fd, path = tempfile.mkstemp(suffix=ext)
-        with os.fdopen(fd, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=1024*1024):
-                f.write(chunk)
-                
-        return jsonify({"success": True, "download_url": url_for('serve_single_download', path=path, _external=True)})
+        # No copy on the server: the link streams the media from Snapchat's CDN when opened
+        token = _story_link_serializer().dumps({"url": media_url, "user": current_user.id})
+        return jsonify({"success": True, "download_url": url_for('stream_story', token=token, _external=True)})
     except Exception as e:
         return jsonify({"error": str(e)})
 
-@app.route("/download_temp")
-@login_required
-def serve_single_download():
-    path = request.args.get("path")
-    if path and os.path.exists(path):
-        from flask import send_file
-        return send_file(path, as_attachment=True, download_name=f"snapchat_story{os.path.splitext(path)[1]}")
-    return "File not found", 404
+
+STORY_LINK_MAX_AGE = 600  # seconds a single-story download link stays valid
+STORY_STREAM_CHUNK = 256 * 1024
+STORY_PASSTHROUGH_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+
+
+def _story_link_serializer():
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="single-story-download")
+
+
+@app.route("/story/<token>")
+@limiter.exempt  # players send several Range requests per file; creating the link is rate limited
+def stream_story(token):
+    """Proxy one story from the CDN to the browser, passing Range and length through."""
+    from itsdangerous import BadSignature, SignatureExpired
+    try:
+        data = _story_link_serializer().loads(token, max_age=STORY_LINK_MAX_AGE)
+    except SignatureExpired:
+        return "Link expired", 410
+    except BadSignature:
+        return "File not found", 404
+    if data.get("user") != current_user.id:
+        return "File not found", 404
+
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    if request.headers.get("Range"):
+        headers["Range"] = request.headers["Range"]
+    try:
+        upstream = requests.get(data["url"], headers=headers, stream=True, timeout=10)
+    except requests.RequestException:
+        return "Snapchat is not reachable", 502
+    if upstream.status_code not in (200, 206, 416):
+        upstream.close()
+        return "Story is no longer available", 404
+
+    def generate():
+        try:
+            for chunk in upstream.iter_content(chunk_size=STORY_STREAM_CHUNK):
+                if chunk:
+                    yield chunk
+        finally:
+            upstream.close()
+
+    ext = ".mp4" if "video" in upstream.headers.get("Content-Type", "") else ".jpeg"
+    response = Response(stream_with_context(generate()), status=upstream.status_code, direct_passthrough=True)
+    for name in STORY_PASSTHROUGH_HEADERS:
+        if name in upstream.headers:
+            response.headers[name] = upstream.headers[name]
+    response.headers["Content-Disposition"] = f'attachment; filename="snapchat_story{ext}"'
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
 
 @app.route("/api/accounts", methods=["GET", "POST", "DELETE"])
 def api_accounts():
@@ -646,10 +745,14 @@ def api_accounts():
         if any(a.get("username") == username for a in accounts):
             return jsonify({"ok": False, "error": "Already exists"})
         
-        # Fetch info
-        info = fetch_snapchat_info(username)
-        accounts.append({"username": username, "checked": True, "avatar": info.get("avatar")})
-        save_accounts(accounts, current_user.id)
+        info = profiles.get_info(username)
+        db.session.add(TrackedAccount(user_id=current_user.id, username=username, checked=True, avatar=info.get("avatar")))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"ok": False, "error": "Already exists"})
+        user_stats.set_accounts(current_user.id)
         
     elif action == "add_bulk":
         max_accounts = 999
@@ -660,52 +763,63 @@ def api_accounts():
         else:
             usernames = [u.strip().lower() for u in str(raw).replace(",", "\n").splitlines() if u.strip()]
         
-        added = 0
+        existing = {a.get("username") for a in accounts}
+        new = []
         skipped = []
         for u in usernames:
-            if len(accounts) >= max_accounts:
-                skipped.append(u)
-                continue
-            if any(a.get("username") == u for a in accounts):
+            if len(existing) >= max_accounts or u in existing:
                 skipped.append(u)
                 continue
-            
-            # Fetch info (might be slow for many accounts, but acceptable for typical usage)
-            info = fetch_snapchat_info(u)
-            accounts.append({"username": u, "checked": True, "avatar": info.get("avatar")})
-            added += 1
-            
-        save_accounts(accounts, current_user.id)
+            existing.add(u)
+            new.append(u)
+
+        # Store the accounts now; avatars not in the profile cache are fetched by a background job
+        known = profiles.cached(new)
+        for u in new:
+            db.session.add(TrackedAccount(user_id=current_user.id, username=u, checked=True, avatar=known.get(u, {}).get("avatar")))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"ok": False, "error": "Accounts changed while adding, please retry"})
+        user_stats.set_accounts(current_user.id)
+        task_id = None
+        to_fetch = [u for u in new if u not in known]
+        if to_fetch:
+            task_id = f"enrich_{os.urandom(4).hex()}"
+            try:
+                run_task(task_id, "enrich", usernames=to_fetch)
+            except jobs.QueueFull:
+                task_id = None  # accounts are saved; they just stay without an avatar
         return jsonify({
             "ok": True,
-            "added": added,
+            "added": len(new),
             "skipped": skipped,
+            "task_id": task_id,
             "accounts": get_accounts()
         })
     elif action == "remove":
         username = data.get("username")
-        accounts = [a for a in accounts if a.get("username") != username]
-        save_accounts(accounts)
+        TrackedAccount.query.filter_by(user_id=current_user.id, username=username).delete()
+        db.session.commit()
+        user_stats.set_accounts(current_user.id)
     elif action == "toggle":
         username = data.get("username")
-        for a in accounts:
-            if a.get("username") == username:
-                a["checked"] = not a.get("checked")
-        save_accounts(accounts)
+        TrackedAccount.query.filter_by(user_id=current_user.id, username=username).update(
+            {TrackedAccount.checked: not_(TrackedAccount.checked)}, synchronize_session=False)
+        db.session.commit()
     elif action == "set_checked":
         username = data.get("username")
-        checked = data.get("checked", True)
-        for a in accounts:
-            if a.get("username") == username:
-                a["checked"] = checked
-                break
-        save_accounts(accounts)
+        checked = bool(data.get("checked", True))
+        TrackedAccount.query.filter_by(user_id=current_user.id, username=username).update(
+            {TrackedAccount.checked: checked}, synchronize_session=False)
+        db.session.commit()
         return jsonify({"ok": True, "accounts": get_accounts()})
     elif action == "set_all_checked":
-        checked = data.get("checked", True)
-        for a in accounts:
-            a["checked"] = checked
-        save_accounts(accounts)
+        checked = bool(data.get("checked", True))
+        TrackedAccount.query.filter_by(user_id=current_user.id).update(
+            {TrackedAccount.checked: checked}, synchronize_session=False)
+        db.session.commit()
         return jsonify({"ok": True, "accounts": get_accounts()})
     return jsonify({"ok": True, "accounts": get_accounts()})
 
@@ -721,7 +835,7 @@ def api_open_folder():
         return jsonify({"ok": False, "error": "Username required"})
     
     # Path logic
-    target_path = BASE_DIR / "stories" / username
+    target_path = _account_dir(username, current_user.id if current_user.is_authenticated else "")
     if date_str:
         # If date is provided, try to open the date folder or merged folder
         p = target_path / date_str / "merged"
@@ -753,7 +867,6 @@ def api_download():
     if not username:
         return jsonify({"ok": False, "error": "Username required"})
     task_id = f"dl_{username}_{date.today().isoformat()}_{os.urandom(2).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
     run_task(task_id, "download", username=username, merge=data.get("merge", False))
     return jsonify({"ok": True, "task_id": task_id})
 
@@ -765,7 +878,6 @@ def api_download_selected():
     if not usernames:
         return jsonify({"ok": False, "error": "Select at least one account"})
     task_id = f"batch_{date.today().isoformat()}_{os.urandom(4).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
     run_task(task_id, "download_batch", usernames=usernames, merge=data.get("merge", False))
     return jsonify({"ok": True, "task_id": task_id})
 
@@ -793,7 +905,6 @@ def api_merge():
     if not username:
         return jsonify({"ok": False, "error": "Username required"})
     task_id = f"merge_{username}_{date_str}_{os.urandom(2).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
     merge_mode = data.get("merge_mode") or data.get("mergeMode") or "shorts"  # shorts | full | both
     run_task(task_id, "merge", username=username, date_str=date_str, merge_mode=merge_mode)
     return jsonify({"ok": True, "task_id": task_id})
@@ -810,7 +921,6 @@ def api_upload():
     if not username:
         return jsonify({"ok": False, "error": "Username required"})
     task_id = f"upload_{username}_{date_str}_{os.urandom(2).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
     run_task(task_id, "upload", username=username, date_str=date_str, privacy=privacy, upload_type=upload_type, channel_id=channel_id)
     return jsonify({"ok": True, "task_id": task_id})
 
@@ -825,25 +935,121 @@ def api_upload_file():
     if not f.filename.lower().endswith((".mp4", ".webm", ".mov")):
         return jsonify({"ok": False, "error": "Only video files (.mp4, .webm, .mov)"})
     filename = secure_filename(f.filename) or "video.mp4"
-    file_path = app.config["UPLOAD_FOLDER"] / filename
+    file_path = app.config["UPLOAD_FOLDER"] / f"{os.urandom(4).hex()}_{filename}"  # two users may upload the same name
     f.save(str(file_path))
     title = (request.form.get("title") or filename).replace(".mp4", "")
     privacy = request.form.get("privacy") or "private"
     channel_id = request.form.get("channel_id") or None
     task_id = f"uf_{os.urandom(4).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
     run_task(task_id, "upload_file", file_path=str(file_path), title=title, privacy=privacy, channel_id=channel_id)
     return jsonify({"ok": True, "task_id": task_id})
 
 
+def _upload_error(e):
+    return jsonify({"ok": False, "error": str(e), **e.extra}), e.status
+
+
+@app.route("/api/uploads", methods=["POST"])
+def api_upload_init():
+    """Start a chunked, resumable upload (see webapp/chunked_upload.py)."""
+    from webapp import chunked_upload
+    data = request.get_json() or {}
+    try:
+        upload = chunked_upload.create(current_user.id, data.get("filename"), data.get("size"), data.get("sha256"),
+                                       title=(data.get("title") or "").strip(), privacy=data.get("privacy") or "private",
+                                       channel_id=data.get("channel_id") or None)
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    return jsonify({"ok": True, **upload})
+
+
+@app.route("/api/uploads/<upload_id>", methods=["GET", "PUT", "DELETE"])
+@limiter.exempt  # one request per chunk
+def api_upload_chunk(upload_id):
+    from webapp import chunked_upload
+    try:
+        if request.method == "GET":
+            return jsonify({"ok": True, **chunked_upload.status(current_user.id, upload_id)})
+        if request.method == "DELETE":
+            chunked_upload.abort(current_user.id, upload_id)
+            return jsonify({"ok": True})
+        offset = chunked_upload.write_chunk(current_user.id, upload_id, request.args.get("offset", -1, type=int),
+                                            request.stream, request.content_length,
+                                            request.headers.get("X-Chunk-SHA256"))
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    return jsonify({"ok": True, "offset": offset})
+
+
+@app.route("/api/uploads/<upload_id>/finalize", methods=["POST"])
+def api_upload_finalize(upload_id):
+    from webapp import chunked_upload
+    try:
+        with chunked_upload.upload_lock(upload_id):
+            file_path, meta = chunked_upload.finalize(current_user.id, upload_id)
+            if meta.get("task_id"):
+                return jsonify({"ok": True, "task_id": meta["task_id"]})
+            params = meta.get("params", {})
+            title = params.get("title") or os.path.splitext(meta["filename"])[0]
+            task_id = f"uf_{upload_id}"  # one job per upload even if a finalize slips past the lock
+            run_task(task_id, "upload_file", file_path=str(file_path), title=title,
+                     privacy=params.get("privacy", "private"), channel_id=params.get("channel_id"))
+            chunked_upload.mark_queued(upload_id, meta, task_id)
+    except chunked_upload.UploadError as e:
+        return _upload_error(e)
+    return jsonify({"ok": True, "task_id": task_id})
+
+
 @app.route("/api/task/<task_id>")
 def api_task(task_id):
-    return jsonify(tasks.get(task_id, {"status": "unknown"}))
+    return jsonify(jobs.get_task(task_id, current_user.id, getattr(current_user, "is_admin", False)))
+
+
+TASK_STREAM_TICK = 1  # seconds between DB checks inside a stream
+TASK_STREAM_MAX_AGE = 120  # close and let EventSource reconnect, so no gunicorn thread is held forever
+TASK_STREAM_MAX_IDS = 20
+
+
+@app.route("/api/tasks/stream")
+@limiter.exempt
+def api_tasks_stream():
+    """Server-Sent Events: push status changes of ?ids=a,b,c until all of them finished."""
+    ids = [i for i in request.args.get("ids", "").split(",") if i][:TASK_STREAM_MAX_IDS]
+    user_id = current_user.id
+    is_admin = getattr(current_user, "is_admin", False)
+
+    def generate():
+        last = {}
+        started = time.monotonic()
+        yield "retry: 2000\n\n"
+        while ids and time.monotonic() - started < TASK_STREAM_MAX_AGE:
+            try:
+                states = jobs.get_tasks(ids, user_id, is_admin)
+            finally:
+                db.session.remove()  # don't hold a pooled connection between ticks
+            for task_id, state in states.items():
+                if last.get(task_id) != state:
+                    last[task_id] = state
+                    yield f"event: task\ndata: {json.dumps(dict(state, id=task_id), ensure_ascii=False)}\n\n"
+            if all(s["status"] not in ("pending", "running") for s in states.values()):
+                yield "event: end\ndata: {}\n\n"
+                return
+            time.sleep(TASK_STREAM_TICK)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
 
 
 @app.route("/api/merged-folders")
 def api_merged_folders():
-    return jsonify(get_merged_folders())
+    """Merged folders, newest first. ?page=&per_page= for one page; total in X-Total-Count."""
+    per_page = min(max(request.args.get("per_page", 0, type=int), 0), 500)
+    if not per_page:
+        return jsonify(get_merged_folders())
+    items, total = get_merged_folders(page=max(request.args.get("page", 1, type=int), 1), per_page=per_page)
+    response = jsonify(items)
+    response.headers["X-Total-Count"] = str(total)
+    return response
 
 
 # حسابات فرق صناعة المحتوى السعودية (مقترحة)
@@ -875,11 +1081,22 @@ def api_youtube_channels():
 def api_youtube_refresh():
     try:
         from webapp.youtube_service import refresh_channels
-        return jsonify(refresh_channels())
+        data = request.get_json(silent=True) or {}
+        return jsonify(refresh_channels(force=bool(data.get("force"))))
     except Exception as e:
         return jsonify({"ok": False, "error": str(e), "channels": []})
 
 
+@app.route("/api/youtube/uploads")
+def api_youtube_uploads():
+    """Uploaded videos with their YouTube processing / privacy status (from the upload ledger)."""
+    from webapp.upload_ledger import list_uploads
+    uploads = list_uploads(current_user.id)
+    fields = ("video_id", "channel_id", "title", "file", "uploaded_at", "upload_status",
+              "processing_status", "privacy_status", "failure_reason", "finished")
+    return jsonify({"ok": True, "uploads": [{k: u.get(k) for k in fields} for u in uploads]})
+
+
 @app.route("/api/youtube/upload_token", methods=["POST"])
 @login_required
 def api_youtube_upload_token():
@@ -974,31 +1191,35 @@ def youtube_callback():
 
 def _run_upload_all(task_id, folders, privacy, upload_type, channel_id=None, user_id=""):
     """Upload all merged folders to YouTube."""
-    tasks[task_id]["status"] = "running"
+    jobs.update(task_id, status="running")
     total = len(folders)
     uploaded_folders = 0
     total_videos = 0
+    total_skipped = 0
     last_error = None
     try:
-        from webapp.youtube_service import upload_from_folder
-        if user_id:
-            os.environ["SNAPSCRAP_USER_ID"] = str(user_id)
+        from webapp.youtube_service import upload_from_folder, user_context
         for idx, f in enumerate(folders):
-            tasks[task_id]["message"] = f"Uploading {f['username']}/{f['date']} ({idx + 1}/{total})..."
-            r = upload_from_folder(f["username"], f["date"], privacy, upload_type, channel_id=channel_id)
+            jobs.update(task_id, message=f"Uploading {f['username']}/{f['date']} ({idx + 1}/{total})...")
+            with user_context(user_id):
+                r = upload_from_folder(f["username"], f["date"], privacy, upload_type, channel_id=channel_id)
+            jobs.record_usage(user_id, bytes_transferred=r.get("bytes", 0), uploads=r.get("count", 0))
+            library.refresh(user_id, f["username"], f["date"])
             if r.get("success"):
                 uploaded_folders += 1
                 total_videos += r.get("count", 0)
+                total_skipped += r.get("skipped", 0)
             else:
                 last_error = r.get("error", "Upload failed")
-        tasks[task_id]["status"] = "done"
-        tasks[task_id]["message"] = f"Uploaded {total_videos} videos from {uploaded_folders} folder(s)!"
+        message = f"Uploaded {total_videos} videos from {uploaded_folders} folder(s)!"
+        if total_skipped:
+            message += f" ({total_skipped} already on YouTube, skipped)"
         if last_error and uploaded_folders == 0:
-            tasks[task_id]["status"] = "error"
-            tasks[task_id]["message"] = last_error
+            jobs.update(task_id, status="error", message=last_error)
+        else:
+            jobs.update(task_id, status="done", message=message)
     except Exception as e:
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = str(e)
+        jobs.update(task_id, status="error", message=str(e))
         
         
 @app.route("/api/upload-all", methods=["POST"])
@@ -1012,13 +1233,41 @@ def api_upload_all():
     upload_type = data.get("upload_type") or "shorts"
     channel_id = data.get("channel_id") or None
     task_id = f"upload_all_{os.urandom(4).hex()}"
-    tasks[task_id] = {"status": "pending", "message": "Starting..."}
+    run_task(task_id, "upload_all", user_id=user_id, folders=folders, privacy=privacy, upload_type=upload_type, channel_id=channel_id)
+    return jsonify({"ok": True, "task_id": task_id})
 
-    def _run():
-        _run_upload_all(task_id, folders, privacy, upload_type, channel_id, user_id)
 
-    threading.Thread(target=_run, daemon=True).start()
-    return jsonify({"ok": True, "task_id": task_id})
+@app.route("/api/export.zip")
+def api_export_zip():
+    """Stream a ZIP of library folders: ?f=username/date (repeatable) or ?f=username for a whole account."""
+    from webapp import zip_export
+    folders, names = [], []
+    for spec in request.args.getlist("f"):
+        username, _, date_str = spec.strip().strip("/").partition("/")
+        if (not username or username != secure_filename(username) or username.startswith(("_", "."))
+                or username in RESERVED_FOLDERS or (date_str and not library.DATE_RE.match(date_str))):
+            return jsonify({"ok": False, "error": f"Invalid folder: {spec}"}), 400
+        # Only folders of the user's library index: stories/<uid>/ also holds tokens and configs
+        entries = LibraryEntry.query.filter_by(user_id=current_user.id, username=username)
+        if date_str:
+            entries = entries.filter_by(date_str=date_str)
+        account = _account_dir(username, current_user.id)
+        found = [(account / e.date_str, f"{username}/{e.date_str}")
+                 for e in entries.order_by(LibraryEntry.date_str) if (account / e.date_str).is_dir()]
+        if not found:
+            return jsonify({"ok": False, "error": f"Folder not found: {spec}"}), 404
+        folders.extend(found)
+        names.append(f"{username}_{date_str}" if date_str else username)
+    if not folders:
+        return jsonify({"ok": False, "error": "Choose at least one folder"}), 400
+
+    name = names[0] if len(names) == 1 else f"{len(names)}_folders"
+    response = Response(stream_with_context(zip_export.stream_zip(zip_export.iter_files(folders))),
+                        mimetype="application/zip", direct_passthrough=True)
+    response.headers["Content-Disposition"] = f'attachment; filename="snapscrap_{name}.zip"'
+    response.headers["Cache-Control"] = "private, no-store"
+    response.headers["X-Accel-Buffering"] = "no"  # let nginx pass bytes on as they are produced
+    return response
 
 
 @app.route("/api/clear-batch", methods=["POST"])
@@ -1029,19 +1278,22 @@ def api_clear_batch():
     date_str = (data.get("date") or "").strip()
     if not username or not date_str:
         return jsonify({"ok": False, "error": "Username and date required"})
-    folder = BASE_DIR / "stories" / username / date_str
+    user_id = current_user.id if current_user and current_user.is_authenticated else ""
+    folder = _account_dir(username, user_id) / date_str
     if not folder.is_dir():
         return jsonify({"ok": False, "error": "Folder not found"})
-    if username in ("webapp", "build", "dist", "uploads") or username.startswith("."):
+    if username in RESERVED_FOLDERS or username.startswith(".") or ".." in (username, date_str):
         return jsonify({"ok": False, "error": "Cannot delete that folder"})
     try:
         import shutil
         shutil.rmtree(folder)
+        library.remove(user_id, username, date_str)
         return jsonify({"ok": True, "message": f"Deleted {username}/{date_str}"})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)})
 
 
 if __name__ == '__main__':
+    start_background(app)
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=False, host="0.0.0.0", port=port)
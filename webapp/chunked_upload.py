@@ -0,0 +1,190 @@
+"""Resumable browser-to-server uploads, sent in chunks.
+
+    POST   /api/uploads                 {filename, size, sha256?} -> upload_id, chunk_size
+    PUT    /api/uploads/<id>?offset=N   raw chunk bytes (X-Chunk-SHA256 optional)
+    GET    /api/uploads/<id>            -> offset to resume from
+    POST   /api/uploads/<id>/finalize   -> file checked and handed to the upload job
+    DELETE /api/uploads/<id>
+
+Each upload has its own folder uploads/chunked/<upload_id>/ holding meta.json and the
+data received so far (data.part). The size of data.part is the resume offset, so a
+dropped connection continues where the last chunk that reached the disk ended.
+Chunks are streamed from the request to the file; nothing is buffered whole. A chunk
+write and a finalize with its queueing hold the upload's file lock, so two requests for
+the same upload (a retried PUT, a double-clicked finalize, another web process) run one
+after the other.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+from werkzeug.utils import secure_filename
+
+from webapp.file_lock import locked
+from webapp.youtube_service import BASE_DIR
+
+UPLOADS_DIR = BASE_DIR / "uploads" / "chunked"
+CHUNK_SIZE = 8 * 1024 * 1024  # suggested to clients; every chunk must fit MAX_CONTENT_LENGTH
+MAX_UPLOAD_BYTES = int(os.environ.get("SNAPSCRAP_MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+ALLOWED_EXTENSIONS = (".mp4", ".webm", ".mov")
+READ_SIZE = 1024 * 1024
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _folder(upload_id):
+    if not _ID_RE.match(upload_id or ""):
+        raise UploadError("Upload not found", 404)
+    return UPLOADS_DIR / upload_id
+
+
+def upload_lock(upload_id):
+    """Exclusive cross-process lock of one upload (uploads/chunked/<id>/meta.json.lock)."""
+    folder = _folder(upload_id)
+    if not folder.is_dir():
+        raise UploadError("Upload not found", 404)
+    return locked(folder / "meta.json")
+
+
+def _load(user_id, upload_id):
+    folder = _folder(upload_id)
+    try:
+        with open(folder / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise UploadError("Upload not found", 404)
+    if meta.get("user_id") != user_id:
+        raise UploadError("Upload not found", 404)
+    return folder, meta
+
+
+def _save(folder, meta):
+    tmp_path = folder / "meta.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, folder / "meta.json")
+
+
+def _offset(folder):
+    try:
+        return os.path.getsize(folder / "data.part")
+    except OSError:
+        return 0
+
+
+def create(user_id, filename, size, sha256=None, **job_params):
+    """Start an upload. job_params (title, privacy, channel_id) are used at finalize."""
+    filename = secure_filename(filename or "") or "video.mp4"
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise UploadError("Only video files (.mp4, .webm, .mov)")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("File size required")
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise UploadError(f"File must be between 1 byte and {MAX_UPLOAD_BYTES // 1024 ** 2} MB")
+    if sha256 and not re.match(r"^[0-9a-fA-F]{64}$", sha256):
+        raise UploadError("sha256 must be 64 hex characters")
+    upload_id = os.urandom(16).hex()
+    folder = UPLOADS_DIR / upload_id
+    folder.mkdir(parents=True)
+    (folder / "data.part").touch()
+    meta = {"user_id": user_id, "filename": filename, "size": size, "sha256": (sha256 or "").lower() or None,
+            "created_at": time.time(), "task_id": None, "params": job_params}
+    _save(folder, meta)
+    return {"upload_id": upload_id, "offset": 0, "size": size, "chunk_size": CHUNK_SIZE}
+
+
+def status(user_id, upload_id):
+    folder, meta = _load(user_id, upload_id)
+    offset = _offset(folder)
+    return {"upload_id": upload_id, "offset": offset, "size": meta["size"],
+            "complete": offset == meta["size"], "task_id": meta.get("task_id")}
+
+
+def write_chunk(user_id, upload_id, offset, stream, length, chunk_sha256=None):
+    """Append one chunk at offset, reading the request stream piecewise. Returns the new offset."""
+    with upload_lock(upload_id):
+        return _write_chunk(user_id, upload_id, offset, stream, length, chunk_sha256)
+
+
+def _write_chunk(user_id, upload_id, offset, stream, length, chunk_sha256):
+    folder, meta = _load(user_id, upload_id)
+    if meta.get("task_id") or (folder / meta["filename"]).exists():
+        raise UploadError("Upload already finalized", 409, offset=meta["size"])
+    current = _offset(folder)
+    if offset != current:
+        # e.g. a retried chunk that did arrive: the client continues from here
+        raise UploadError("Offset mismatch", 409, offset=current)
+    if length is None or length < 0 or current + length > meta["size"]:
+        raise UploadError("Chunk exceeds the declared file size", 413 if length else 411, offset=current)
+    h = hashlib.sha256()
+    written = 0
+    path = folder / "data.part"
+    with open(path, "r+b") as f:
+        f.seek(current)
+        try:
+            while written < length:
+                block = stream.read(min(READ_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                h.update(block)
+                written += len(block)
+        except Exception:
+            f.truncate(current)  # client went away mid-chunk
+            raise
+        if written != length or (chunk_sha256 and h.hexdigest() != chunk_sha256.lower()):
+            f.truncate(current)  # drop the partial / corrupt chunk; the client resends it
+            raise UploadError("Chunk incomplete or checksum mismatch", 422, offset=current)
+    return current + written
+
+
+def finalize(user_id, upload_id):
+    """Check the whole file and move it to its final name. Returns (path, meta).
+
+    Call under upload_lock() together with queueing the job and mark_queued().
+    """
+    folder, meta = _load(user_id, upload_id)
+    final_path = folder / meta["filename"]
+    if meta.get("task_id") or final_path.exists():
+        return final_path, meta  # finalized before (response lost, or the job couldn't be queued)
+    offset = _offset(folder)
+    if offset != meta["size"]:
+        raise UploadError("Upload incomplete", 409, offset=offset)
+    if meta.get("sha256"):
+        h = hashlib.sha256()
+        with open(folder / "data.part", "rb") as f:
+            for block in iter(lambda: f.read(READ_SIZE), b""):
+                h.update(block)
+        if h.hexdigest() != meta["sha256"]:
+            abort(user_id, upload_id)
+            raise UploadError("File checksum mismatch, please upload again", 422)
+    os.replace(folder / "data.part", final_path)
+    return final_path, meta
+
+
+def mark_queued(upload_id, meta, task_id):
+    meta["task_id"] = task_id
+    _save(_folder(upload_id), meta)
+
+
+def abort(user_id, upload_id):
+    folder, _ = _load(user_id, upload_id)
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def remove_for_file(file_path):
+    """Delete the upload folder of a finished job's file (no-op for other paths)."""
+    folder = os.path.dirname(os.path.abspath(file_path))
+    if os.path.dirname(folder) == os.path.abspath(UPLOADS_DIR) and _ID_RE.match(os.path.basename(folder)):
+        shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,159 @@
+"""In-process cache for the per-tenant webapp_config.json files.
+
+Reads are served from memory and re-parsed only when the file's mtime/size changed
+(another process wrote it). Writes update memory at once and are flushed to disk after
+a short write-behind window, so a burst of checkbox toggles costs one atomic write.
+Use modify() for read-modify-write so concurrent requests don't overwrite each other.
+
+Several processes share the files. A flush takes the file's lock, re-reads it and
+applies only the top-level keys this process changed since it last read the file, so
+another process's write in the meantime is kept rather than overwritten.
+"""
+import atexit
+import copy
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from webapp.file_lock import locked
+
+WRITE_BEHIND_SECONDS = float(os.environ.get("SNAPSCRAP_CONFIG_FLUSH_DELAY", "0.5"))
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = None  # None = file missing
+        self.base = None  # file content our pending changes were made against
+        self.stamp = None  # (mtime_ns, size) of the file when data was read or written
+        self.dirty = False
+        self.timer = None
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
+def _merge(disk, base, local):
+    """Our changes (base -> local, per top-level key) applied on top of the file's content."""
+    merged = dict(disk or {})
+    base, local = base or {}, local or {}
+    for key in set(base) | set(local):
+        if key not in local:
+            merged.pop(key, None)
+        elif key not in base or base[key] != local[key]:
+            merged[key] = copy.deepcopy(local[key])
+    return merged
+
+
+class ConfigStore:
+    def __init__(self, delay=WRITE_BEHIND_SECONDS):
+        self.delay = delay
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, path):
+        key = os.path.abspath(str(path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            return entry
+
+    def _refresh(self, path, entry):
+        """Reload from disk if the file changed since we last saw it (caller holds entry.lock).
+
+        Pending changes of this process are kept on top of what the other process wrote.
+        """
+        stamp = _stamp(path)
+        if stamp == entry.stamp and (stamp is not None or entry.data is None or entry.dirty):
+            return
+        disk = _load(path) if stamp is not None else None
+        entry.data = _merge(disk, entry.base, entry.data) if entry.dirty else disk
+        entry.base, entry.stamp = copy.deepcopy(disk), stamp
+
+    def read(self, path, default=None):
+        """A copy of the config, or default if the file doesn't exist."""
+        entry = self._entry(path)
+        with entry.lock:
+            self._refresh(path, entry)
+            return copy.deepcopy(entry.data) if entry.data is not None else default
+
+    def write(self, path, data):
+        """Replace the whole config; flushed after the write-behind window."""
+        entry = self._entry(path)
+        with entry.lock:
+            entry.data = copy.deepcopy(data)
+            self._mark_dirty(path, entry)
+
+    @contextmanager
+    def modify(self, path):
+        """Locked read-modify-write: `with store.modify(path) as cfg: cfg[...] = ...`."""
+        entry = self._entry(path)
+        with entry.lock:
+            self._refresh(path, entry)
+            data = copy.deepcopy(entry.data) if entry.data is not None else {}
+            yield data
+            entry.data = data
+            self._mark_dirty(path, entry)
+
+    def _mark_dirty(self, path, entry):
+        entry.dirty = True
+        if self.delay <= 0:
+            self._flush_entry(path, entry)
+        elif entry.timer is None:
+            entry.timer = threading.Timer(self.delay, self.flush, args=(path,))
+            entry.timer.daemon = True
+            entry.timer.start()
+
+    def _flush_entry(self, path, entry):
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        if not entry.dirty:
+            return
+        path = str(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with locked(path):
+            self._refresh(path, entry)  # merge what other processes wrote since we read the file
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry.data if entry.data is not None else {}, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            entry.stamp = _stamp(path)
+        entry.dirty = False
+        entry.base = copy.deepcopy(entry.data)
+
+    def flush(self, path=None):
+        """Write pending changes now (one file, or all)."""
+        if path is not None:
+            entry = self._entry(path)
+            with entry.lock:
+                self._flush_entry(path, entry)
+            return
+        with self._lock:
+            items = list(self._entries.items())
+        for key, entry in items:
+            with entry.lock:
+                try:
+                    self._flush_entry(key, entry)
+                except OSError:
+                    pass
+
+
+store = ConfigStore()
+atexit.register(store.flush)
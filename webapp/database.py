@@ -0,0 +1,128 @@
+"""Database engine settings and schema upgrades.
+
+SQLite (the default snapscrap.db) is opened in WAL mode so web threads, job workers and
+the scheduler keep reading while one of them writes, and a writer waits up to
+BUSY_TIMEOUT_MS for the lock instead of failing with "database is locked". For Postgres
+(DATABASE_URL) the connection pool is sized from the environment.
+
+The schema is versioned with Flask-Migrate (migrations/). After changing models.py:
+    flask --app webapp.app:app db migrate -m "what changed"
+    flask --app webapp.app:app db upgrade      # also run by every process at startup
+"""
+import os
+import sqlite3
+import time
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+
+from webapp.youtube_service import BASE_DIR
+
+MIGRATIONS_DIR = str(BASE_DIR / "migrations")
+BASELINE_REVISION = "0001_baseline"  # schema of databases created with db.create_all() before migrations/
+BUSY_TIMEOUT_MS = int(os.environ.get("SNAPSCRAP_SQLITE_BUSY_TIMEOUT_MS", "15000"))
+POOL_SIZE = int(os.environ.get("SNAPSCRAP_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.environ.get("SNAPSCRAP_DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = int(os.environ.get("SNAPSCRAP_DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.environ.get("SNAPSCRAP_DB_POOL_RECYCLE", "1800"))  # below typical server idle timeouts
+UPGRADE_WAIT_SECONDS = 60  # how long a process waits for another one's schema upgrade
+
+# User columns added by hand-run ALTERs before the schema was versioned
+_LEGACY_USER_COLUMNS = [
+    ("subscription_tier", "VARCHAR(50) DEFAULT 'free'"),
+    ("stripe_customer_id", "VARCHAR(150)"),  # as in models.py (0005 narrows older VARCHAR(255) columns)
+    ("created_at", "DATETIME"),
+    ("is_admin", "BOOLEAN DEFAULT 0"),
+]
+_LEGACY_JOB_COLUMNS = [("run_after", "DATETIME")]
+
+
+def engine_options(db_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database."""
+    if db_url.startswith("sqlite"):
+        return {}  # per-connection settings are applied by _sqlite_pragmas
+    return {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "pool_timeout": POOL_TIMEOUT,
+            "pool_recycle": POOL_RECYCLE, "pool_pre_ping": True}
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA journal_mode = WAL")  # persistent; a no-op once the file is in WAL mode
+    cursor.execute("PRAGMA synchronous = NORMAL")  # safe with WAL, avoids an fsync per commit
+    cursor.close()
+
+
+def insert_missing(db, model, **values):
+    """INSERT the row unless its key exists, in the caller's transaction (no commit).
+
+    ON CONFLICT DO NOTHING, so a row created by another worker meanwhile is no error
+    and nothing else pending in the session is rolled back.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.session.execute(insert(model).values(**values).on_conflict_do_nothing())
+
+
+def _add_missing_columns(db, table, existing, columns):
+    for col_name, col_def in columns:
+        if col_name not in existing:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_def}"))
+            print(f"Added column {table}.{col_name}.")
+    db.session.commit()
+
+
+def _adopt_unversioned(db, tables):
+    """Bring a database made by db.create_all() (no alembic_version yet) to the baseline revision."""
+    from alembic import command
+    insp = inspect(db.engine)
+    if "user" in tables:
+        _add_missing_columns(db, "user", {c["name"] for c in insp.get_columns("user")}, _LEGACY_USER_COLUMNS)
+    if "job" in tables:
+        _add_missing_columns(db, "job", {c["name"] for c in insp.get_columns("job")}, _LEGACY_JOB_COLUMNS)
+    db.create_all()  # tables added to models.py after this database was created
+    command.stamp(_alembic_config(), BASELINE_REVISION)
+
+
+def _alembic_config():
+    from flask import current_app
+    return current_app.extensions["migrate"].migrate.get_config(MIGRATIONS_DIR)
+
+
+def _revision(db):
+    """The database's alembic revision (None before it is versioned)."""
+    if "alembic_version" not in inspect(db.engine).get_table_names():
+        return None
+    current = db.session.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    db.session.rollback()
+    return current
+
+
+def upgrade_schema(db):
+    """Apply pending migrations (inside an app context). Cheap when the schema is current."""
+    from alembic import command
+    from alembic.script import ScriptDirectory
+    head = ScriptDirectory.from_config(_alembic_config()).get_current_head()
+    if _revision(db) == head:
+        return
+    try:
+        tables = set(inspect(db.engine).get_table_names())
+        if tables and "alembic_version" not in tables:
+            _adopt_unversioned(db, tables)
+        command.upgrade(_alembic_config(), "head")
+    except Exception:
+        db.session.rollback()
+        # Several workers start together and only one upgrade succeeds. Anything else
+        # (a failing migration, a database we can't write) is raised once it is clear
+        # that no other process brings the schema to head.
+        deadline = time.monotonic() + UPGRADE_WAIT_SECONDS
+        while _revision(db) != head:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+        print("Database schema upgraded by another process.")
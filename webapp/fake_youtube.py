@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Local stand-in for the YouTube Data API, for load-testing and profiling uploads.
+
+Covers what youtube_service uses: OAuth token refresh, channels.list, videos.list
+and the videos.insert resumable upload protocol. Failures can be injected on purpose:
+403 quotaExceeded, 5xx errors and added latency.
+
+Point the app at it with:
+    SNAPSCRAP_YOUTUBE_API_URL=http://127.0.0.1:8765 python webapp/app.py
+Run it standalone:
+    python -m webapp.fake_youtube --port 8765 --error-rate 0.05 --latency-ms 50
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+UPLOAD_QUOTA_COST = 1600
+LIST_QUOTA_COST = 1
+
+
+class FakeYouTubeState:
+    """Fault settings, per-client quota and request counters shared by all handler threads."""
+
+    def __init__(self, quota_error_rate=0.0, server_error_rate=0.0, latency_ms=0, quota_per_client=0, processing_seconds=5, seed=None):
+        self.quota_error_rate = quota_error_rate
+        self.server_error_rate = server_error_rate
+        self.latency_ms = latency_ms
+        self.quota_per_client = quota_per_client  # 0 = unlimited
+        self.processing_seconds = processing_seconds  # uploaded videos report "processing" this long
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = {}  # access_token -> client_id
+        self.quota_used = {}  # client_id -> units
+        self.sessions = {}  # upload_id -> {client_id, body, total, received}
+        self.videos = {}  # video_id -> resource
+        self.stats = {
+            "token_refreshes": 0,
+            "channels_list": 0,
+            "videos_list": 0,
+            "upload_sessions": 0,
+            "upload_chunks": 0,
+            "resume_queries": 0,
+            "uploads_completed": 0,
+            "bytes_received": 0,
+            "injected_quota_errors": 0,
+            "injected_server_errors": 0,
+            "uploads_by_client": {},
+        }
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def snapshot(self):
+        with self.lock:
+            data = json.loads(json.dumps(self.stats))
+            data["quota_used"] = dict(self.quota_used)
+            return data
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def charge(self, client_id, units):
+        """Charge quota; False if this client's daily quota is exhausted."""
+        with self.lock:
+            used = self.quota_used.get(client_id, 0)
+            if self.quota_per_client and used + units > self.quota_per_client:
+                return False
+            self.quota_used[client_id] = used + units
+            return True
+
+
+def _error_body(code, message, reason, domain="youtube"):
+    return {"error": {"code": code, "message": message, "errors": [{"message": message, "domain": domain, "reason": reason}]}}
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeYouTube/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    # --- helpers ---
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_empty(self, status, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _client_id(self):
+        auth = self.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        with self.state.lock:
+            return self.state.tokens.get(token)
+
+    def _inject_faults(self, quota_check=False):
+        """Apply latency and random failures. Returns True if an error response was sent."""
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000.0)
+        if quota_check and self.state.roll(self.state.quota_error_rate):
+            self.state.count("injected_quota_errors")
+            self._send_json(403, _error_body(403, "The request cannot be completed because you have exceeded your quota.", "quotaExceeded", "youtube.quota"))
+            return True
+        if self.state.roll(self.state.server_error_rate):
+            self.state.count("injected_server_errors")
+            self._send_json(503, _error_body(503, "The service is currently unavailable.", "backendError", "global"))
+            return True
+        return False
+
+    def _require_client(self):
+        client_id = self._client_id()
+        if not client_id:
+            self._send_json(401, _error_body(401, "Request had invalid authentication credentials.", "authError", "global"))
+        return client_id
+
+    def _quota_exceeded(self):
+        self._send_json(403, _error_body(403, "The request cannot be completed because you have exceeded your quota.", "quotaExceeded", "youtube.quota"))
+
+    # --- routes ---
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/_stats":
+            return self._send_json(200, self.state.snapshot())
+        if url.path == "/youtube/v3/channels":
+            return self._channels_list(query)
+        if url.path == "/youtube/v3/videos":
+            return self._videos_list(query)
+        self._send_json(404, _error_body(404, "Not found", "notFound"))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/token":
+            return self._token_refresh()
+        if url.path == "/_config":
+            return self._update_config()
+        if url.path == "/upload/youtube/v3/videos" and query.get("uploadType") == ["resumable"]:
+            return self._upload_start(query)
+        self._send_json(404, _error_body(404, "Not found", "notFound"))
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/upload/youtube/v3/videos" and "upload_id" in query:
+            return self._upload_chunk(query["upload_id"][0])
+        self._send_json(404, _error_body(404, "Not found", "notFound"))
+
+    def _token_refresh(self):
+        form = parse_qs(self._read_body().decode("utf-8"))
+        if self._inject_faults():
+            return
+        client_id = (form.get("client_id") or ["unknown"])[0]
+        if not form.get("refresh_token"):
+            return self._send_json(400, {"error": "invalid_grant", "error_description": "Missing refresh token"})
+        token = f"fake.{client_id}.{uuid.uuid4().hex}"
+        with self.state.lock:
+            self.state.tokens[token] = client_id
+            self.state.stats["token_refreshes"] += 1
+        self._send_json(200, {"access_token": token, "expires_in": 3600, "token_type": "Bearer", "scope": " ".join(self.server.scopes)})
+
+    def _update_config(self):
+        cfg = json.loads(self._read_body() or b"{}")
+        with self.state.lock:
+            for key in ("quota_error_rate", "server_error_rate", "latency_ms", "quota_per_client", "processing_seconds"):
+                if key in cfg:
+                    setattr(self.state, key, cfg[key])
+        self._send_json(200, {"ok": True})
+
+    def _channels_list(self, query):
+        client_id = self._require_client()
+        if not client_id or self._inject_faults():
+            return
+        if not self.state.charge(client_id, LIST_QUOTA_COST):
+            return self._quota_exceeded()
+        self.state.count("channels_list")
+        if query.get("mine") == ["true"]:
+            # stable across runs and processes (str hash() is salted per process)
+            ids = ["UC" + hashlib.sha256(client_id.encode("utf-8")).hexdigest()[:22]]
+        else:
+            ids = [i for i in ",".join(query.get("id", [])).split(",") if i]
+        items = [{"kind": "youtube#channel", "id": ch_id, "snippet": {"title": f"Fake channel {ch_id}"}} for ch_id in ids]
+        self._send_json(200, {"kind": "youtube#channelListResponse", "items": items, "pageInfo": {"totalResults": len(items)}})
+
+    def _videos_list(self, query):
+        client_id = self._require_client()
+        if not client_id or self._inject_faults():
+            return
+        if not self.state.charge(client_id, LIST_QUOTA_COST):
+            return self._quota_exceeded()
+        self.state.count("videos_list")
+        ids = [i for i in ",".join(query.get("id", [])).split(",") if i]
+        now = time.time()
+        items = []
+        with self.state.lock:
+            for video_id in ids:
+                video = self.state.videos.get(video_id)
+                if not video:
+                    continue
+                done = now - video["_uploaded_at"] >= self.state.processing_seconds
+                items.append({
+                    "kind": "youtube#video",
+                    "id": video_id,
+                    "status": {
+                        "uploadStatus": "processed" if done else "uploaded",
+                        "privacyStatus": video.get("status", {}).get("privacyStatus", "private"),
+                    },
+                    "processingDetails": {"processingStatus": "succeeded" if done else "processing"},
+                })
+        self._send_json(200, {"kind": "youtube#videoListResponse", "items": items, "pageInfo": {"totalResults": len(items)}})
+
+    def _upload_start(self, query):
+        client_id = self._require_client()
+        body = self._read_body()
+        if not client_id or self._inject_faults(quota_check=True):
+            return
+        if not self.state.charge(client_id, UPLOAD_QUOTA_COST):
+            return self._quota_exceeded()
+        upload_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.sessions[upload_id] = {
+                "client_id": client_id,
+                "resource": json.loads(body or b"{}"),
+                "total": int(self.headers.get("X-Upload-Content-Length") or -1),
+                "received": 0,
+            }
+            self.state.stats["upload_sessions"] += 1
+        host = self.headers.get("Host", "127.0.0.1")
+        location = f"http://{host}/upload/youtube/v3/videos?uploadType=resumable&upload_id={upload_id}"
+        self._send_empty(200, {"Location": location})
+
+    def _upload_chunk(self, upload_id):
+        with self.state.lock:
+            session = self.state.sessions.get(upload_id)
+        data = self._read_body()
+        if session is None:
+            return self._send_json(404, _error_body(404, "Upload session not found", "notFound"))
+        if self._inject_faults():
+            return
+        # Content-Range: "bytes 0-1048575/5242880" or a status query "bytes */5242880"
+        content_range = self.headers.get("Content-Range", "")
+        spec, _, total = content_range.replace("bytes ", "").partition("/")
+        if total and total != "*":
+            session["total"] = int(total)
+        if spec == "*":
+            self.state.count("resume_queries")
+        if spec != "*" and data:
+            start = int(spec.split("-")[0])
+            if start != session["received"]:
+                return self._send_empty(308, {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else None)
+            session["received"] += len(data)
+            self.state.count("upload_chunks")
+            self.state.count("bytes_received", len(data))
+        if session["total"] >= 0 and session["received"] >= session["total"]:
+            return self._upload_finish(upload_id, session)
+        headers = {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else None
+        self._send_empty(308, headers)
+
+    def _upload_finish(self, upload_id, session):
+        video_id = uuid.uuid4().hex[:11]
+        resource = dict(session["resource"])
+        resource.update({"kind": "youtube#video", "id": video_id})
+        resource.setdefault("status", {})["uploadStatus"] = "uploaded"
+        with self.state.lock:
+            self.state.sessions.pop(upload_id, None)
+            self.state.videos[video_id] = dict(resource, _uploaded_at=time.time())
+            self.state.stats["uploads_completed"] += 1
+            by_client = self.state.stats["uploads_by_client"]
+            by_client[session["client_id"]] = by_client.get(session["client_id"], 0) + 1
+        self._send_json(200, resource)
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """Start the fake API in a background thread. Returns (server, base_url)."""
+    from webapp.youtube_service import SCOPES
+
+    server = ThreadingHTTPServer((host, port), FakeYouTubeHandler)
+    server.daemon_threads = True
+    server.state = FakeYouTubeState(**settings)
+    server.scopes = SCOPES
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake YouTube Data API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="probability of a 403 quotaExceeded on videos.insert")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 on any API request")
+    parser.add_argument("--latency-ms", type=int, default=0, help="latency added to every request")
+    parser.add_argument("--quota-per-client", type=int, default=0, help="quota units per OAuth client (0 = unlimited)")
+    parser.add_argument("--processing-seconds", type=float, default=5, help="how long uploaded videos stay \"processing\"")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server, url = start_server(
+        args.host, args.port,
+        quota_error_rate=args.quota_rate, server_error_rate=args.error_rate,
+        latency_ms=args.latency_ms, quota_per_client=args.quota_per_client,
+        processing_seconds=args.processing_seconds, seed=args.seed,
+    )
+    print(f"Fake YouTube API listening on {url}")
+    print(f"Use: SNAPSCRAP_YOUTUBE_API_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Cross-process file locks for state files and periodic work shared by several processes.
+
+The web server runs several worker processes next to worker.py and daily_automation.py,
+so a threading.Lock only guards one of them. locked(path) holds an exclusive lock on
+<path>.lock (fcntl, or msvcrt on Windows) around a load / modify / replace of the file;
+claim_turn(stamp, seconds) lets one process per interval run a periodic task.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def locked(path):
+    """Exclusive lock on <path>.lock, waited for; also excludes other threads of this process."""
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10s; keep waiting
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def claim_turn(stamp, seconds):
+    """True for the one process whose turn it is: the stamp file was touched `seconds` ago or more.
+
+    The mtime check and the touch happen under the stamp's lock, so two processes
+    waking up together never both win.
+    """
+    with locked(stamp):
+        try:
+            if time.time() - os.path.getmtime(stamp) < seconds:
+                return False
+        except OSError:
+            pass
+        with open(stamp, "a"):
+            pass
+        os.utime(stamp)
+        return True
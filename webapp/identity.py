@@ -0,0 +1,49 @@
+"""Short-lived cache of logged-in users for Flask-Login's user_loader.
+
+The dashboard polls task and folder endpoints every few seconds, and each request used to
+load its User row. Column values are kept per process for IDENTITY_TTL seconds and
+merged into the request's session without a query. Changes to a User made in this
+process (tier, admin, deletion) drop its entry at once; other processes see them once
+the TTL runs out.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from webapp.models import db, User
+
+IDENTITY_TTL = float(os.environ.get("SNAPSCRAP_IDENTITY_TTL", "30"))
+
+_cache = {}  # user id -> (expires_at, {column: value})
+_lock = threading.Lock()
+
+
+def invalidate(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def load(user_id):
+    """User with that id attached to the current session, or None."""
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(user_id)
+    if hit and hit[0] > now:
+        user = User(**hit[1])
+        make_transient_to_detached(user)  # looks freshly loaded: no pending changes to flush
+        return db.session.merge(user, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None and IDENTITY_TTL > 0:
+        values = {c.key: getattr(user, c.key) for c in User.__table__.columns}
+        with _lock:
+            _cache[user_id] = (now + IDENTITY_TTL, values)
+    return user
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate(target.id)
@@ -0,0 +1,246 @@
+"""Storage janitor: retention per subscription tier and cleanup before the disk fills.
+
+Every JANITOR_SECONDS one web process (whichever claims the run first):
+  1. deletes temp files and abandoned chunked uploads in uploads/ that no queued
+     upload still needs,
+  2. applies the tier's retention to each library folder: raw clips, merged videos not
+     uploaded yet, and the uploaded_youtube/ archive each have their own age limit,
+  3. trims tenants over their tier's storage quota, oldest folders first,
+  4. if free disk is below MIN_FREE, reclaims across all tenants until TARGET_FREE,
+  5. collects media blobs nothing links to any more.
+Per-tenant usage comes from StorageUsage, which library.refresh() keeps current, so none
+of this walks the whole stories/ tree.
+
+    python -m webapp.janitor        # one sweep now
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date, timedelta
+
+from webapp import library
+from webapp.file_lock import claim_turn
+from webapp.models import db, Job, LibraryEntry, StorageUsage, User
+from webapp.youtube_service import BASE_DIR, MERGED_DIR
+
+JANITOR_SECONDS = int(os.environ.get("SNAPSCRAP_JANITOR_INTERVAL", "900"))
+MIN_FREE = float(os.environ.get("SNAPSCRAP_MIN_FREE_DISK", "0.10"))  # fraction of the disk
+TARGET_FREE = float(os.environ.get("SNAPSCRAP_TARGET_FREE_DISK", "0.15"))
+TEMP_MAX_AGE = int(os.environ.get("SNAPSCRAP_TEMP_MAX_AGE", str(24 * 3600)))
+UPLOADS_DIR = BASE_DIR / "uploads"
+STAMP_FILE = BASE_DIR / "stories" / "_shared" / ".janitor_last_run"
+RAW_EXTENSIONS = (".mp4", ".jpeg", ".jpg", ".png", ".bin")
+
+# Days to keep each kind of file, counted from the folder's date; quota in bytes (None = unlimited)
+STORAGE_POLICIES = {
+    "free": {"raw_days": 3, "merged_days": 14, "uploaded_days": 2, "quota": 2 * 1024 ** 3},
+    "pro": {"raw_days": 7, "merged_days": 30, "uploaded_days": 7, "quota": 50 * 1024 ** 3},
+    "enterprise": {"raw_days": 30, "merged_days": 90, "uploaded_days": 30, "quota": None},
+}
+# What goes first when space must be reclaimed; merged videos not uploaded yet only under disk pressure
+QUOTA_ORDER = ("uploaded", "raw")
+PRESSURE_ORDER = ("uploaded", "raw", "merged")
+
+
+def storage_policy(tier):
+    return STORAGE_POLICIES.get(tier, STORAGE_POLICIES["free"])
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _delete_kind(folder, kind):
+    """Delete one kind of file from a library date folder."""
+    merged = folder / MERGED_DIR
+    if kind == "uploaded":
+        shutil.rmtree(merged / library.ARCHIVE_DIR, ignore_errors=True)
+    elif kind == "merged":
+        for path in merged.glob("merged_*.mp4"):
+            _unlink(path)
+    elif kind == "raw":
+        for path in folder.iterdir():
+            if path.is_file() and path.suffix.lower() in RAW_EXTENSIONS:
+                _unlink(path)
+
+
+def _prune_empty(folder):
+    """Remove the date folder when nothing but bookkeeping files is left."""
+    for root, _, names in os.walk(folder):
+        if any(name != "downloaded_stories.json" and not name.endswith(".txt") for name in names):
+            return
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def _clean(entry, kinds):
+    """Delete kinds from an entry's folder and re-index it. Returns bytes released."""
+    before = entry.total_bytes
+    user_id, username, date_str = entry.user_id, entry.username, entry.date_str
+    folder = library.folder_path(user_id, username, date_str)
+    for kind in kinds:
+        _delete_kind(folder, kind)
+    _prune_empty(folder)
+    refreshed = library.refresh(user_id, username, date_str)
+    return before - (refreshed.total_bytes if refreshed else 0)
+
+
+def clean_temp(now=None):
+    """Delete old files in uploads/ and abandoned chunked uploads, unless a pending or
+    running upload job still uses them. Returns bytes released."""
+    from webapp import chunked_upload
+    now = now or time.time()
+    if not UPLOADS_DIR.is_dir():
+        return 0
+    in_use = set()
+    for (params,) in db.session.query(Job.params).filter(Job.job_type == "upload_file", Job.status.in_(("pending", "running"))):
+        try:
+            in_use.add(os.path.abspath(json.loads(params).get("file_path") or ""))
+        except ValueError:
+            pass
+    freed = 0
+    for entry in os.scandir(UPLOADS_DIR):
+        if not entry.is_file() or os.path.abspath(entry.path) in in_use:
+            continue
+        st = entry.stat()
+        if now - st.st_mtime > TEMP_MAX_AGE:
+            _unlink(entry.path)
+            freed += st.st_size
+    if chunked_upload.UPLOADS_DIR.is_dir():
+        for folder in os.scandir(chunked_upload.UPLOADS_DIR):
+            files = [f for f in os.scandir(folder.path) if f.is_file()] if folder.is_dir() else []
+            if any(os.path.abspath(f.path) in in_use for f in files):
+                continue
+            stats = [f.stat() for f in files]
+            if not stats or now - max(st.st_mtime for st in stats) > TEMP_MAX_AGE:
+                shutil.rmtree(folder.path, ignore_errors=True)
+                freed += sum(st.st_size for st in stats)
+    return freed
+
+
+def _tiers():
+    """{user_id: tier} of users that have anything stored."""
+    return dict(db.session.query(User.id, User.subscription_tier).join(
+        StorageUsage, StorageUsage.user_id == User.id).filter(StorageUsage.bytes > 0).all())
+
+
+def apply_retention(today=None):
+    """Age-based cleanup of every tenant's library. Returns bytes released."""
+    today = today or date.today()
+    freed = 0
+    for user_id, tier in _tiers().items():
+        policy = storage_policy(tier)
+        oldest_kept = min(policy["raw_days"], policy["merged_days"], policy["uploaded_days"])
+        cutoff = (today - timedelta(days=oldest_kept)).isoformat()
+        for entry in LibraryEntry.query.filter(LibraryEntry.user_id == user_id, LibraryEntry.date_str < cutoff).all():
+            try:
+                age = (today - date.fromisoformat(entry.date_str)).days
+            except ValueError:
+                continue
+            kinds = [kind for kind in ("raw", "merged", "uploaded") if age > policy[f"{kind}_days"]]
+            if kinds:
+                freed += _clean(entry, kinds)
+    return freed
+
+
+def _reclaim(entries, need, kinds):
+    """Clean entries (oldest first) until need bytes are released."""
+    freed = 0
+    for entry in entries:
+        if freed >= need:
+            break
+        freed += _clean(entry, kinds)
+    return freed
+
+
+def enforce_quotas():
+    """Trim tenants above their tier's quota. Returns bytes released."""
+    tiers = _tiers()
+    freed = 0
+    for usage in StorageUsage.query.filter(StorageUsage.bytes > 0).all():
+        quota = storage_policy(tiers.get(usage.user_id)).get("quota")
+        if quota is None or usage.bytes <= quota:
+            continue
+        entries = LibraryEntry.query.filter_by(user_id=usage.user_id).order_by(LibraryEntry.date_str).all()
+        freed += _reclaim(entries, usage.bytes - quota, QUOTA_ORDER)
+    return freed
+
+
+def disk_status(path=None):
+    total, used, free = shutil.disk_usage(path or BASE_DIR)
+    return {"total": total, "used": used, "free": free, "free_fraction": free / total if total else 1.0}
+
+
+def relieve_pressure():
+    """Reclaim space across all tenants when the disk is nearly full. Returns bytes released."""
+    import blob_store
+    disk = disk_status()
+    if disk["free_fraction"] >= MIN_FREE:
+        return 0
+    need = int(TARGET_FREE * disk["total"]) - disk["free"]
+    freed = 0
+    for kind in PRESSURE_ORDER:
+        entries = LibraryEntry.query.order_by(LibraryEntry.date_str, LibraryEntry.user_id).all()
+        freed += _reclaim(entries, need - freed, (kind,))
+        blob_store.gc()  # shared media only frees space once no tenant links to it
+        if disk_status()["free"] >= int(TARGET_FREE * disk["total"]):
+            break
+    return freed
+
+
+def sweep():
+    """One janitor pass. Returns {step: bytes released}."""
+    import blob_store
+    report = {
+        "temp": clean_temp(),
+        "retention": apply_retention(),
+        "quota": enforce_quotas(),
+        "pressure": relieve_pressure(),
+    }
+    report["blobs"] = blob_store.gc()[1]
+    return report
+
+
+def usage_report(limit=None):
+    """[{user_id, username, tier, bytes, quota, percent}] of users storing anything, largest first."""
+    rows = db.session.query(User.id, User.username, User.subscription_tier, StorageUsage.bytes).join(
+        StorageUsage, StorageUsage.user_id == User.id).filter(StorageUsage.bytes > 0).order_by(
+        StorageUsage.bytes.desc()).limit(limit).all()
+    report = []
+    for user_id, username, tier, used in rows:
+        quota = storage_policy(tier).get("quota")
+        used = used or 0
+        report.append({"user_id": user_id, "username": username, "tier": tier or "free", "bytes": used,
+                       "quota": quota, "percent": 100.0 * used / quota if quota else None})
+    return report
+
+
+def janitor_loop(app):
+    while True:
+        time.sleep(JANITOR_SECONDS)
+        try:
+            with app.app_context():
+                if claim_turn(STAMP_FILE, JANITOR_SECONDS):
+                    sweep()
+                db.session.remove()
+        except Exception:
+            app.logger.exception("Storage janitor sweep failed")
+
+
+def start_janitor(app):
+    threading.Thread(target=janitor_loop, args=(app,), daemon=True).start()
+
+
+def main():
+    from webapp.app import app
+    with app.app_context():
+        report = sweep()
+    print(", ".join(f"{step}: {freed / 1024 / 1024:.1f} MB" for step, freed in report.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""Durable job queue backed by the app database.
+
+Web requests enqueue jobs; workers (threads inside the web process, or separate
+`python worker.py` processes) claim them with a lease, run them and store the
+status the browser polls. A job whose worker died is picked up again when its
+lease expires, up to max_attempts.
+
+Tenants share the workers by weighted fair queuing: the next job comes from the tenant
+with the least running work per unit of its tier's weight, within per-tier caps on
+running/queued jobs and daily encode-time and bandwidth budgets.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from webapp import user_stats
+from webapp.models import db, Counter, Job, TenantUsage, User
+
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 20
+POLL_SECONDS = 2
+FINISHED_STATUSES = ("done", "error")
+
+# Separate bounded pools: network-bound jobs can overlap freely, while ffmpeg encodes
+# (which use every core on their own) are limited so they cannot starve the web threads.
+POOLS = {
+    "network": {
+        "types": ("download", "download_batch", "upload", "upload_file", "upload_all", "enrich"),
+        "threads": int(os.environ.get("SNAPSCRAP_NETWORK_THREADS", "4")),
+    },
+    "cpu": {
+        "types": ("merge",),
+        "threads": int(os.environ.get("SNAPSCRAP_CPU_THREADS", str(max(1, (os.cpu_count() or 2) // 4)))),
+    },
+}
+DEFAULT_POOL = "network"
+# Pending jobs allowed per pool before new requests are rejected (HTTP 429)
+MAX_QUEUED = int(os.environ.get("SNAPSCRAP_MAX_QUEUED", "50"))
+
+# Finished jobs are deleted after this many seconds; messages keep only their tail
+# (the end of a SnapScrap/ffmpeg log is where the error is).
+FINISHED_TTL = int(os.environ.get("SNAPSCRAP_JOB_TTL", str(24 * 3600)))
+MAX_MESSAGE_CHARS = int(os.environ.get("SNAPSCRAP_JOB_MESSAGE_CHARS", "4000"))
+EVICT_EVERY = 300  # seconds between eviction passes of a worker
+EVICT_BATCH = 500
+EVICTED_COUNTER = "jobs_evicted"
+# Optional JSON-lines file that keeps a one-line summary of every evicted job
+ARCHIVE_FILE = os.environ.get("SNAPSCRAP_JOB_ARCHIVE", "")
+
+
+# Per subscription tier: scheduling weight, jobs running / queued at once, and daily budgets
+# of encode (merge) seconds and transferred bytes (None = unlimited). Jobs without a user
+# (system work) use "system"; unknown tiers are treated as free.
+TIER_POLICIES = {
+    "free": {"weight": 1, "max_running": 1, "max_queued": 10, "encode_seconds": 30 * 60, "bytes": 2 * 1024 ** 3},
+    "pro": {"weight": 4, "max_running": 3, "max_queued": 50, "encode_seconds": 4 * 3600, "bytes": 20 * 1024 ** 3},
+    "enterprise": {"weight": 10, "max_running": 8, "max_queued": 200, "encode_seconds": None, "bytes": None},
+    "system": {"weight": 4, "max_running": 4, "max_queued": 50, "encode_seconds": None, "bytes": None},
+}
+
+
+class QueueFull(Exception):
+    """Raised by enqueue() when the job's pool already has MAX_QUEUED pending jobs."""
+
+
+_wakeup = threading.Event()  # set by enqueue() so a worker in the same process starts at once
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def pool_for(job_type):
+    for name, pool in POOLS.items():
+        if job_type in pool["types"]:
+            return name
+    return DEFAULT_POOL
+
+
+def pending_count(pool_name, before=None):
+    """Pending jobs in a pool (optionally only those created before a time)."""
+    query = Job.query.filter(Job.status == "pending", Job.job_type.in_(POOLS[pool_name]["types"]))
+    if before is not None:
+        query = query.filter(Job.created_at < before)
+    return query.count()
+
+
+def tier_policy(tier):
+    return TIER_POLICIES.get(tier, TIER_POLICIES["free"])
+
+
+def _tenant_tiers(user_ids):
+    ids = [uid for uid in user_ids if uid]
+    tiers = dict(db.session.query(User.id, User.subscription_tier).filter(User.id.in_(ids)).all()) if ids else {}
+    return {uid: (tiers.get(uid) or "free") if uid else "system" for uid in user_ids}
+
+
+def _usage_today(user_ids):
+    ids = [uid for uid in user_ids if uid]
+    if not ids:
+        return {}
+    rows = TenantUsage.query.filter(TenantUsage.user_id.in_(ids), TenantUsage.day == datetime.utcnow().date()).all()
+    return {row.user_id: row for row in rows}
+
+
+def over_budget(policy, usage, pool_name):
+    """True if today's usage reached the tier's budget for this pool's resource."""
+    if usage is None:
+        return False
+    if pool_name == "cpu":
+        limit, used = policy["encode_seconds"], usage.encode_seconds
+    else:
+        limit, used = policy["bytes"], usage.bytes_transferred
+    return limit is not None and used >= limit
+
+
+def record_usage(user_id, encode_seconds=0, bytes_transferred=0, jobs_run=0, uploads=0):
+    """Add to a tenant's usage for today (and to its all-time job / upload counters)."""
+    if not user_id:
+        return
+    day = datetime.utcnow().date()
+    fields = {
+        TenantUsage.encode_seconds: TenantUsage.encode_seconds + encode_seconds,
+        TenantUsage.bytes_transferred: TenantUsage.bytes_transferred + int(bytes_transferred),
+        TenantUsage.jobs_run: TenantUsage.jobs_run + jobs_run,
+    }
+    if TenantUsage.query.filter_by(user_id=user_id, day=day).update(fields, synchronize_session=False) == 0:
+        db.session.add(TenantUsage(user_id=user_id, day=day, encode_seconds=encode_seconds,
+                                   bytes_transferred=int(bytes_transferred), jobs_run=jobs_run))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # created by another worker meanwhile
+            TenantUsage.query.filter_by(user_id=user_id, day=day).update(fields, synchronize_session=False)
+    db.session.commit()
+    user_stats.add(user_id, jobs_run=jobs_run, uploads=uploads)
+    db.session.commit()
+
+
+def enqueue(job_id, job_type, user_id=None, max_attempts=3, run_after=None, **params):
+    """Add a job (not started before run_after, UTC). Returns False if a job with this id
+    already exists; raises QueueFull under backpressure."""
+    if pending_count(pool_for(job_type)) >= MAX_QUEUED:
+        raise QueueFull(f"Too many queued {pool_for(job_type)} jobs, try again in a few minutes")
+    tier = _tenant_tiers([user_id or None])[user_id or None]
+    queued = Job.query.filter(Job.status == "pending", Job.user_id == (user_id or None)).count() if user_id else 0
+    if user_id and queued >= tier_policy(tier)["max_queued"]:
+        raise QueueFull(f"You already have {queued} queued jobs (limit of the {tier} plan), try again when some finish")
+    job = Job(
+        id=job_id,
+        user_id=user_id or None,
+        job_type=job_type,
+        params=json.dumps(params, ensure_ascii=False),
+        status="pending",
+        message="Starting...",
+        max_attempts=max_attempts,
+        run_after=run_after,
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    _wakeup.set()
+    return True
+
+
+def _visible(job, user_id, is_admin):
+    """user_id=None means no filter; system jobs (no user) are shown to admins only."""
+    if user_id is None:
+        return True
+    return job.user_id == user_id or (job.user_id is None and is_admin)
+
+
+def _task_view(job, user_id=None, is_admin=False):
+    if not job or not _visible(job, user_id, is_admin):
+        return {"status": "unknown"}
+    if job.status == "pending":
+        position = pending_count(pool_for(job.job_type), before=job.created_at) + 1
+        return {"status": "pending", "message": f"Queued, position {position}", "position": position}
+    return {"status": job.status, "message": job.message or ""}
+
+
+def get_task(job_id, user_id=None, is_admin=False):
+    """Task status as the browser sees it: {status, message}."""
+    return _task_view(db.session.get(Job, job_id), user_id, is_admin)
+
+
+def get_tasks(job_ids, user_id=None, is_admin=False):
+    """{job_id: status} for several tasks with a single query."""
+    found = {job.id: job for job in Job.query.filter(Job.id.in_(list(job_ids))).all()} if job_ids else {}
+    return {job_id: _task_view(found.get(job_id), user_id, is_admin) for job_id in job_ids}
+
+
+def update(job_id, status=None, message=None, result=None):
+    """Record progress or the outcome of a job."""
+    fields = {Job.updated_at: datetime.utcnow()}
+    if status is not None:
+        fields[Job.status] = status
+        if status in FINISHED_STATUSES:
+            fields[Job.lease_expires_at] = None
+    if message is not None:
+        fields[Job.message] = _cap_message(message)
+    if result is not None:
+        fields[Job.result] = json.dumps(result, ensure_ascii=False)
+    Job.query.filter(Job.id == job_id).update(fields, synchronize_session=False)
+    db.session.commit()
+
+
+def _cap_message(message):
+    if len(message) <= MAX_MESSAGE_CHARS:
+        return message
+    return "..." + message[-(MAX_MESSAGE_CHARS - 3):]
+
+
+def _archive(jobs_done):
+    with open(ARCHIVE_FILE, "a", encoding="utf-8") as f:
+        for job in jobs_done:
+            f.write(json.dumps({
+                "id": job.id,
+                "user_id": job.user_id,
+                "job_type": job.job_type,
+                "status": job.status,
+                "message": (job.message or "")[-200:],
+                "attempts": job.attempts,
+                "created_at": job.created_at.isoformat(timespec="seconds") if job.created_at else None,
+                "finished_at": job.updated_at.isoformat(timespec="seconds") if job.updated_at else None,
+            }, ensure_ascii=False) + "\n")
+
+
+def _ensure_counter(name):
+    if db.session.get(Counter, name) is None:
+        db.session.add(Counter(name=name, value=0))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # created by another worker meanwhile
+
+
+def evict_finished(ttl=None):
+    """Delete finished jobs older than ttl seconds (archiving a summary if enabled). Returns count."""
+    cutoff = datetime.utcnow() - timedelta(seconds=FINISHED_TTL if ttl is None else ttl)
+    total = 0
+    while True:
+        expired = Job.query.filter(Job.status.in_(FINISHED_STATUSES), Job.updated_at < cutoff).limit(EVICT_BATCH).all()
+        if not expired:
+            break
+        if ARCHIVE_FILE:
+            _archive(expired)
+        ids = [job.id for job in expired]
+        _ensure_counter(EVICTED_COUNTER)
+        deleted = Job.query.filter(Job.id.in_(ids), Job.status.in_(FINISHED_STATUSES)).delete(synchronize_session=False)
+        Counter.query.filter_by(name=EVICTED_COUNTER).update({Counter.value: Counter.value + deleted},
+                                                             synchronize_session=False)
+        db.session.commit()
+        total += deleted
+        if len(expired) < EVICT_BATCH:
+            break
+    return total
+
+
+def stats():
+    """Counts for the admin page: live (pending/running), finished, evicted (all time, by every process)."""
+    live = Job.query.filter(Job.status.in_(("pending", "running"))).count()
+    finished = Job.query.filter(Job.status.in_(FINISHED_STATUSES)).count()
+    evicted = db.session.query(Counter.value).filter_by(name=EVICTED_COUNTER).scalar() or 0
+    return {"live": live, "finished": finished, "evicted": evicted}
+
+
+def _runnable(now, job_types=None):
+    """Filter: pending and due, or running with an expired lease."""
+    condition = or_(
+        and_(Job.status == "pending", or_(Job.run_after.is_(None), Job.run_after <= now)),
+        and_(Job.status == "running", Job.lease_expires_at < now),
+    )
+    if job_types:
+        condition = and_(condition, Job.job_type.in_(job_types))
+    return condition
+
+
+def running_by_tenant(now=None):
+    now = now or datetime.utcnow()
+    return dict(db.session.query(Job.user_id, func.count(Job.id))
+                .filter(Job.status == "running", Job.lease_expires_at >= now).group_by(Job.user_id).all())
+
+
+def claim(worker_id, job_types=None):
+    """Lease a runnable job, choosing the tenant by weighted fair share."""
+    now = datetime.utcnow()
+    # Oldest runnable job per tenant: one row per tenant however long its queue is
+    heads = db.session.query(Job.user_id, func.min(Job.created_at)).filter(_runnable(now, job_types)) \
+        .group_by(Job.user_id).all()
+    if not heads:
+        return None
+    user_ids = [uid for uid, _ in heads]
+    tiers = _tenant_tiers(user_ids)
+    usage = _usage_today(user_ids)
+    running = running_by_tenant(now)
+    pool_name = pool_for(job_types[0]) if job_types else DEFAULT_POOL
+    ranked = []
+    for uid, oldest in heads:
+        policy = tier_policy(tiers[uid])
+        active = running.get(uid, 0)
+        if active >= policy["max_running"] or over_budget(policy, usage.get(uid), pool_name):
+            continue
+        ranked.append((active / policy["weight"], -policy["weight"], oldest, uid))
+    for _, _, _, uid in sorted(ranked, key=lambda r: r[:3]):
+        job = _claim_for_tenant(worker_id, now, job_types, uid)
+        if job:
+            return job
+    return None
+
+
+def _claim_for_tenant(worker_id, now, job_types, user_id):
+    """Lease the oldest runnable job of one tenant."""
+    query = Job.query.filter(_runnable(now, job_types), Job.user_id.is_(None) if user_id is None else Job.user_id == user_id)
+    for job in query.order_by(Job.created_at).limit(20).all():
+        if job.status == "running" and job.attempts >= job.max_attempts:
+            Job.query.filter(Job.id == job.id, Job.attempts == job.attempts, Job.status == "running").update(
+                {Job.status: "error", Job.message: "Interrupted too many times", Job.lease_expires_at: None},
+                synchronize_session=False,
+            )
+            db.session.commit()
+            continue
+        resumed = job.status == "running"
+        # attempts works as a version number: only one worker can move it from N to N+1
+        claimed = Job.query.filter(Job.id == job.id, Job.attempts == job.attempts, Job.status == job.status).update({
+            Job.status: "running",
+            Job.attempts: job.attempts + 1,
+            Job.lease_owner: worker_id,
+            Job.lease_expires_at: now + timedelta(seconds=LEASE_SECONDS),
+            Job.message: "Resuming after interruption..." if resumed else job.message,
+            Job.updated_at: now,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            db.session.refresh(job)
+            return job
+    return None
+
+
+def tenant_shares():
+    """Per-tenant scheduling state for the admin page, busiest first."""
+    now = datetime.utcnow()
+    running = running_by_tenant(now)
+    pending = dict(db.session.query(Job.user_id, func.count(Job.id)).filter(Job.status == "pending")
+                   .group_by(Job.user_id).all())
+    user_ids = list(set(running) | set(pending))
+    tiers = _tenant_tiers(user_ids)
+    usage = _usage_today(user_ids)
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_([u for u in user_ids if u])).all())
+    total_running = sum(running.values())
+    total_weight = sum(tier_policy(tiers[uid])["weight"] for uid in user_ids) or 1
+    rows = []
+    for uid in user_ids:
+        policy = tier_policy(tiers[uid])
+        today = usage.get(uid)
+        rows.append({
+            "user_id": uid,
+            "username": names.get(uid, "system") if uid else "system",
+            "tier": tiers[uid],
+            "weight": policy["weight"],
+            "running": running.get(uid, 0),
+            "max_running": policy["max_running"],
+            "pending": pending.get(uid, 0),
+            "share": 100.0 * running.get(uid, 0) / total_running if total_running else 0.0,
+            "fair_share": 100.0 * policy["weight"] / total_weight,
+            "encode_minutes": (today.encode_seconds / 60) if today else 0.0,
+            "gb": (today.bytes_transferred / 1024 ** 3) if today else 0.0,
+        })
+    return sorted(rows, key=lambda r: (-r["running"], -r["pending"]))
+
+
+def heartbeat(worker_id, job_ids):
+    """Extend the leases of jobs this worker is still running."""
+    if not job_ids:
+        return
+    Job.query.filter(Job.id.in_(list(job_ids)), Job.lease_owner == worker_id, Job.status == "running").update(
+        {Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def run_worker(app, runner, pool_threads=None, worker_id=None, stop=None):
+    """Claim and run jobs until stop is set.
+
+    Each pool gets its own thread limit (pool_threads: {pool: n}, default POOLS); a job is
+    only claimed when its pool has a free slot, so excess work waits in the database.
+    runner(job_id, job_type, user_id, params) does the work and reports through update().
+    """
+    worker_id = worker_id or new_worker_id()
+    stop = stop or threading.Event()
+    sizes = {name: pool["threads"] for name, pool in POOLS.items()}
+    sizes.update(pool_threads or {})
+    slots = {name: threading.BoundedSemaphore(max(1, n)) for name, n in sizes.items()}
+    active = set()
+    active_lock = threading.Lock()
+
+    def _heartbeat_loop():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            with active_lock:
+                ids = set(active)
+            try:
+                with app.app_context():
+                    heartbeat(worker_id, ids)
+            except Exception:
+                pass
+
+    def _execute(pool_name, job_id, job_type, user_id, params):
+        try:
+            with app.app_context():
+                started = time.monotonic()
+                try:
+                    runner(job_id, job_type, user_id, params)
+                except Exception as e:
+                    db.session.rollback()
+                    update(job_id, status="error", message=str(e))
+                try:
+                    encode_seconds = time.monotonic() - started if pool_name == "cpu" else 0
+                    record_usage(user_id, encode_seconds=encode_seconds, jobs_run=1)
+                except Exception:
+                    db.session.rollback()
+        finally:
+            with active_lock:
+                active.discard(job_id)
+            slots[pool_name].release()
+
+    threading.Thread(target=_heartbeat_loop, daemon=True).start()
+    next_eviction = 0
+    while not stop.is_set():
+        if time.monotonic() >= next_eviction:
+            next_eviction = time.monotonic() + EVICT_EVERY
+            try:
+                with app.app_context():
+                    evict_finished()
+            except Exception:
+                pass
+        started = False
+        for pool_name, pool in POOLS.items():
+            if not slots[pool_name].acquire(blocking=False):
+                continue
+            job = None
+            try:
+                with app.app_context():
+                    claimed = claim(worker_id, pool["types"])
+                    if claimed:
+                        job = (claimed.id, claimed.job_type, claimed.user_id, json.loads(claimed.params or "{}"))
+            except Exception:
+                job = None
+            if not job:
+                slots[pool_name].release()
+                continue
+            with active_lock:
+                active.add(job[0])
+            threading.Thread(target=_execute, args=(pool_name,) + job, daemon=True).start()
+            started = True
+        if not started:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+
+
+def start_worker(app, runner, pool_threads=None):
+    """Run a job worker in a background thread of this process."""
+    stop = threading.Event()
+    threading.Thread(target=run_worker, args=(app, runner, pool_threads), kwargs={"stop": stop}, daemon=True).start()
+    return stop
@@ -0,0 +1,204 @@
+"""Library index: one LibraryEntry row per stories/<uid>/<account>/<date> folder.
+
+Listings (dashboard, /api/merged-folders, upload-all) read the index instead of walking
+every tenant's folders. Jobs that change a folder call refresh() / refresh_account() /
+remove() for just that folder, which also moves the user's StorageUsage counter by the
+size difference; reconcile() rebuilds the index and the counters from disk:
+    python -m webapp.library reconcile [--user ID]
+"""
+import argparse
+import json
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import func
+
+from webapp import database
+from webapp.models import db, LibraryEntry, StorageUsage, User
+from webapp.youtube_service import BASE_DIR, MERGED_DIR
+
+ARCHIVE_DIR = "uploaded_youtube"  # where upload_from_folder moves published videos
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DEFAULT_PAGE_SIZE = 100
+
+
+def folder_path(user_id, username, date_str=None):
+    path = BASE_DIR / "stories" / str(user_id) / username
+    return path / date_str if date_str else path
+
+
+def _files(path):
+    try:
+        return [e for e in os.scandir(path) if e.is_file()]
+    except OSError:
+        return []
+
+
+def scan_folder(path):
+    """Counts and sizes of one date folder, or None if it doesn't exist."""
+    if not path.is_dir():
+        return None
+    merged = path / MERGED_DIR
+    stories = _files(path)
+    pending = sorted((e for e in _files(merged) if e.name.startswith("merged_") and e.name.endswith(".mp4")),
+                     key=lambda e: e.name)
+    uploaded = [e for e in _files(merged / ARCHIVE_DIR) if e.name.endswith(".mp4")]
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    if uploaded and pending:
+        state = "partial"
+    elif uploaded:
+        state = "uploaded"
+    else:
+        state = "none"
+    return {
+        "story_count": len(stories),
+        "merged_count": len(pending),
+        "uploaded_count": len(uploaded),
+        "total_bytes": total,
+        "outputs": json.dumps([{"name": e.name, "size": e.stat().st_size} for e in pending]),
+        "upload_state": state,
+    }
+
+
+def _adjust_usage(user_id, delta):
+    """Add delta bytes to the user's storage counter (in the caller's transaction)."""
+    if not delta:
+        return
+    if db.session.get(StorageUsage, user_id) is None:
+        database.insert_missing(db, StorageUsage, user_id=user_id, bytes=0, updated_at=datetime.utcnow())
+    StorageUsage.query.filter_by(user_id=user_id).update(
+        {StorageUsage.bytes: StorageUsage.bytes + delta}, synchronize_session=False)
+
+
+def refresh(user_id, username, date_str, commit=True):
+    """Re-index one folder (removes its entry if the folder is gone)."""
+    if not user_id or not username or not date_str:
+        return None
+    fields = scan_folder(folder_path(user_id, username, date_str))
+    entry = LibraryEntry.query.filter_by(user_id=user_id, username=username, date_str=date_str).first()
+    _adjust_usage(user_id, (fields["total_bytes"] if fields else 0) - (entry.total_bytes if entry else 0))
+    if fields is None:
+        if entry:
+            db.session.delete(entry)
+        entry = None
+    else:
+        if entry is None:
+            entry = LibraryEntry(user_id=user_id, username=username, date_str=date_str)
+            db.session.add(entry)
+        for key, value in fields.items():
+            setattr(entry, key, value)
+    if commit:
+        db.session.commit()
+    return entry
+
+
+def folder_bytes(user_id, username, date_str):
+    """Indexed size of one folder (0 if it isn't indexed)."""
+    return db.session.query(LibraryEntry.total_bytes).filter_by(
+        user_id=user_id, username=username, date_str=date_str).scalar() or 0
+
+
+def refresh_account(user_id, username):
+    """Re-index every date folder of one account (after a download created new ones)."""
+    if not user_id or not username:
+        return
+    account_dir = folder_path(user_id, username)
+    on_disk = set()
+    if account_dir.is_dir():
+        on_disk = {e.name for e in os.scandir(account_dir) if e.is_dir() and DATE_RE.match(e.name)}
+    indexed = {e.date_str for e in LibraryEntry.query.filter_by(user_id=user_id, username=username)}
+    for date_str in on_disk | indexed:
+        refresh(user_id, username, date_str, commit=False)
+    db.session.commit()
+
+
+def remove(user_id, username, date_str):
+    entry = LibraryEntry.query.filter_by(user_id=user_id, username=username, date_str=date_str).first()
+    if entry:
+        _adjust_usage(user_id, -entry.total_bytes)
+        db.session.delete(entry)
+        db.session.commit()
+
+
+def list_merged(user_id, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """Folders of a user with merged videos still to upload, newest first. Returns (items, total)."""
+    query = LibraryEntry.query.filter(LibraryEntry.user_id == user_id, LibraryEntry.merged_count > 0)
+    total = query.count()
+    query = query.order_by(LibraryEntry.date_str.desc(), LibraryEntry.username)
+    if per_page:
+        query = query.offset((max(1, page) - 1) * per_page).limit(per_page)
+    return [e.to_dict() for e in query.all()], total
+
+
+def reconcile(user_id=None):
+    """Rebuild the index from disk for one user or all. Returns (folders indexed, entries removed)."""
+    stories = BASE_DIR / "stories"
+    # Folders left behind by deleted accounts are not indexed (nor counted).
+    users = {str(uid) for (uid,) in db.session.query(User.id)}
+    if user_id:
+        tenants = [str(user_id)] if str(user_id) in users else []
+    else:
+        tenants = [e.name for e in os.scandir(stories) if e.is_dir() and e.name in users] if stories.is_dir() else []
+    seen = set()
+    for tenant in tenants:
+        tenant_dir = stories / tenant
+        if not tenant_dir.is_dir():
+            continue
+        for account in os.scandir(tenant_dir):
+            if not account.is_dir() or account.name.startswith(".") or account.name == "tokens":
+                continue
+            for day in os.scandir(account.path):
+                if day.is_dir() and DATE_RE.match(day.name):
+                    refresh(int(tenant), account.name, day.name, commit=False)
+                    seen.add((int(tenant), account.name, day.name))
+    db.session.commit()
+    query = LibraryEntry.query
+    if user_id:
+        query = query.filter_by(user_id=int(user_id))
+    removed = 0
+    for entry in query.all():
+        if (entry.user_id, entry.username, entry.date_str) not in seen:
+            db.session.delete(entry)
+            removed += 1
+    db.session.commit()
+    recount_usage(user_id)
+    return len(seen), removed
+
+
+def recount_usage(user_id=None):
+    """Set StorageUsage from the index totals (after reconcile)."""
+    totals = db.session.query(LibraryEntry.user_id, func.coalesce(func.sum(LibraryEntry.total_bytes), 0))
+    if user_id:
+        totals = totals.filter(LibraryEntry.user_id == int(user_id))
+    totals = dict(totals.group_by(LibraryEntry.user_id).all())
+    usage = StorageUsage.query
+    if user_id:
+        usage = usage.filter_by(user_id=int(user_id))
+    for row in usage.all():
+        row.bytes = int(totals.pop(row.user_id, 0))
+    for uid, total in totals.items():
+        db.session.add(StorageUsage(user_id=uid, bytes=int(total)))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SnapScrap library index")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--user", type=int, help="only this user ID")
+    args = parser.parse_args()
+
+    from webapp.app import app
+    with app.app_context():
+        indexed, removed = reconcile(args.user)
+    print(f"Indexed {indexed} folder(s), removed {removed} stale entr{'y' if removed == 1 else 'ies'}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 
@@ -9,7 +9,7 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(150), nullable=False)
     subscription_tier = db.Column(db.String(50), default="free") # free, pro, premium
-    stripe_customer_id = db.Column(db.String(150), nullable=True)
+    stripe_customer_id = db.Column(db.String(150), nullable=True, index=True)  # Stripe webhook lookups
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
     
@@ -18,7 +18,147 @@ class User(UserMixin, db.Model):
 
 class ConnectedChannel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     channel_id = db.Column(db.String(100), nullable=False)
     title = db.Column(db.String(250), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TrackedAccount(db.Model):
+    """Snapchat account a user follows; checked ones are included in batch/scheduled runs."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'username', name='uq_tracked_account_user_username'),
+        db.Index('ix_tracked_account_user_checked', 'user_id', 'checked'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    checked = db.Column(db.Boolean, nullable=False, default=True)
+    avatar = db.Column(db.String(1000), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {"username": self.username, "checked": bool(self.checked), "avatar": self.avatar}
+
+class ProfileCache(db.Model):
+    """Public Snapchat profile metadata shared by all tenants; refetched after a TTL."""
+    username = db.Column(db.String(100), primary_key=True)
+    avatar = db.Column(db.String(1000), nullable=True)  # None = profile not found / fetch failed
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class Schedule(db.Model):
+    """Daily automation time of a user. next_run_at is UTC; hour/minute are server local time."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    enabled = db.Column(db.Boolean, nullable=False, default=False)
+    hour = db.Column(db.Integer, nullable=False, default=9)
+    minute = db.Column(db.Integer, nullable=False, default=0)
+    merge = db.Column(db.Boolean, nullable=False, default=False)
+    next_run_at = db.Column(db.DateTime, nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {"enabled": bool(self.enabled), "hour": self.hour, "minute": self.minute, "merge": bool(self.merge)}
+
+    def next_run_after(self, after=None):
+        """Next hour:minute (local time) strictly after `after` (UTC, default now), as naive UTC."""
+        local_after = (after or datetime.utcnow()).replace(tzinfo=timezone.utc).astimezone()
+        candidate = local_after.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate <= local_after:
+            candidate += timedelta(days=1)
+        return candidate.astimezone(timezone.utc).replace(tzinfo=None)
+
+class Job(db.Model):
+    """Background task (download / merge / upload) in the durable job queue."""
+    id = db.Column(db.String(100), primary_key=True)  # task id polled by the browser
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default="{}")  # JSON kwargs for the task
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)  # pending, running, done, error
+    message = db.Column(db.Text, default="")
+    result = db.Column(db.Text, nullable=True)  # JSON
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    lease_owner = db.Column(db.String(150), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=True)  # not claimed before this time (scheduler jitter)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Counter(db.Model):
+    """Named all-time total shared by every process (e.g. jobs evicted from the queue)."""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LibraryEntry(db.Model):
+    """Index of one stories/<uid>/<account>/<date> folder, kept current by the jobs that change it."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'username', 'date_str', name='uq_library_entry_folder'),
+        db.Index('ix_library_entry_user_merged', 'user_id', 'merged_count'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    date_str = db.Column(db.String(20), nullable=False)
+    story_count = db.Column(db.Integer, nullable=False, default=0)  # downloaded story files
+    merged_count = db.Column(db.Integer, nullable=False, default=0)  # merged videos not uploaded yet
+    uploaded_count = db.Column(db.Integer, nullable=False, default=0)  # merged videos moved to uploaded_youtube/
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    outputs = db.Column(db.Text, nullable=False, default="[]")  # JSON [{name, size}] of pending merged videos
+    upload_state = db.Column(db.String(20), nullable=False, default="none")  # none, partial, uploaded
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {"username": self.username, "date": self.date_str, "merged": self.merged_count,
+                "uploaded": self.uploaded_count, "bytes": self.total_bytes, "upload_state": self.upload_state}
+
+class StorageUsage(db.Model):
+    """Bytes a user has under stories/<uid>/, kept in step with LibraryEntry.total_bytes."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UserStats(db.Model):
+    """Running per-user totals for the admin page, updated where the counted thing happens."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    accounts = db.Column(db.Integer, nullable=False, default=0)  # tracked Snapchat accounts
+    jobs_run = db.Column(db.Integer, nullable=False, default=0)  # background jobs executed, all time
+    uploads = db.Column(db.Integer, nullable=False, default=0)  # videos published to YouTube, all time
+    last_job_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TenantUsage(db.Model):
+    """Per-user resource use for one UTC day, checked against the tier's daily budget."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_tenant_usage_user_day'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    encode_seconds = db.Column(db.Float, nullable=False, default=0)
+    bytes_transferred = db.Column(db.BigInteger, nullable=False, default=0)
+    jobs_run = db.Column(db.Integer, nullable=False, default=0)
+
+class AutomationRun(db.Model):
+    """One daily_automation.py run; unfinished runs are resumed from their checkpoints."""
+    id = db.Column(db.String(100), primary_key=True)
+    date_str = db.Column(db.String(20), nullable=False)  # stories date folder the run works on
+    status = db.Column(db.String(20), nullable=False, default="running", index=True)  # running, done
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)  # a stale heartbeat means the process died
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class RunCheckpoint(db.Model):
+    """Progress of one stage (download / merge / upload) of one account within a run."""
+    __table_args__ = (
+        db.UniqueConstraint('run_id', 'user_id', 'username', 'stage', name='uq_run_checkpoint'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(100), db.ForeignKey('automation_run.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    stage = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, running, done, failed, skipped
+    detail = db.Column(db.Text, nullable=True)
+    seconds = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,122 @@
+"""Snapchat profile metadata (avatar) for tracked accounts.
+
+Fetched profiles go into the shared ProfileCache table, so an account that any tenant
+already tracks is not fetched again until the TTL expires. Bulk adds store the accounts
+at once and fill in avatars from an "enrich" job that fetches the misses in parallel.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import requests
+from bs4 import BeautifulSoup
+from sqlalchemy.exc import IntegrityError
+
+from webapp.models import db, ProfileCache, TrackedAccount
+
+PROFILE_TTL = int(os.environ.get("SNAPSCRAP_PROFILE_TTL", str(7 * 24 * 3600)))
+# Failed lookups (private/missing account, Snapchat down) are retried sooner
+PROFILE_MISS_TTL = int(os.environ.get("SNAPSCRAP_PROFILE_MISS_TTL", "3600"))
+FETCH_WORKERS = int(os.environ.get("SNAPSCRAP_PROFILE_WORKERS", "8"))
+FETCH_TIMEOUT = 5
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+def fetch_snapchat_info(username):
+    """Fetch public profile info (Bitmoji, Bio) from Snapchat."""
+    url = f"https://story.snapchat.com/@{username}"
+    try:
+        r = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=FETCH_TIMEOUT)
+        if not r.ok:
+            return {}
+        soup = BeautifulSoup(r.content, "html.parser")
+        next_data = soup.find(id="__NEXT_DATA__")
+        if not next_data:
+            return {}
+        data = json.loads(next_data.string)
+        props = data.get("props", {}).get("pageProps", {})
+        user_profile = props.get("userProfile", {})
+        public_info = user_profile.get("publicProfileInfo", {})
+        user_info = user_profile.get("userInfo", {})
+
+        # Try finding snapcode/bitmoji in publicProfileInfo first, then userInfo
+        avatar = public_info.get("snapcodeImageUrl") or user_info.get("snapcodeImageUrl") or user_info.get("bitmoji3dAvatarId")
+        if not avatar:
+            # Fallback to older keys if structure changed
+            avatar = public_info.get("squareHeroImageUrl")
+        return {"avatar": avatar}
+    except Exception:
+        return {}
+
+
+def _fresh(entry, now):
+    ttl = PROFILE_TTL if entry.avatar else PROFILE_MISS_TTL
+    return entry.fetched_at >= now - timedelta(seconds=ttl)
+
+
+def cached(usernames):
+    """{username: {"avatar": ...}} for usernames with a fresh cache entry."""
+    if not usernames:
+        return {}
+    now = datetime.utcnow()
+    rows = ProfileCache.query.filter(ProfileCache.username.in_(list(usernames))).all()
+    return {e.username: {"avatar": e.avatar} for e in rows if _fresh(e, now)}
+
+
+def store(username, info):
+    """Save a fetched profile (commits)."""
+    values = {ProfileCache.avatar: info.get("avatar"), ProfileCache.fetched_at: datetime.utcnow()}
+    if ProfileCache.query.filter_by(username=username).update(values, synchronize_session=False):
+        db.session.commit()
+        return
+    db.session.add(ProfileCache(username=username, avatar=info.get("avatar"), fetched_at=datetime.utcnow()))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another tenant's job cached it at the same time
+        ProfileCache.query.filter_by(username=username).update(values, synchronize_session=False)
+        db.session.commit()
+
+
+def get_info(username):
+    """Profile info of one account, from the cache or fetched (and cached) now."""
+    info = cached([username]).get(username)
+    if info is None:
+        info = fetch_snapchat_info(username)
+        store(username, info)
+    return info
+
+
+def _apply(user_id, infos):
+    """Set avatars of the user's accounts that don't have one yet."""
+    for username, info in infos.items():
+        if info.get("avatar"):
+            TrackedAccount.query.filter_by(user_id=user_id, username=username, avatar=None).update(
+                {TrackedAccount.avatar: info["avatar"]}, synchronize_session=False)
+
+
+def enrich(user_id, usernames, progress=None):
+    """Fill in avatars for a user's accounts: cache hits first, then parallel fetches.
+
+    progress(done, total) is called as fetches complete. Returns the number fetched."""
+    infos = cached(usernames)
+    _apply(user_id, infos)
+    db.session.commit()
+    to_fetch = [u for u in usernames if u not in infos]
+    if not to_fetch:
+        return 0
+    done = 0
+    # Threads only do HTTP; all database writes stay on this thread
+    with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(to_fetch)))) as pool:
+        futures = {pool.submit(fetch_snapchat_info, u): u for u in to_fetch}
+        for future in as_completed(futures):
+            username = futures[future]
+            info = future.result()
+            store(username, info)
+            _apply(user_id, {username: info})
+            db.session.commit()
+            done += 1
+            if progress:
+                progress(done, len(to_fetch))
+    return done
@@ -0,0 +1,101 @@
+"""Daily automation scheduler for all tenants.
+
+Schedules are kept in a min-heap ordered by next_run_at and the thread sleeps until
+the earliest one is due. A run is claimed by moving the schedule's next_run_at forward
+with a conditional UPDATE, so several web workers (or a restart) never fire the same
+run twice, and a run missed while the app was down fires once at startup. The batch
+job is queued with a random delay so tenants sharing a time don't all start together.
+"""
+import heapq
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from webapp import jobs
+from webapp.models import db, Schedule, TrackedAccount
+
+RELOAD_SECONDS = 60  # re-read schedules from the database at least this often
+RETRY_SECONDS = 60  # when the queue is full
+JITTER_SECONDS = int(os.environ.get("SNAPSCRAP_SCHEDULE_JITTER", "300"))
+
+_changed = threading.Event()  # set by notify_changed() when a schedule is saved in this process
+
+
+def notify_changed():
+    _changed.set()
+
+
+def load_heap():
+    """[(next_run_at, schedule_id)] of all enabled schedules."""
+    rows = db.session.query(Schedule.next_run_at, Schedule.id).filter(
+        Schedule.enabled.is_(True), Schedule.next_run_at.isnot(None)).all()
+    heap = [(run_at, schedule_id) for run_at, schedule_id in rows]
+    heapq.heapify(heap)
+    return heap
+
+
+def claim_run(schedule, now=None):
+    """Advance next_run_at past now if nobody else did. Returns True if this caller owns the run."""
+    now = now or datetime.utcnow()
+    claimed = Schedule.query.filter(Schedule.id == schedule.id, Schedule.next_run_at == schedule.next_run_at).update(
+        {Schedule.next_run_at: schedule.next_run_after(now)}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def fire(schedule_id, now=None):
+    """Claim a due schedule's run and queue its batch download. Returns when to look at it again (or None)."""
+    now = now or datetime.utcnow()
+    schedule = db.session.get(Schedule, schedule_id)
+    if not schedule or not schedule.enabled or not schedule.next_run_at or schedule.next_run_at > now:
+        return schedule.next_run_at if schedule and schedule.enabled else None
+    run_at = schedule.next_run_at
+    claimed = claim_run(schedule, now)
+    db.session.refresh(schedule)
+    if not claimed:
+        return schedule.next_run_at  # another process fired this run
+    accounts = [a.username for a in TrackedAccount.query.filter_by(user_id=schedule.user_id, checked=True)
+                .order_by(TrackedAccount.id)]
+    if accounts:
+        # The id is derived from the run time, so the run is queued once even if it is retried
+        task_id = f"sched_{schedule.user_id}_{run_at.strftime('%Y%m%d_%H%M')}"
+        run_after = now + timedelta(seconds=random.uniform(0, JITTER_SECONDS))
+        try:
+            jobs.enqueue(task_id, "download_batch", user_id=schedule.user_id, run_after=run_after,
+                         usernames=accounts, merge=bool(schedule.merge))
+        except jobs.QueueFull:
+            # hand the run back (unless the schedule was edited meanwhile) and try again shortly
+            Schedule.query.filter(Schedule.id == schedule.id, Schedule.next_run_at == schedule.next_run_at).update(
+                {Schedule.next_run_at: run_at}, synchronize_session=False)
+            db.session.commit()
+            return now + timedelta(seconds=RETRY_SECONDS)
+    return schedule.next_run_at
+
+
+def scheduler_loop(app):
+    """Sleep until the earliest schedule is due, fire it, repeat."""
+    heap = []
+    reload_at = datetime.min
+    while True:
+        try:
+            with app.app_context():
+                now = datetime.utcnow()
+                if now >= reload_at or _changed.is_set():
+                    _changed.clear()
+                    heap = load_heap()
+                    reload_at = now + timedelta(seconds=RELOAD_SECONDS)
+                while heap and heap[0][0] <= now:
+                    _, schedule_id = heapq.heappop(heap)
+                    next_at = fire(schedule_id, now)
+                    if next_at:
+                        heapq.heappush(heap, (next_at, schedule_id))
+                wake_at = min([reload_at] + ([heap[0][0]] if heap else []))
+                db.session.remove()
+        except Exception:
+            wake_at = datetime.utcnow() + timedelta(seconds=RETRY_SECONDS)
+        _changed.wait(max(0.0, (wake_at - datetime.utcnow()).total_seconds()))
+
+
+def start_scheduler(app):
+    threading.Thread(target=scheduler_loop, args=(app,), daemon=True).start()
@@ -17,13 +17,57 @@ document.addEventListener('DOMContentLoaded', () => {
   let statusTimeout = null;
 
   // === Status ===
-  async function pollTask(taskId, onDone) {
+  // Task progress arrives over one Server-Sent Events stream; polling is only the fallback.
+  const watchedTasks = {};
+  let taskStream = null;
+  let taskStreamFailed = !window.EventSource;
+
+  function pollTask(taskId, onDone) {
+    if (taskStreamFailed) return pollTaskStatus(taskId, onDone);
+    watchedTasks[taskId] = { onDone };
+    openTaskStream();
+  }
+
+  function openTaskStream() {
+    if (taskStream) taskStream.close();
+    taskStream = null;
+    const ids = Object.keys(watchedTasks);
+    if (!ids.length) return;
+    const stream = new EventSource(`/api/tasks/stream?ids=${encodeURIComponent(ids.join(','))}`);
+    taskStream = stream;
+    stream.addEventListener('task', (e) => {
+      const data = JSON.parse(e.data);
+      const watcher = watchedTasks[data.id];
+      if (!watcher) return;
+      const type = data.status === 'done' ? 'done' : data.status === 'error' ? 'error' : 'running';
+      showStatus(type, data.message || '');
+      if (data.status === 'pending' || data.status === 'running') return;
+      delete watchedTasks[data.id];
+      if (data.status === 'done' && watcher.onDone) watcher.onDone();
+    });
+    stream.addEventListener('end', () => {
+      stream.close();
+      if (taskStream === stream) taskStream = null;
+    });
+    stream.onerror = () => {
+      // CONNECTING: the browser reconnects by itself (e.g. after the server's max stream age)
+      if (stream.readyState !== EventSource.CLOSED || taskStream !== stream) return;
+      taskStream = null;
+      taskStreamFailed = true;
+      Object.entries(watchedTasks).forEach(([taskId, watcher]) => {
+        delete watchedTasks[taskId];
+        pollTaskStatus(taskId, watcher.onDone);
+      });
+    };
+  }
+
+  async function pollTaskStatus(taskId, onDone) {
     const res = await fetch(`/api/task/${taskId}`);
     const data = await res.json();
     const type = data.status === 'done' ? 'done' : data.status === 'error' ? 'error' : 'running';
     showStatus(type, data.message || '');
     if (data.status === 'pending' || data.status === 'running') {
-      setTimeout(() => pollTask(taskId, onDone), 1000);
+      setTimeout(() => pollTaskStatus(taskId, onDone), 1000);
     } else if (data.status === 'done' && onDone) {
       onDone();
     }
@@ -67,6 +111,15 @@ document.addEventListener('DOMContentLoaded', () => {
     showStatus('done', `${window._T('js_status_added')} ${username}`);
   }
 
+  // Bulk adds return at once; avatars arrive from a background job
+  function watchEnrichment(taskId) {
+    if (!taskId) return;
+    pollTask(taskId, async () => {
+      const res = await fetch('/api/accounts');
+      if (res.ok) renderAccounts(await res.json());
+    });
+  }
+
   async function removeAccount(username) {
     const res = await fetch('/api/accounts', {
       method: 'POST',
@@ -221,6 +274,7 @@ document.addEventListener('DOMContentLoaded', () => {
       const msg = data.added > 0 ? window._T('js_status_added_plural').replace('{0}', data.added) : window._T('js_status_all_exist');
       showStatus('done', msg);
       document.querySelectorAll('.suggested-check:checked').forEach(cb => { cb.checked = false; });
+      watchEnrichment(data.task_id);
     } else {
       showStatus('error', data.error || 'خطأ');
     }
@@ -277,6 +331,7 @@ document.addEventListener('DOMContentLoaded', () => {
           const msg = data.added > 0 ? window._T('js_status_added_plural').replace('{0}', data.added) : '';
           const skip = data.skipped?.length ? ` (x${data.skipped.length})` : '';
           showStatus('done', msg + skip || 'تم');
+          watchEnrichment(data.task_id);
         }
       }
     } catch (err) {
@@ -617,6 +672,61 @@ document.addEventListener('DOMContentLoaded', () => {
   });
 
   // === Upload file ===
+  // Sent in chunks to /api/uploads so a dropped connection resumes instead of starting over.
+  const UPLOAD_RETRIES = 5;
+
+  async function sha256Hex(blob) {
+    if (!window.crypto?.subtle) return null; // only on https / localhost
+    const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return [...new Uint8Array(digest)].map(b => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  async function startOrResumeUpload(file, meta) {
+    const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    const saved = localStorage.getItem(key);
+    if (saved) {
+      const res = await fetch(`/api/uploads/${saved}`);
+      if (res.ok) {
+        const data = await res.json();
+        if (!data.task_id) return { key, uploadId: saved, offset: data.offset, chunkSize: 8 * 1024 * 1024 };
+      }
+      localStorage.removeItem(key);
+    }
+    const res = await fetch('/api/uploads', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size, ...meta }),
+    });
+    const data = await res.json();
+    if (!data.ok) throw new Error(data.error);
+    localStorage.setItem(key, data.upload_id);
+    return { key, uploadId: data.upload_id, offset: data.offset, chunkSize: data.chunk_size };
+  }
+
+  async function uploadChunks(file, upload) {
+    let { offset } = upload;
+    let failures = 0;
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + upload.chunkSize);
+      const headers = { 'Content-Type': 'application/octet-stream' };
+      const digest = await sha256Hex(chunk);
+      if (digest) headers['X-Chunk-SHA256'] = digest;
+      try {
+        const res = await fetch(`/api/uploads/${upload.uploadId}?offset=${offset}`, { method: 'PUT', headers, body: chunk });
+        const data = await res.json();
+        if (typeof data.offset === 'number') offset = data.offset; // also tells where to resume after a mismatch
+        if (!data.ok && res.status !== 409) throw new Error(data.error);
+        failures = 0;
+      } catch (err) {
+        if (++failures > UPLOAD_RETRIES) throw err;
+        await new Promise(r => setTimeout(r, 1000 * 2 ** failures));
+        const res = await fetch(`/api/uploads/${upload.uploadId}`).catch(() => null);
+        if (res?.ok) offset = (await res.json()).offset;
+      }
+      showStatus('running', `جاري رفع الملف إلى الخادم... ${Math.floor(100 * offset / file.size)}%`);
+    }
+  }
+
   document.getElementById('uploadFileForm')?.addEventListener('submit', async (e) => {
     e.preventDefault();
     const file = videoFile.files[0];
@@ -624,14 +734,22 @@ document.addEventListener('DOMContentLoaded', () => {
       showStatus('error', 'اختر ملف فيديو');
       return;
     }
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('title', document.getElementById('uploadTitle').value.trim() || file.name.replace(/\.[^.]+$/, ''));
-    formData.append('privacy', document.getElementById('uploadFilePrivacy').value);
-    const channelId = document.getElementById('uploadFileChannel')?.value;
-    if (channelId) formData.append('channel_id', channelId);
-    const res = await fetch('/api/upload-file', { method: 'POST', body: formData });
-    const data = await res.json();
+    const meta = {
+      title: document.getElementById('uploadTitle').value.trim() || file.name.replace(/\.[^.]+$/, ''),
+      privacy: document.getElementById('uploadFilePrivacy').value,
+      channel_id: document.getElementById('uploadFileChannel')?.value || null,
+    };
+    let data;
+    try {
+      const upload = await startOrResumeUpload(file, meta);
+      await uploadChunks(file, upload);
+      const res = await fetch(`/api/uploads/${upload.uploadId}/finalize`, { method: 'POST' });
+      data = await res.json();
+      if (data.ok) localStorage.removeItem(upload.key);
+    } catch (err) {
+      showStatus('error', err.message || window._T('js_err_unexpected'));
+      return;
+    }
     if (!data.ok) {
       showStatus('error', data.error);
       return;
@@ -677,6 +795,19 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   });
 
+  // === Export folder as ZIP (streamed by the server, the browser shows its own download progress) ===
+  document.getElementById('exportZipBtn')?.addEventListener('click', () => {
+    const sel = document.getElementById('clearFolder');
+    const opt = sel?.options[sel.selectedIndex];
+    const username = opt?.value;
+    const date = opt?.dataset?.date;
+    if (!username || !date) {
+      showStatus('error', 'اختر مجلداً للتحميل');
+      return;
+    }
+    window.location.href = '/api/export.zip?f=' + encodeURIComponent(`${username}/${date}`);
+  });
+
   // === Clear batch ===
   document.getElementById('clearBatchBtn')?.addEventListener('click', async () => {
     const sel = document.getElementById('clearFolder');
@@ -0,0 +1,100 @@
+"""Upload ledger - remembers which merged videos were already published to YouTube.
+
+Entries are keyed by the SHA-256 of the file content plus the target channel, so a
+video is never uploaded twice to the same channel even if it was renamed, moved or
+left behind by a partially failed batch. Web processes, worker.py and the status
+poller all write the same file, so every load / modify / save runs under its file lock.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from webapp.file_lock import locked
+from webapp.youtube_service import get_user_dir
+
+LEDGER_FILE = "upload_ledger.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_ledger_file(user_id=None):
+    return get_user_dir(user_id) / LEDGER_FILE
+
+
+def load_ledger(user_id=None):
+    """Load ledger data: {"uploads": {key: entry}}."""
+    ledger_file = get_ledger_file(user_id)
+    if ledger_file.exists():
+        try:
+            with open(ledger_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+    return {}
+
+
+def save_ledger(data, user_id=None):
+    """Save ledger atomically (temp file + rename) so a crash never truncates it."""
+    ledger_file = get_ledger_file(user_id)
+    tmp_file = ledger_file.with_name(ledger_file.name + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, ledger_file)
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in 1MB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_upload_key(content_hash, channel_id):
+    """Generate unique key for a (content, channel) pair."""
+    return f"{content_hash}|{channel_id or 'default'}"
+
+
+def get_upload(content_hash, channel_id, user_id=None):
+    """Return the ledger entry if this content was already published to the channel."""
+    ledger = load_ledger(user_id)
+    return ledger.get("uploads", {}).get(get_upload_key(content_hash, channel_id))
+
+
+def record_upload(content_hash, channel_id, video_id, path=None, title=None, user_id=None):
+    """Mark content as published to a channel with the returned YouTube video ID."""
+    entry = {
+        "video_id": video_id,
+        "channel_id": channel_id or "default",
+        "hash": content_hash,
+        "file": os.path.basename(str(path)) if path else None,
+        "title": title,
+        "uploaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with locked(get_ledger_file(user_id)):
+        ledger = load_ledger(user_id)
+        ledger.setdefault("uploads", {})[get_upload_key(content_hash, channel_id)] = entry
+        save_ledger(ledger, user_id)
+    return entry
+
+
+def list_uploads(user_id=None):
+    """All ledger entries for a user, newest first."""
+    uploads = list(load_ledger(user_id).get("uploads", {}).values())
+    return sorted(uploads, key=lambda e: e.get("uploaded_at") or "", reverse=True)
+
+
+def update_uploads(updates, user_id=None):
+    """Merge fields into existing entries: {key: {field: value}}."""
+    if not updates:
+        return
+    with locked(get_ledger_file(user_id)):
+        ledger = load_ledger(user_id)
+        uploads = ledger.setdefault("uploads", {})
+        for key, fields in updates.items():
+            if key in uploads:
+                uploads[key].update(fields)
+        save_ledger(ledger, user_id)
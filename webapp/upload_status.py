@@ -0,0 +1,145 @@
+"""Background poller for YouTube processing status of uploaded videos.
+
+Video IDs come from the upload ledger. Pending videos are checked with batched
+videos.list calls (up to 50 IDs, 1 quota unit per call) and each video backs off
+exponentially until YouTube reports a final state, after which it is no longer polled.
+Every web process runs the poller thread; each tick only the process that claims the
+shared stamp file polls, so YouTube is asked once per tick however many processes run.
+"""
+import threading
+import time
+
+from webapp.file_lock import claim_turn
+from webapp.upload_ledger import get_upload_key, list_uploads, update_uploads
+from webapp.youtube_service import BASE_DIR, get_tokens_dir, get_youtube_channels_config, _token_path
+
+VIDEOS_PER_LIST_CALL = 50
+POLL_TICK = 30  # seconds between poller wake-ups
+POLL_FIRST_INTERVAL = 30  # first check this long after an upload
+POLL_MAX_INTERVAL = 3600
+POLL_GIVE_UP = 2 * 24 * 3600  # stop polling videos still "processing" after 2 days
+STAMP_FILE = BASE_DIR / "stories" / "_shared" / ".upload_poller_last_run"
+
+FINAL_UPLOAD_STATUSES = ("processed", "failed", "rejected", "deleted")
+FINAL_PROCESSING_STATUSES = ("succeeded", "failed", "terminated")
+
+
+def _is_pending(entry):
+    return bool(entry.get("video_id")) and not entry.get("finished")
+
+
+def _channel_token(channel_id, user_id):
+    """Token for a ledger channel ("default" = the token uploads used without a channel)."""
+    tdir = get_tokens_dir(user_id)
+    candidates = []
+    if channel_id and channel_id != "default":
+        candidates.append(_token_path(channel_id, user_id))
+    candidates.append(tdir / "token.json")
+    channels = get_youtube_channels_config(user_id)
+    if channels:
+        candidates.append(_token_path(channels[0].get("id"), user_id))
+    for path in candidates:
+        if path.exists():
+            return path
+    return None
+
+
+def _list_video_status(youtube, video_ids):
+    """{video_id: item} for up to 50 IDs per videos.list call."""
+    found = {}
+    for i in range(0, len(video_ids), VIDEOS_PER_LIST_CALL):
+        batch = video_ids[i:i + VIDEOS_PER_LIST_CALL]
+        resp = youtube.videos().list(part="status,processingDetails", id=",".join(batch), maxResults=len(batch)).execute()
+        for item in resp.get("items", []):
+            found[item["id"]] = item
+    return found
+
+
+def _status_fields(entry, item, now):
+    """Ledger fields for one polled video, including its next check time."""
+    if item is None:
+        return {"upload_status": "deleted", "finished": True, "checked_at": now}
+    status = item.get("status", {})
+    processing = item.get("processingDetails", {})
+    fields = {
+        "upload_status": status.get("uploadStatus"),
+        "privacy_status": status.get("privacyStatus"),
+        "processing_status": processing.get("processingStatus"),
+        "failure_reason": status.get("failureReason") or status.get("rejectionReason"),
+        "checked_at": now,
+    }
+    uploaded_at = entry.get("poll_started") or now
+    if (fields["upload_status"] in FINAL_UPLOAD_STATUSES
+            or fields["processing_status"] in FINAL_PROCESSING_STATUSES
+            or now - uploaded_at > POLL_GIVE_UP):
+        fields["finished"] = True
+        return fields
+    interval = min(entry.get("poll_interval", POLL_FIRST_INTERVAL) * 2, POLL_MAX_INTERVAL)
+    fields.update({"poll_interval": interval, "next_check": now + interval})
+    return fields
+
+
+def poll_user(user_id, now=None):
+    """Check all due videos of one user. Returns number of videos checked."""
+    from webapp.youtube_service import get_youtube_service
+
+    now = now or time.time()
+    due = {}
+    updates = {}
+    for entry in list_uploads(user_id):
+        if not _is_pending(entry):
+            continue
+        key = get_upload_key(entry.get("hash"), entry.get("channel_id"))
+        if "next_check" not in entry:
+            # First sighting: schedule the first check instead of polling right after the upload
+            updates[key] = {"poll_started": now, "poll_interval": POLL_FIRST_INTERVAL, "next_check": now + POLL_FIRST_INTERVAL}
+            continue
+        if entry["next_check"] <= now:
+            due.setdefault(entry.get("channel_id") or "default", []).append(entry)
+
+    checked = 0
+    for channel_id, entries in due.items():
+        token_path = _channel_token(channel_id, user_id)
+        if not token_path:
+            continue
+        youtube, err = get_youtube_service(token_path_override=token_path)
+        if err:
+            continue
+        try:
+            found = _list_video_status(youtube, [e["video_id"] for e in entries])
+        except Exception:
+            continue
+        for entry in entries:
+            key = get_upload_key(entry.get("hash"), entry.get("channel_id"))
+            updates[key] = _status_fields(entry, found.get(entry["video_id"]), now)
+            checked += 1
+    update_uploads(updates, user_id)
+    return checked
+
+
+def _ledger_user_ids():
+    """User IDs with an upload ledger (stories/<uid>/upload_ledger.json)."""
+    from webapp.upload_ledger import LEDGER_FILE
+    return [p.parent.name for p in (BASE_DIR / "stories").glob(f"*/{LEDGER_FILE}")]
+
+
+def poller_loop(app):
+    """Background poller - check processing status of recent uploads."""
+    while True:
+        time.sleep(POLL_TICK)
+        try:
+            if not claim_turn(STAMP_FILE, POLL_TICK):
+                continue
+            user_ids = _ledger_user_ids()
+        except Exception:
+            app.logger.exception("Upload status poller failed")
+            continue
+        for user_id in user_ids:
+            try:
+                poll_user(user_id)
+            except Exception:
+                app.logger.exception("Upload status poll failed for user %s", user_id)
+
+
+def start_poller(app):
+    threading.Thread(target=poller_loop, args=(app,), daemon=True).start()
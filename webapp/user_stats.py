@@ -0,0 +1,152 @@
+"""Per-user counters and the paginated user list of the admin page.
+
+The counters in UserStats are moved by the code that changes what they count:
+    accounts   set_accounts() after every change to a user's tracked accounts
+    jobs_run   jobs.record_usage(jobs_run=1) when a worker finishes a job
+    uploads    jobs.record_usage(uploads=N) after videos were published
+Stored bytes come from StorageUsage (library.refresh). So the admin page is a few indexed
+queries however many users there are. recount() rebuilds the counters from the source
+tables and the upload ledgers:
+    python -m webapp.user_stats recount [--user ID]
+"""
+import argparse
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from webapp.models import db, StorageUsage, TenantUsage, TrackedAccount, User, UserStats
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+TIERS = ("free", "pro", "enterprise")
+
+
+def _ensure_row(user_id):
+    if db.session.get(UserStats, user_id) is None:
+        db.session.add(UserStats(user_id=user_id))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # created by another worker meanwhile
+
+
+def add(user_id, jobs_run=0, uploads=0):
+    """Add to a user's job and upload totals (in the caller's transaction)."""
+    if not user_id or not (jobs_run or uploads):
+        return
+    _ensure_row(user_id)
+    fields = {UserStats.jobs_run: UserStats.jobs_run + jobs_run, UserStats.uploads: UserStats.uploads + uploads}
+    if jobs_run:
+        fields[UserStats.last_job_at] = datetime.utcnow()
+    UserStats.query.filter_by(user_id=user_id).update(fields, synchronize_session=False)
+
+
+def set_accounts(user_id):
+    """Store the user's tracked account count (after the change was committed)."""
+    if not user_id:
+        return
+    _ensure_row(user_id)
+    count = TrackedAccount.query.filter_by(user_id=user_id).count()
+    UserStats.query.filter_by(user_id=user_id).update({UserStats.accounts: count}, synchronize_session=False)
+    db.session.commit()
+
+
+def _ledger_uploads(user_id):
+    from webapp.upload_ledger import list_uploads
+    return sum(1 for entry in list_uploads(user_id) if entry.get("video_id"))
+
+
+def recount(user_id=None):
+    """Rebuild UserStats from tracked accounts, daily usage rows and upload ledgers."""
+    users = db.session.query(User.id)
+    if user_id:
+        users = users.filter(User.id == int(user_id))
+    user_ids = [uid for (uid,) in users.all()]
+    accounts = dict(db.session.query(TrackedAccount.user_id, func.count(TrackedAccount.id))
+                    .filter(TrackedAccount.user_id.in_(user_ids)).group_by(TrackedAccount.user_id).all())
+    jobs_run = dict(db.session.query(TenantUsage.user_id, func.sum(TenantUsage.jobs_run))
+                    .filter(TenantUsage.user_id.in_(user_ids)).group_by(TenantUsage.user_id).all())
+    rows = {row.user_id: row for row in UserStats.query.filter(UserStats.user_id.in_(user_ids)).all()}
+    for uid in user_ids:
+        row = rows.get(uid)
+        if row is None:
+            row = UserStats(user_id=uid)
+            db.session.add(row)
+        row.accounts = int(accounts.get(uid, 0))
+        row.jobs_run = int(jobs_run.get(uid) or 0)
+        row.uploads = _ledger_uploads(uid)
+    db.session.commit()
+    return len(user_ids)
+
+
+SORT_COLUMNS = {
+    "id": User.id,
+    "username": User.username,
+    "tier": User.subscription_tier,
+    "created": User.created_at,
+    "accounts": func.coalesce(UserStats.accounts, 0),
+    "jobs": func.coalesce(UserStats.jobs_run, 0),
+    "uploads": func.coalesce(UserStats.uploads, 0),
+    "bytes": func.coalesce(StorageUsage.bytes, 0),
+}
+
+
+def page(page=1, per_page=DEFAULT_PAGE_SIZE, sort="id", direction="asc", search=None):
+    """One page of users with their counters: (rows, total)."""
+    per_page = max(1, min(int(per_page or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    page = max(1, int(page or 1))
+    column = SORT_COLUMNS.get(sort, User.id)
+    order = column.desc() if direction == "desc" else column.asc()
+    query = db.session.query(User, UserStats, StorageUsage.bytes) \
+        .outerjoin(UserStats, UserStats.user_id == User.id) \
+        .outerjoin(StorageUsage, StorageUsage.user_id == User.id)
+    if search:
+        query = query.filter(User.username.contains(search.strip(), autoescape=True))
+    total = query.order_by(None).count()
+    rows = []
+    for user, stats, stored in query.order_by(order, User.id).offset((page - 1) * per_page).limit(per_page).all():
+        rows.append({
+            "user": user,
+            "accounts": stats.accounts if stats else 0,
+            "jobs_run": stats.jobs_run if stats else 0,
+            "uploads": stats.uploads if stats else 0,
+            "last_job_at": stats.last_job_at if stats else None,
+            "bytes": stored or 0,
+        })
+    return rows, total
+
+
+def tier_summary():
+    """Per-tier user count and totals, one grouped query. Returns (rows, overall)."""
+    tier = func.coalesce(User.subscription_tier, "free")
+    result = db.session.query(
+        tier, func.count(User.id),
+        func.coalesce(func.sum(UserStats.accounts), 0),
+        func.coalesce(func.sum(UserStats.jobs_run), 0),
+        func.coalesce(func.sum(UserStats.uploads), 0),
+        func.coalesce(func.sum(StorageUsage.bytes), 0),
+    ).outerjoin(UserStats, UserStats.user_id == User.id) \
+        .outerjoin(StorageUsage, StorageUsage.user_id == User.id).group_by(tier).all()
+    rows = {name: {"tier": name, "users": 0, "accounts": 0, "jobs_run": 0, "uploads": 0, "bytes": 0} for name in TIERS}
+    for name, users, accounts, jobs_run, uploads, stored in result:
+        rows[name] = {"tier": name, "users": users, "accounts": int(accounts), "jobs_run": int(jobs_run),
+                      "uploads": int(uploads), "bytes": int(stored)}
+    overall = {key: sum(r[key] for r in rows.values()) for key in ("users", "accounts", "jobs_run", "uploads", "bytes")}
+    return list(rows.values()), overall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SnapScrap per-user counters")
+    parser.add_argument("command", choices=["recount"])
+    parser.add_argument("--user", type=int, help="only this user ID")
+    args = parser.parse_args()
+
+    from webapp.app import app
+    with app.app_context():
+        count = recount(args.user)
+    print(f"Recounted {count} user(s).")
+
+
+if __name__ == "__main__":
+    main()
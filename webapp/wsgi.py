@@ -0,0 +1,10 @@
+"""Web server entry point: the Flask app plus its background threads.
+
+    gunicorn webapp.wsgi:app
+    flask --app webapp.wsgi run
+
+Importing webapp.app alone (worker.py, daily_automation.py, CLIs) starts no threads.
+"""
+from webapp.app import app, start_background
+
+start_background(app)
@@ -1,7 +1,11 @@
 """YouTube upload service for SnapScrap web app - multi-channel support."""
 import json
 import os
+import random
 import re
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,8 +17,51 @@ SCOPES = [
 ]
 
 CONFIG_KEY = "youtube_channels"
+LEGACY_MIGRATED_KEY = "legacy_token_migrated"
+# Channel titles fetched by refresh_channels are reused for this many seconds
+CHANNEL_REFRESH_TTL = int(os.environ.get("SNAPSCRAP_CHANNEL_REFRESH_TTL", "300"))
+CHANNEL_REFRESH_WORKERS = 4
+CHANNELS_PER_LIST_CALL = 50
+
+_refresh_cache = {}  # str(user_id) -> (fetched_at, channels)
+_refresh_lock = threading.Lock()
+# Retries per chunk for 5xx / 429 errors during resumable uploads (exponential backoff)
+UPLOAD_NUM_RETRIES = int(os.environ.get("SNAPSCRAP_UPLOAD_RETRIES", "3"))
+
+
+def get_api_url():
+    """Base URL of a local YouTube API stand-in (webapp/fake_youtube.py), or "" for the real API."""
+    return os.environ.get("SNAPSCRAP_YOUTUBE_API_URL", "").rstrip("/")
+
+
+def _build_youtube(creds):
+    """Build the YouTube client, pointed at SNAPSCRAP_YOUTUBE_API_URL when set."""
+    from googleapiclient.discovery import build, build_from_document
+    api_url = get_api_url()
+    if api_url:
+        # Rewrite the discovery document root so API and media upload URLs both go to the stand-in
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = json.loads(get_static_doc("youtube", "v3"))
+        doc["rootUrl"] = doc["mtlsRootUrl"] = f"{api_url}/"
+        return build_from_document(doc, credentials=creds)
+    return build("youtube", "v3", credentials=creds)
+
+_local = threading.local()
+
+
+@contextmanager
+def user_context(user_id):
+    """Act for user_id in this thread (job workers and automation threads serve many users)."""
+    previous = getattr(_local, "user_id", None)
+    _local.user_id = str(user_id) if user_id else None
+    try:
+        yield
+    finally:
+        _local.user_id = previous
 
 def get_user_id():
+    if getattr(_local, "user_id", None) is not None:
+        return _local.user_id
     try:
         from flask_login import current_user
         if current_user and current_user.is_authenticated:
@@ -51,19 +98,17 @@ def get_webapp_config_file(user_id=None):
     return get_user_dir(user_id) / "webapp_config.json"
 
 def load_webapp_config(user_id=None):
-    cfg_file = get_webapp_config_file(user_id)
-    if cfg_file.exists():
-        try:
-            with open(cfg_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
+    from webapp.config_store import store
+    return store.read(get_webapp_config_file(user_id), {})
 
 def save_webapp_config(config, user_id=None):
-    cfg_file = get_webapp_config_file(user_id)
-    with open(cfg_file, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    from webapp.config_store import store
+    store.write(get_webapp_config_file(user_id), config)
+
+def modify_webapp_config(user_id=None):
+    """Locked read-modify-write of the user's webapp config."""
+    from webapp.config_store import store
+    return store.modify(get_webapp_config_file(user_id))
 
 def get_youtube_channels_config(user_id=None):
     """Get list of connected channels from config."""
@@ -71,35 +116,44 @@ def get_youtube_channels_config(user_id=None):
     return cfg.get(CONFIG_KEY, [])
 
 def save_youtube_channels(channels, user_id=None):
-    """Save connected channels to config."""
-    cfg = load_webapp_config(user_id)
-    cfg[CONFIG_KEY] = channels
-    save_webapp_config(cfg, user_id)
+    """Save connected channels to config (and forget refresh_channels' cached result)."""
+    with modify_webapp_config(user_id) as cfg:
+        cfg[CONFIG_KEY] = channels
+    with _refresh_lock:
+        _refresh_cache.pop(str(user_id if user_id is not None else get_user_id()), None)
 
 
-def _migrate_legacy_token():
-    """If token.json exists but no channels in config, migrate it."""
-    channels = get_youtube_channels_config()
-    default_token = get_tokens_dir() / "token.json"
-    if channels or not default_token.exists():
-        return
-    youtube, err = get_youtube_service(channel_id=None)
-    if err:
+def _migrate_legacy_token(user_id=None, force=False):
+    """If token.json exists but no channels in config, migrate it.
+
+    Runs once per user: the outcome is recorded in the config so that listing
+    channels never has to call the API again (force=True re-checks).
+    """
+    uid = user_id if user_id is not None else get_user_id()
+    cfg = load_webapp_config(uid)
+    if cfg.get(LEGACY_MIGRATED_KEY) and not force:
         return
-    try:
-        resp = youtube.channels().list(part="snippet", mine=True).execute()
-        items = resp.get("items", [])
-        if items:
-            c = items[0]
-            ch_id = c["id"]
-            title = c["snippet"].get("title", "YouTube")
-            token_path = _token_path(ch_id)
-            if token_path != default_token:
-                import shutil
-                shutil.copy(default_token, token_path)
-            save_youtube_channels([{"id": ch_id, "title": title}])
-    except Exception:
-        pass
+    default_token = get_tokens_dir(uid) / "token.json"
+    if not cfg.get(CONFIG_KEY) and default_token.exists():
+        youtube, err = get_youtube_service(token_path_override=default_token)
+        if err:
+            return
+        try:
+            resp = youtube.channels().list(part="snippet", mine=True).execute()
+            items = resp.get("items", [])
+            if items:
+                c = items[0]
+                ch_id = c["id"]
+                title = c["snippet"].get("title", "YouTube")
+                token_path = _token_path(ch_id, uid)
+                if token_path != default_token:
+                    import shutil
+                    shutil.copy(default_token, token_path)
+                save_youtube_channels([{"id": ch_id, "title": title}], uid)
+        except Exception:
+            pass
+    with modify_webapp_config(uid) as cfg:
+        cfg[LEGACY_MIGRATED_KEY] = True
 
 
 def _get_all_tokens_for_channel(channel_id, user_id=None):
@@ -134,6 +188,27 @@ def _get_token_for_secret(channel_id, user_id, secret_path):
         return tdir / f"token{suffix}.json"
     return tdir / f"token{suffix}_{_safe_channel_id(channel_id)}.json"
 
+def _execute_resumable(request):
+    """Drive a resumable upload chunk by chunk.
+
+    On 5xx/429 the next call to next_chunk() asks the server how many bytes it has and
+    resumes from there, instead of re-sending the whole file.
+    """
+    from googleapiclient.errors import HttpError
+    response = None
+    attempt = 0
+    while response is None:
+        try:
+            _, response = request.next_chunk()
+            attempt = 0
+        except HttpError as e:
+            if (e.resp.status < 500 and e.resp.status != 429) or attempt >= UPLOAD_NUM_RETRIES:
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, 2 ** attempt))
+    return response
+
+
 def get_youtube_service(channel_id=None, token_path_override=None, client_secret_path=None):
     """Get YouTube API service for a specific channel. Uses provided secret or defaults to client_secret.json"""
     try:
@@ -164,6 +239,12 @@ def get_youtube_service(channel_id=None, token_path_override=None, client_secret
     creds = None
     if token_path and token_path.exists():
         creds = Credentials.from_authorized_user_file(str(token_path), SCOPES)
+        api_url = get_api_url()
+        if api_url:
+            # Refresh against the stand-in as well, never against Google (the copy loses expiry)
+            expiry = creds.expiry
+            creds = creds.with_token_uri(f"{api_url}/token")
+            creds.expiry = expiry
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
@@ -176,7 +257,7 @@ def get_youtube_service(channel_id=None, token_path_override=None, client_secret
         with open(out_path, "w") as f:
             f.write(creds.to_json())
 
-    return build("youtube", "v3", credentials=creds), None
+    return _build_youtube(creds), None
 
 
 def get_authorization_url(redirect_uri):
@@ -215,8 +296,7 @@ def add_channel_from_code(code, redirect_uri):
         return False, str(e), None
 
     try:
-        from googleapiclient.discovery import build
-        youtube = build("youtube", "v3", credentials=creds)
+        youtube = _build_youtube(creds)
         resp = youtube.channels().list(part="snippet", mine=True).execute()
         items = resp.get("items", [])
         if not items:
@@ -239,33 +319,85 @@ def add_channel_from_code(code, redirect_uri):
 
 
 def list_connected_channels():
-    """List channels from config (our connected channels). Optionally refresh from API."""
-    _migrate_legacy_token()
-    channels = get_youtube_channels_config()
+    """List channels from config (our connected channels). Use refresh_channels() to re-fetch from API."""
+    user_id = get_user_id()
+    _migrate_legacy_token(user_id)
+    channels = get_youtube_channels_config(user_id)
     return {"ok": True, "channels": channels}
 
 
-def refresh_channels():
-    """Re-fetch channel info from YouTube API for all connected channels."""
-    _migrate_legacy_token()
-    channels = get_youtube_channels_config()
+def _channel_token(channel_id, user_id):
+    """Token file used for a channel: its own token, else the legacy token.json, else None."""
+    for path in (_token_path(channel_id, user_id), get_tokens_dir(user_id) / "token.json"):
+        if path.exists():
+            return path
+    return None
+
+
+def _fetch_channel_titles(token_path, channel_ids):
+    """Fetch {channel_id: title} for channels sharing one token, 50 IDs per channels.list call."""
+    youtube, err = get_youtube_service(token_path_override=token_path)
+    if err:
+        raise RuntimeError(err)
+    titles = {}
+    for i in range(0, len(channel_ids), CHANNELS_PER_LIST_CALL):
+        batch = channel_ids[i:i + CHANNELS_PER_LIST_CALL]
+        resp = youtube.channels().list(part="snippet", id=",".join(batch), maxResults=len(batch)).execute()
+        for item in resp.get("items", []):
+            titles[item["id"]] = item["snippet"].get("title", "YouTube")
+    return titles
+
+
+def refresh_channels(force=False):
+    """Re-fetch channel info from YouTube API for all connected channels.
+
+    Tokens are queried in parallel, one batched channels.list call per token, and
+    the result is cached for CHANNEL_REFRESH_TTL seconds unless force=True. The cache
+    is dropped when the channel list changes (here, or in another process).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    user_id = get_user_id()
+    with _refresh_lock:
+        cached = _refresh_cache.get(str(user_id))
+    if cached and not force and time.time() - cached[0] < CHANNEL_REFRESH_TTL:
+        connected = [ch.get("id") for ch in get_youtube_channels_config(user_id)]
+        if connected == [ch.get("id") for ch in cached[1]]:
+            return {"ok": True, "channels": cached[1], "cached": True}
+
+    _migrate_legacy_token(user_id, force=True)
+    channels = get_youtube_channels_config(user_id)
+    groups = {}
+    for ch in channels:
+        ch_id = ch.get("id")
+        token_path = _channel_token(ch_id, user_id) if ch_id else None
+        if token_path:
+            groups.setdefault(token_path, []).append(ch_id)
+
+    titles = {}
+    failed = set()
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(CHANNEL_REFRESH_WORKERS, len(groups))) as pool:
+            futures = {pool.submit(_fetch_channel_titles, path, ids): ids for path, ids in groups.items()}
+            for future, ids in futures.items():
+                try:
+                    titles.update(future.result())
+                except Exception:
+                    failed.update(ids)
+
     updated = []
     for ch in channels:
         ch_id = ch.get("id")
         if not ch_id:
             continue
-        youtube, err = get_youtube_service(channel_id=ch_id)
-        if err:
-            continue
-        try:
-            resp = youtube.channels().list(part="snippet", id=ch_id).execute()
-            items = resp.get("items", [])
-            if items:
-                title = items[0]["snippet"].get("title", ch.get("title", "YouTube"))
-                updated.append({"id": ch_id, "title": title})
-        except Exception:
+        if ch_id in titles:
+            updated.append({"id": ch_id, "title": titles[ch_id]})
+        elif ch_id in failed or not _channel_token(ch_id, user_id):
+            # Keep channels we could not check; only drop ones the API no longer returns
             updated.append(ch)
-    save_youtube_channels(updated)
+    save_youtube_channels(updated, user_id)
+    with _refresh_lock:
+        _refresh_cache[str(user_id)] = (time.time(), updated)
     return {"ok": True, "channels": updated}
 
 
@@ -292,7 +424,8 @@ def get_youtube_service_for_channel(channel_id):
 
 def upload_from_folder(username, date_str, privacy="private", upload_type="shorts", channel_id=None):
     """Upload merged videos. channel_id=None uses first available channel."""
-    merged_folder = BASE_DIR / "stories" / username / date_str / MERGED_DIR
+    user_id = get_user_id()
+    merged_folder = get_user_dir(user_id) / username / date_str / MERGED_DIR
     if not merged_folder.is_dir():
         return {"success": False, "error": f"Folder not found: {username}/{date_str}/merged/"}
 
@@ -305,11 +438,14 @@ def upload_from_folder(username, date_str, privacy="private", upload_type="short
         from googleapiclient.errors import HttpError
     except ImportError:
         return {"success": False, "error": "Missing google-api-python-client"}
+    from webapp.upload_ledger import file_hash, get_upload, record_upload
 
     display_name = username.replace("_", " ").title()
     date_fmt = date_str.replace("-", "-")
     title_template = load_title_template()
     uploaded = 0
+    skipped = 0
+    uploaded_bytes = 0
 
     shorts = sorted([p for p in merged_folder.glob("merged_*.mp4") if "merged_all" not in p.name])
     full_path = merged_folder / "merged_all.mp4"
@@ -324,12 +460,17 @@ def upload_from_folder(username, date_str, privacy="private", upload_type="short
     if not to_upload:
         return {"success": False, "error": f"No videos found to upload in {merged_folder} (check merge type: Shorts or Full)"}
 
-    user_id = get_user_id()
     client_secrets = _get_client_secrets()
     if not client_secrets:
         return {"success": False, "error": "No client_secret.json files found in project root."}
 
     for vid_type, path, title in to_upload:
+        # Already published to this channel (e.g. by an earlier, partially failed batch)
+        content_hash = file_hash(path)
+        if get_upload(content_hash, channel_id, user_id):
+            skipped += 1
+            continue
+
         uploaded_this = False
         secret_idx = 0
 
@@ -354,22 +495,24 @@ def upload_from_folder(username, date_str, privacy="private", upload_type="short
                     "status": {"privacyStatus": privacy},
                 }
                 media = MediaFileUpload(str(path), mimetype="video/mp4", resumable=True, chunksize=1024 * 1024)
-                youtube.videos().insert(part="snippet,status", body=body, media_body=media).execute()
+                response = _execute_resumable(youtube.videos().insert(part="snippet,status", body=body, media_body=media))
+                record_upload(content_hash, channel_id, response.get("id"), path=path, title=title, user_id=user_id)
                 uploaded += 1
+                uploaded_bytes += path.stat().st_size
                 uploaded_this = True
             except HttpError as e:
                 # 403 / Quota Exceeded Token Fallback (Army of APIs)
                 if e.resp.status in (403, 429) and "quota" in str(e).lower():
                     secret_idx += 1
                     continue
-                return {"success": uploaded > 0, "error": str(e), "count": uploaded}
+                return {"success": uploaded > 0, "error": str(e), "count": uploaded, "skipped": skipped, "bytes": uploaded_bytes}
             except Exception as e:
-                return {"success": uploaded > 0, "error": str(e), "count": uploaded}
+                return {"success": uploaded > 0, "error": str(e), "count": uploaded, "skipped": skipped, "bytes": uploaded_bytes}
 
         if not uploaded_this:
-            return {"success": uploaded > 0, "error": "All tokens exhausted (Quota limits reached)", "count": uploaded}
+            return {"success": uploaded > 0, "error": "All tokens exhausted (Quota limits reached)", "count": uploaded, "skipped": skipped, "bytes": uploaded_bytes}
 
-    if uploaded > 0 and uploaded == len(to_upload):
+    if uploaded + skipped == len(to_upload):
         try:
             import shutil
             archive_dir = merged_folder / "uploaded_youtube"
@@ -378,9 +521,9 @@ def upload_from_folder(username, date_str, privacy="private", upload_type="short
                 if path.exists():
                     shutil.move(str(path), str(archive_dir / path.name))
         except Exception as e:
-            return {"success": True, "count": uploaded, "error": f"Uploaded but failed to move files: {e}"}
+            return {"success": True, "count": uploaded, "skipped": skipped, "bytes": uploaded_bytes, "error": f"Uploaded but failed to move files: {e}"}
 
-    return {"success": True, "count": uploaded}
+    return {"success": True, "count": uploaded, "skipped": skipped, "bytes": uploaded_bytes}
 
 
 def upload_single_file(file_path, title, privacy="private", channel_id=None):
@@ -396,6 +539,12 @@ def upload_single_file(file_path, title, privacy="private", channel_id=None):
         from googleapiclient.http import MediaFileUpload
     except ImportError:
         return {"success": False, "error": "Missing google-api-python-client"}
+    from webapp.upload_ledger import file_hash, get_upload, record_upload
+
+    content_hash = file_hash(file_path)
+    existing = get_upload(content_hash, channel_id)
+    if existing and existing.get("video_id"):
+        return {"success": True, "url": f"https://www.youtube.com/watch?v={existing['video_id']}", "skipped": True}
 
     try:
         body = {
@@ -403,8 +552,9 @@ def upload_single_file(file_path, title, privacy="private", channel_id=None):
             "status": {"privacyStatus": privacy},
         }
         media = MediaFileUpload(file_path, mimetype="video/mp4", resumable=True, chunksize=1024 * 1024)
-        response = youtube.videos().insert(part="snippet,status", body=body, media_body=media).execute()
+        response = _execute_resumable(youtube.videos().insert(part="snippet,status", body=body, media_body=media))
         vid_id = response.get("id")
-        return {"success": True, "url": f"https://www.youtube.com/watch?v={vid_id}"}
+        record_upload(content_hash, channel_id, vid_id, path=file_path, title=title)
+        return {"success": True, "url": f"https://www.youtube.com/watch?v={vid_id}", "bytes": os.path.getsize(file_path)}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -0,0 +1,68 @@
+"""Stream library folders to the browser as a ZIP built on the fly.
+
+zipfile writes to an unseekable sink (sizes and CRCs go into data descriptors after
+each entry), and every few hundred KB written is handed to the response, so nothing
+touches the disk and memory stays at about one read buffer whatever the export size.
+Videos and images are stored as they are (they don't compress); text files are deflated.
+"""
+import io
+import os
+import zipfile
+
+READ_SIZE = 256 * 1024
+STORED_EXTENSIONS = (".mp4", ".mov", ".webm", ".jpeg", ".jpg", ".png", ".bin")
+
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer the generator empties after each write batch."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_files(folders):
+    """(path, arcname) for every file under each (base_dir, arc_prefix), in a stable order."""
+    for base, prefix in folders:
+        for root, dirs, names in os.walk(base):
+            dirs.sort()
+            rel = os.path.relpath(root, base)
+            for name in sorted(names):
+                if name.endswith(".tmp"):
+                    continue
+                arcname = "/".join(p for p in (prefix, "" if rel == "." else rel.replace(os.sep, "/"), name) if p)
+                yield os.path.join(root, name), arcname
+
+
+def stream_zip(files):
+    """Yield the bytes of a ZIP archive of (path, arcname) pairs."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for path, arcname in files:
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                size = info.file_size
+                src = open(path, "rb")
+            except OSError:
+                continue  # deleted while exporting
+            stored = path.lower().endswith(STORED_EXTENSIONS)
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with src, zf.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dest:
+                for block in iter(lambda: src.read(READ_SIZE), b""):
+                    dest.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
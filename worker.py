@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+عامل المهام: ينفّذ مهام التحميل والدمج والرفع من قائمة المهام في قاعدة البيانات.
+Job worker: runs queued download / merge / upload jobs from the database.
+
+Run as many as needed next to the web server (started with SNAPSCRAP_INLINE_WORKER=0):
+    python worker.py [--network-threads N] [--cpu-threads N]
+"""
+import argparse
+import os
+import sys
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, script_dir)
+
+    from webapp import jobs
+
+    parser = argparse.ArgumentParser(description="SnapScrap job worker")
+    parser.add_argument("--network-threads", type=int, default=jobs.POOLS["network"]["threads"], help="parallel download/upload jobs")
+    parser.add_argument("--cpu-threads", type=int, default=jobs.POOLS["cpu"]["threads"], help="parallel merge (ffmpeg) jobs")
+    args = parser.parse_args()
+
+    from webapp.app import app, run_job
+
+    worker_id = jobs.new_worker_id()
+    pool_threads = {"network": args.network_threads, "cpu": args.cpu_threads}
+    print(f"Worker {worker_id} started (network: {args.network_threads}, cpu: {args.cpu_threads})")
+    try:
+        jobs.run_worker(app, run_job, pool_threads=pool_threads, worker_id=worker_id)
+    except KeyboardInterrupt:
+        print("Worker stopped. Running jobs will be resumed by another worker after their lease expires.")
+
+
+if __name__ == "__main__":
+    main()